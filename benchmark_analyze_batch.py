@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+/analyze_batch（一括）と/analyzeの逐次呼び出しのスループット比較ベンチマーク
+
+同じリクエストを/analyzeで1件ずつ送った場合と/analyze_batchでまとめて送った場合の
+処理時間・スループット（件/秒、vCPUあたり）と、レスポンスが一致するかを表示する。
+レスポンス全体に加えて、類似度計算（入力ESのエンコード + 全ESとのスコアリング）のみの比較も表示する
+
+使い方:
+    python benchmark_analyze_batch.py
+    python benchmark_analyze_batch.py --csv data/unified_es_data_20251109.csv --requests 50
+
+オプション:
+    --csv: ESデータのCSV
+    --requests: 1バッチのリクエスト数（デフォルト: 32）
+    --repeat: 計測の繰り返し回数（デフォルト: 3、最速の結果を表示）
+"""
+import sys
+import os
+import time
+import json
+import argparse
+import contextlib
+import io
+sys.path.insert(0, 'src')
+
+os.environ.setdefault('OPENAI_API_KEY', 'dummy-key-for-testing')
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+import app
+from app import (
+    load_csv_data,
+    DocumentProfile,
+    QueryVectors,
+    calculate_similarity,
+    calculate_similarity_batch,
+)
+
+
+def make_requests(n, seed=0):
+    """コーパスのESを入力に使ったリクエストを生成（志望業界・志望企業・内定のみの指定を混ぜる）"""
+    rng = np.random.default_rng(seed)
+    es_data = app.es_data
+    industries = es_data['industry'].dropna().unique().tolist()
+    companies = es_data['company_name'].dropna().unique().tolist()
+    requests = []
+    for i, position in enumerate(rng.choice(len(es_data), size=n, replace=len(es_data) < n)):
+        text = es_data['combined_answer'].iloc[position]
+        requests.append({
+            'esAnswers': [text if len(text) >= 100 else (text + ' ') * (100 // len(text) + 1)],
+            'targetIndustry': str(rng.choice(industries)),
+            'university': str(es_data['university'].iloc[position]),
+            'targetCompanies': [str(rng.choice(companies))] if i % 3 == 0 else [],
+            'onlyAccepted': i % 8 == 0,
+        })
+    return requests
+
+
+def measure(func, repeat):
+    """repeat回実行した中で最速の処理時間（秒）と結果"""
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='/analyze_batchのスループット比較ベンチマーク')
+    parser.add_argument('--csv', default='data/unified_es_data_20251109.csv', help='ESデータのCSV')
+    parser.add_argument('--requests', type=int, default=32, help='1バッチのリクエスト数')
+    parser.add_argument('--repeat', type=int, default=3, help='計測の繰り返し回数')
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("/analyze_batch のスループット比較ベンチマーク")
+    print("=" * 80)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        load_csv_data(args.csv)
+    client = TestClient(app.app)
+    requests = make_requests(args.requests)
+    vcpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    print(f"\n📂 CSV: {args.csv}（{len(app.es_data)}件）")
+    print(f"  - リクエスト数: {len(requests)}, vCPU: {vcpus}")
+
+    # 類似度計算のみ（絞り込みのないリクエスト）
+    texts = [' '.join(r['esAnswers']) for r in requests]
+    profiles = [DocumentProfile(text) for text in texts]
+    scoring = {
+        '逐次': measure(lambda: [
+            calculate_similarity(text, top_n=100, profile=profile, query=QueryVectors(text, profile))
+            for text, profile in zip(texts, profiles)
+        ], args.repeat),
+        '一括': measure(lambda: calculate_similarity_batch(
+            texts, profiles, QueryVectors.batch(texts, profiles), top_n=100
+        ), args.repeat),
+    }
+    # 行列積と行列・ベクトル積の丸め誤差で、同点（上限1.0に制限された最終スコアなど）の並びは入れ替わることがあるため、
+    # スコアの並びと上位100件の集合で比較する
+    same_scoring = sum(
+        np.allclose(a.scores, b.scores, atol=1e-6) and set(a.positions) == set(b.positions)
+        for a, b in zip(scoring['逐次'][1], scoring['一括'][1])
+    )
+
+    print("\n【類似度計算のみ（エンコード + 全ESとのスコアリング + ボーナス）】")
+    for name, (sec, _) in scoring.items():
+        throughput = len(texts) / sec
+        print(f"  {name}: {sec * 1000:8.1f} ms, {throughput:7.1f} 件/秒, {throughput / vcpus:7.1f} 件/秒/vCPU")
+    print(f"  → {scoring['逐次'][0] / scoring['一括'][0]:.2f}倍, 上位100件の一致: {same_scoring}/{len(texts)}件")
+
+    sequential_sec, sequential = measure(lambda: [client.post('/analyze', json=r).json() for r in requests], args.repeat)
+    batch_sec, batch = measure(lambda: client.post('/analyze_batch', json=requests).json(), args.repeat)
+
+    same = sum(
+        json.dumps(a, sort_keys=True, ensure_ascii=False) == json.dumps(b, sort_keys=True, ensure_ascii=False)
+        for a, b in zip(sequential, batch)
+    )
+
+    print("\n【レスポンス全体のスループット】")
+    for name, sec in (('/analyze（逐次）', sequential_sec), ('/analyze_batch', batch_sec)):
+        throughput = len(requests) / sec
+        print(f"  {name:16s}: {sec * 1000:8.1f} ms, {throughput:7.1f} 件/秒, {throughput / vcpus:7.1f} 件/秒/vCPU")
+    print(f"  → {sequential_sec / batch_sec:.2f}倍")
+    print(f"  レスポンスの一致: {same}/{len(requests)}件")
+
+    print("\n" + "=" * 80)
+    print("ベンチマーク完了")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+PCA次元削減（白色化あり/なし）の検索品質ベンチマーク（次元数ごとの再現率・レイテンシ・メモリ）
+
+使い方:
+    python benchmark_embedding_pca.py
+    python benchmark_embedding_pca.py --embeddings es_preprocessed_data/unified_es_data_20251109_embeddings.npy
+
+オプション:
+    --embeddings: 前処理済みエンベディング(.npy)（省略時は合成データ）
+    --n: 合成データの件数（デフォルト: 20000）
+    --dim: 合成データの次元数（デフォルト: 1024 = e5-large）
+    --dims: 射影後の次元数（デフォルト: 64 128 256）
+    --queries: 評価に使うクエリ数（デフォルト: 100）
+    --k: recall@kのk（デフォルト: 100）
+"""
+import sys
+import os
+import time
+import argparse
+sys.path.insert(0, 'src')
+
+os.environ.setdefault('OPENAI_API_KEY', 'dummy-key-for-testing')
+
+import numpy as np
+
+from app import build_embedding_matrix, PCAEmbeddingIndex
+from benchmark_vector_search import make_synthetic_embeddings, make_queries, exact_top_k, recall
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PCA次元削減の検索品質ベンチマーク')
+    parser.add_argument('--embeddings', default=None, help='エンベディング(.npy)のパス')
+    parser.add_argument('--n', type=int, default=20000, help='合成データの件数')
+    parser.add_argument('--dim', type=int, default=1024, help='合成データの次元数')
+    parser.add_argument('--dims', type=int, nargs='+', default=[64, 128, 256], help='射影後の次元数')
+    parser.add_argument('--queries', type=int, default=100, help='クエリ数')
+    parser.add_argument('--k', type=int, default=100, help='recall@kのk')
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("PCA次元削減の検索品質ベンチマーク")
+    print("=" * 80)
+
+    if args.embeddings:
+        matrix = build_embedding_matrix(np.load(args.embeddings))
+        print(f"\n📂 エンベディング: {args.embeddings}")
+    else:
+        matrix = build_embedding_matrix(make_synthetic_embeddings(args.n, args.dim))
+        print("\n🧪 合成データを使用")
+    print(f"  - 件数: {matrix.shape[0]}, 次元数: {matrix.shape[1]}")
+
+    queries = make_queries(matrix, args.queries)
+    k = min(args.k, len(matrix))
+    total_variance = float(matrix.astype(np.float64).var(axis=0, ddof=1).sum())
+
+    start = time.time()
+    exact_results = [exact_top_k(matrix, q, k) for q in queries]
+    exact_ms = (time.time() - start) / len(queries) * 1000
+    print(f"\n【全件スキャン（{matrix.shape[1]}次元）】 {exact_ms:.2f} ms/クエリ, {matrix.nbytes / (1024 * 1024):.1f} MB")
+
+    for whiten in (False, True):
+        print(f"\n【PCA（白色化: {'あり' if whiten else 'なし'}）】")
+        for n_components in args.dims:
+            if n_components >= matrix.shape[1]:
+                continue
+            index = PCAEmbeddingIndex(n_components=n_components, whiten=whiten).build(matrix)
+            ratio = index.explained_variance_ratio(total_variance)
+            print(f"  {n_components}次元: {index.reduced.nbytes / (1024 * 1024):.1f} MB, 説明できる分散 {ratio:.1%}")
+            for rerank in (k, k * 4):
+                start = time.time()
+                approx_results = [index.search(q, k=k, rerank=rerank)[0] for q in queries]
+                elapsed_ms = (time.time() - start) / len(queries) * 1000
+                print(f"    rerank={rerank:4d}: recall@{k}={recall(exact_results, approx_results):.3f}, {elapsed_ms:.2f} ms/クエリ")
+
+    print("\n" + "=" * 80)
+    print("ベンチマーク完了")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+テキスト特徴抽出のマイクロベンチマーク（1文書あたりの処理時間）
+
+使い方:
+    python benchmark_text_features.py
+    python benchmark_text_features.py --csv data/unified_es_data_20251109.csv --docs 2000
+
+オプション:
+    --csv: ESデータのCSV（省略時は合成文書）
+    --docs: 計測に使う文書数（デフォルト: 1000）
+    --repeat: 計測の繰り返し回数（デフォルト: 3）
+"""
+import sys
+import os
+import re
+import time
+import argparse
+import random
+sys.path.insert(0, 'src')
+
+os.environ.setdefault('OPENAI_API_KEY', 'dummy-key-for-testing')
+
+import pandas as pd
+
+from app import (
+    ACHIEVEMENT_PATTERN_FAMILIES,
+    ACHIEVEMENT_SCANNER,
+    score_achievement_captures,
+    extract_quantitative_achievement_score,
+)
+
+
+SAMPLE_SENTENCES = [
+    "私は塾講師のアルバイトで30人の生徒を指導し、平均点を15点向上させました。",
+    "飲食店で売上を20%向上させ、月間売上100万円の売上を達成しました。",
+    "サークルでは50名の参加者をまとめ、イベントを10回開催しました。",
+    "研究室では実験の手順を見直し、作業時間を30%短縮しました。",
+    "ビジネスコンテストで全国2位を獲得し、チームで最優秀賞を受賞しました。",
+    "目標達成率が120%となり、6ヶ月連続で目標を達成しました。",
+    "留学先では現地の学生と協力し、新しい企画を提案しました。",
+    "困難に直面しましたが、最後まで諦めずに取り組みました。",
+]
+
+
+def make_synthetic_documents(n, seed=0):
+    """定量的表現を含む合成ESを生成"""
+    rng = random.Random(seed)
+    return [''.join(rng.choice(SAMPLE_SENTENCES) for _ in range(rng.randint(4, 12))) for _ in range(n)]
+
+
+def legacy_scan(text):
+    """従来方式: パターンごとにre.findall（未コンパイル）を順に実行"""
+    captures = {}
+    for name, patterns in ACHIEVEMENT_PATTERN_FAMILIES.items():
+        if name in ('top', 'goal_achieved'):
+            captures[name] = [True] if re.search(patterns[0], text) else []
+        elif name == 'money':
+            captures[name] = next((m for m in (re.findall(p, text) for p in patterns) if m), [])
+        else:
+            captures[name] = [match for pattern in patterns for match in re.findall(pattern, text)]
+    return captures
+
+
+def measure_per_doc(func, docs, repeat):
+    """1文書あたりの処理時間（マイクロ秒、繰り返しの最短）"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for doc in docs:
+            func(doc)
+        best = min(best, time.perf_counter() - start)
+    return best / len(docs) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='テキスト特徴抽出のマイクロベンチマーク')
+    parser.add_argument('--csv', default=None, help='ESデータのCSV')
+    parser.add_argument('--docs', type=int, default=1000, help='計測に使う文書数')
+    parser.add_argument('--repeat', type=int, default=3, help='計測の繰り返し回数')
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("テキスト特徴抽出のマイクロベンチマーク")
+    print("=" * 80)
+
+    if args.csv:
+        df = pd.read_csv(args.csv)
+        answer_columns = [c for c in df.columns if c.startswith('c-show-more__content')]
+        docs = df[answer_columns].fillna('').astype(str).agg(' '.join, axis=1).tolist()[:args.docs]
+        print(f"\n📂 CSV: {args.csv}")
+    else:
+        docs = make_synthetic_documents(args.docs)
+        print("\n🧪 合成データを使用")
+    print(f"  - 文書数: {len(docs)}, 平均文字数: {sum(len(d) for d in docs) / len(docs):.0f}")
+
+    # 結果が一致することを確認
+    mismatches = sum(
+        1 for doc in docs
+        if score_achievement_captures(legacy_scan(doc)) != extract_quantitative_achievement_score(doc)
+    )
+
+    print("\n【定量的成果スコア（extract_quantitative_achievement_score）】")
+    before = measure_per_doc(lambda doc: score_achievement_captures(legacy_scan(doc)), docs, args.repeat)
+    after = measure_per_doc(extract_quantitative_achievement_score, docs, args.repeat)
+    print(f"  従来（パターンごとにre.findall）: {before:8.1f} μs/文書")
+    print(f"  AchievementScanner             : {after:8.1f} μs/文書  （{before / after:.1f}倍高速）")
+    print(f"  スコア一致: {'✅' if mismatches == 0 else f'❌ {mismatches}件不一致'}")
+
+    print("\n" + "=" * 80)
+    print("ベンチマーク完了")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+TF-IDFスコア計算のベンチマーク（レイテンシ・メモリ・ランキング一致）
+
+従来方式（float64行列 + cosine_similarity）と、正規化済みfloat32 CSR行列との内積（tfidf_scores）、
+転置インデックス（InvertedIndex、MaxScoreによる枝刈り）での上位k件取得を比較する
+
+使い方:
+    python benchmark_tfidf_scoring.py
+    python benchmark_tfidf_scoring.py --csv data/unified_es_data_20251109.csv
+
+オプション:
+    --csv: ESデータのCSV（省略時は合成文書）
+    --docs: 合成文書の件数（デフォルト: 35000）
+    --queries: 評価に使うクエリ数（デフォルト: 50）
+    --top-n: ランキング比較の件数（デフォルト: 100）
+    --k: 転置インデックスで取得する件数（デフォルト: 400 = calculate_similarityのtop_n * 4）
+    --query-words: クエリに使う先頭の語数（デフォルト: 0 = 文書全体。短いクエリほど枝刈りが効く）
+"""
+import sys
+import os
+import time
+import argparse
+import random
+sys.path.insert(0, 'src')
+
+os.environ.setdefault('OPENAI_API_KEY', 'dummy-key-for-testing')
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics.pairwise import cosine_similarity
+
+from app import (
+    InvertedIndex,
+    find_keywords,
+    fit_tfidf_vectorizer,
+    select_top_k,
+    tfidf_scores,
+)
+import app
+
+
+SAMPLE_PHRASES = [
+    "塾講師 アルバイト 生徒 指導 平均点 向上",
+    "飲食店 売上 向上 目標 達成 チーム 協力",
+    "サークル 代表 リーダー メンバー イベント 開催",
+    "研究室 実験 手順 見直し 作業時間 短縮 分析",
+    "ビジネスコンテスト 全国 受賞 チーム 提案",
+    "留学 現地 学生 協力 企画 挑戦 主体性",
+    "困難 課題 解決 粘り強く 取り組み 成長",
+    "インターン 営業 顧客 提案 成果 責任感",
+]
+
+
+def make_synthetic_documents(n, seed=0):
+    """空白区切りの語を含む合成ESを生成（語の出現頻度はZipf分布）"""
+    rng = random.Random(seed)
+    words = ' '.join(SAMPLE_PHRASES).split() + [f'語{i}' for i in range(5000)]
+    frequencies = [1.0 / (rank + 1) for rank in range(len(words))]
+    return [' '.join(rng.choices(words, weights=frequencies, k=rng.randint(30, 120))) for _ in range(n)]
+
+
+def sparse_nbytes(matrix):
+    """CSR行列のメモリ使用量（MB）"""
+    return (matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes) / (1024 * 1024)
+
+
+def measure_per_query(func, queries):
+    """1クエリあたりの処理時間（ミリ秒）"""
+    start = time.perf_counter()
+    results = [func(q) for q in queries]
+    return (time.perf_counter() - start) / len(queries) * 1000, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='TF-IDFスコア計算のベンチマーク')
+    parser.add_argument('--csv', default=None, help='ESデータのCSV')
+    parser.add_argument('--docs', type=int, default=35000, help='合成文書の件数')
+    parser.add_argument('--queries', type=int, default=50, help='クエリ数')
+    parser.add_argument('--top-n', type=int, default=100, help='ランキング比較の件数')
+    parser.add_argument('--k', type=int, default=400, help='転置インデックスで取得する件数')
+    parser.add_argument('--query-words', type=int, default=0, help='クエリに使う先頭の語数（0: 文書全体）')
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("TF-IDFスコア計算のベンチマーク")
+    print("=" * 80)
+
+    if args.csv:
+        df = pd.read_csv(args.csv)
+        answer_columns = [c for c in df.columns if c.startswith('c-show-more__content')]
+        docs = df[answer_columns].fillna('').astype(str).agg(' '.join, axis=1).tolist()
+        print(f"\n📂 CSV: {args.csv}")
+    else:
+        docs = make_synthetic_documents(args.docs)
+        print("\n🧪 合成データを使用")
+
+    vectorizer, matrix = fit_tfidf_vectorizer(docs, [find_keywords(doc) for doc in docs])
+    app.vectorizer = vectorizer
+    legacy_matrix = matrix.astype(np.float64)
+    print(f"  - 行列: {matrix.shape}, 非ゼロ要素: {matrix.nnz:,}")
+    print(f"  - メモリ: float64 {sparse_nbytes(legacy_matrix):.1f} MB → float32 {sparse_nbytes(matrix):.1f} MB")
+
+    rng = np.random.default_rng(1)
+    query_texts = [docs[i] for i in rng.choice(len(docs), size=min(args.queries, len(docs)), replace=False)]
+    if args.query_words > 0:
+        query_texts = [' '.join(text.split()[:args.query_words]) for text in query_texts]
+    queries = [app.transform_tfidf([text]) for text in query_texts]
+    legacy_queries = [q.astype(np.float64) for q in queries]
+
+    legacy_ms, legacy_results = measure_per_query(lambda q: cosine_similarity(q, legacy_matrix)[0], legacy_queries)
+    new_ms, new_results = measure_per_query(lambda q: tfidf_scores(q, matrix), queries)
+
+    # 上位top_n件のランキングが一致するか（浮動小数点誤差による同点付近の入れ替わりは件数を表示）
+    top_n = min(args.top_n, len(docs))
+    same_rankings = sum(
+        np.array_equal(select_top_k(legacy, top_n), select_top_k(new, top_n))
+        for legacy, new in zip(legacy_results, new_results)
+    )
+    max_diff = max(np.abs(legacy - new).max() for legacy, new in zip(legacy_results, new_results))
+
+    print("\n【1クエリあたりのスコア計算】")
+    print(f"  cosine_similarity（float64）: {legacy_ms:8.2f} ms")
+    print(f"  tfidf_scores（float32 CSR） : {new_ms:8.2f} ms  （{legacy_ms / new_ms:.1f}倍高速）")
+    print(f"  上位{top_n}件のランキング一致: {same_rankings}/{len(queries)}クエリ, スコアの最大差: {max_diff:.2e}")
+
+    # 転置インデックス（MaxScore）による上位k件の取得
+    start = time.perf_counter()
+    index = InvertedIndex(matrix)
+    build_sec = time.perf_counter() - start
+    k = min(args.k, len(docs))
+    index_ms, index_results = measure_per_query(lambda q: index.search(q, k), queries)
+    candidate_ratio = np.mean([len(index.candidates(q, k)) for q in queries]) / len(docs)
+    exact = sum(
+        np.array_equal(select_top_k(full, k), positions) and np.array_equal(full[positions], scores)
+        for full, (positions, scores) in zip(new_results, index_results)
+    )
+
+    print(f"\n【転置インデックス（MaxScore）で上位{k}件】")
+    print(f"  構築時間: {build_sec:.2f}秒")
+    print(f"  InvertedIndex.search        : {index_ms:8.2f} ms  （スコア計算した文書: 平均{candidate_ratio:.1%}）")
+    print(f"  全件スキャンとの一致: {exact}/{len(queries)}クエリ")
+
+    print("\n" + "=" * 80)
+    print("ベンチマーク完了")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    main()
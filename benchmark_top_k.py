@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+上位候補選出（top-k）のベンチマーク
+
+従来方式（es_data全体をコピーしてsort_values）とselect_top_k（np.argpartition系）を比較する
+
+使い方:
+    python benchmark_top_k.py
+    python benchmark_top_k.py --sizes 35000 350000 1000000 --top-n 100
+
+オプション:
+    --sizes: 合成データの件数（デフォルト: 35000 350000 1000000）
+    --top-n: calculate_similarityのtop_n（デフォルト: 100）
+    --repeat: 計測の繰り返し回数（デフォルト: 5）
+"""
+import sys
+import os
+import time
+import argparse
+sys.path.insert(0, 'src')
+
+os.environ.setdefault('OPENAI_API_KEY', 'dummy-key-for-testing')
+
+import numpy as np
+import pandas as pd
+
+from app import select_top_k, SimilarityResult
+
+
+def make_synthetic_es_data(n, seed=0):
+    """es_dataと同程度の列を持つ合成DataFrameを生成"""
+    rng = np.random.default_rng(seed)
+    companies = np.array([f'株式会社テスト{i}' for i in range(2000)], dtype=object)
+    return pd.DataFrame({
+        'company_name': companies[rng.integers(0, len(companies), size=n)],
+        'industry': np.array(['IT・通信', '金融', 'メーカー', 'コンサル'], dtype=object)[rng.integers(0, 4, size=n)],
+        'result_status': np.array(['内定', '最終面接通過', '不明'], dtype=object)[rng.integers(0, 3, size=n)],
+        'achievement_score': rng.random(n),
+        'detail_score': rng.random(n),
+    })
+
+
+def measure(func, repeat):
+    """funcを繰り返し実行し、最短時間（ミリ秒）と結果を返す"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def legacy_select(df, scores, top_n):
+    """従来方式: DataFrameをコピーしてsort_valuesで上位top_n*2件を取り出す"""
+    result = df.copy()
+    result['similarity_score'] = scores
+    result = result.sort_values('similarity_score', ascending=False).head(top_n * 2)
+    return result.sort_values('similarity_score', ascending=False).head(top_n)
+
+
+def top_k_select(scores, top_n):
+    """新方式: select_top_kで上位top_n*2件の行位置だけを取り出す"""
+    candidates = select_top_k(scores, top_n * 2)
+    return SimilarityResult(candidates, scores[candidates]).top(top_n)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='上位候補選出のベンチマーク')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[35000, 350000, 1000000], help='合成データの件数')
+    parser.add_argument('--top-n', type=int, default=100, help='calculate_similarityのtop_n')
+    parser.add_argument('--repeat', type=int, default=5, help='計測の繰り返し回数')
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("上位候補選出（top-k）のベンチマーク")
+    print("=" * 80)
+
+    rng = np.random.default_rng(1)
+    for n in args.sizes:
+        df = make_synthetic_es_data(n)
+        scores = rng.random(n)
+
+        legacy_ms, legacy_result = measure(lambda: legacy_select(df, scores, args.top_n), args.repeat)
+        argsort_ms, _ = measure(lambda: np.argsort(-scores, kind='stable')[:args.top_n * 2], args.repeat)
+        top_k_ms, top_k_result = measure(lambda: top_k_select(scores, args.top_n), args.repeat)
+
+        # 結果が一致することを確認
+        same = np.array_equal(legacy_result.index.to_numpy(), top_k_result.positions)
+
+        print(f"\n【{n:,}件】")
+        print(f"  DataFrameコピー + sort_values: {legacy_ms:8.2f} ms")
+        print(f"  np.argsort（全件ソート）     : {argsort_ms:8.2f} ms")
+        print(f"  select_top_k                 : {top_k_ms:8.2f} ms  "
+              f"（{legacy_ms / top_k_ms:.1f}倍高速, 結果一致: {'✅' if same else '❌'}）")
+
+        # 志望企業ESの追加マージ（上位top_n件 + 企業ごとの追加ES）
+        base = top_k_result
+        extras = [
+            SimilarityResult(positions, scores[positions])
+            for positions in (rng.choice(n, size=50, replace=False) for _ in range(3))
+        ]
+        frames = [pd.DataFrame({'similarity_score': r.scores}, index=r.positions) for r in [base] + extras]
+
+        def legacy_merge():
+            merged = pd.concat(frames).sort_values('similarity_score', ascending=False)
+            return merged[~merged.index.duplicated(keep='first')]
+
+        legacy_merge_ms, _ = measure(legacy_merge, args.repeat)
+        merge_ms, _ = measure(lambda: base.merge(*extras), args.repeat)
+        print(f"  追加ESのマージ: pd.concat + sort_values {legacy_merge_ms:.2f} ms / "
+              f"SimilarityResult.merge {merge_ms:.2f} ms")
+
+    print("\n" + "=" * 80)
+    print("ベンチマーク完了")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    main()
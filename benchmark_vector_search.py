@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+セマンティック検索インデックスのベンチマーク（再現率・レイテンシ）
+
+使い方:
+    python benchmark_vector_search.py
+    python benchmark_vector_search.py --embeddings es_preprocessed_data/unified_es_data_20251109_embeddings.npy
+
+オプション:
+    --embeddings: 前処理済みエンベディング(.npy)（省略時は合成データ）
+    --n: 合成データの件数（デフォルト: 10000）
+    --dim: 合成データの次元数（デフォルト: 384）
+    --queries: 評価に使うクエリ数（デフォルト: 100）
+    --k: recall@kのk（デフォルト: 100）
+"""
+import sys
+import os
+import time
+import argparse
+sys.path.insert(0, 'src')
+
+os.environ.setdefault('OPENAI_API_KEY', 'dummy-key-for-testing')
+
+import numpy as np
+
+from app import build_embedding_matrix, HNSWIndex, QuantizedEmbeddingIndex, BinaryEmbeddingIndex, IVFIndex
+
+
+def make_synthetic_embeddings(n, dim, n_clusters=200, seed=0):
+    """クラスタ構造を持つ合成エンベディングを生成"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dim))
+    labels = rng.integers(0, n_clusters, size=n)
+    return centers[labels] + rng.normal(scale=0.8, size=(n, dim))
+
+
+def make_queries(matrix, n_queries, seed=1):
+    """コーパスの行にノイズを加えたクエリを生成"""
+    rng = np.random.default_rng(seed)
+    rows = matrix[rng.choice(len(matrix), size=n_queries, replace=False)]
+    return build_embedding_matrix(rows + rng.normal(scale=0.05, size=rows.shape))
+
+
+def exact_top_k(matrix, query, k):
+    scores = matrix @ query
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def recall(exact_results, approx_results):
+    hits = sum(len(np.intersect1d(e, a)) for e, a in zip(exact_results, approx_results))
+    return hits / sum(len(e) for e in exact_results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='セマンティック検索インデックスのベンチマーク')
+    parser.add_argument('--embeddings', default=None, help='エンベディング(.npy)のパス')
+    parser.add_argument('--n', type=int, default=10000, help='合成データの件数')
+    parser.add_argument('--dim', type=int, default=384, help='合成データの次元数')
+    parser.add_argument('--queries', type=int, default=100, help='クエリ数')
+    parser.add_argument('--k', type=int, default=100, help='recall@kのk')
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("セマンティック検索インデックスのベンチマーク")
+    print("=" * 80)
+
+    if args.embeddings:
+        matrix = build_embedding_matrix(np.load(args.embeddings))
+        print(f"\n📂 エンベディング: {args.embeddings}")
+    else:
+        matrix = build_embedding_matrix(make_synthetic_embeddings(args.n, args.dim))
+        print("\n🧪 合成データを使用")
+    print(f"  - 件数: {matrix.shape[0]}, 次元数: {matrix.shape[1]}")
+    print(f"  - float32行列: {matrix.nbytes / (1024 * 1024):.1f} MB")
+
+    queries = make_queries(matrix, args.queries)
+    k = min(args.k, len(matrix))
+
+    # 全件スキャン（基準）
+    start = time.time()
+    exact_results = [exact_top_k(matrix, q, k) for q in queries]
+    exact_ms = (time.time() - start) / len(queries) * 1000
+    print(f"\n【全件スキャン】 {exact_ms:.2f} ms/クエリ")
+
+    # HNSW
+    print("\n【HNSW】")
+    start = time.time()
+    index = HNSWIndex(M=16, ef_construction=100).build(matrix)
+    print(f"  構築時間: {time.time() - start:.1f}秒, {index.max_level + 1}層")
+    for ef in (k, k * 2, k * 4):
+        start = time.time()
+        approx_results = [index.search(q, k=k, ef_search=ef)[0] for q in queries]
+        elapsed_ms = (time.time() - start) / len(queries) * 1000
+        print(f"  ef_search={ef:4d}: recall@{k}={recall(exact_results, approx_results):.3f}, {elapsed_ms:.2f} ms/クエリ")
+
+    # IVF（k-meansのセルのうち上位nprobe個だけを走査）
+    print("\n【IVF】")
+    start = time.time()
+    ivf = IVFIndex().build(matrix)
+    print(f"  構築時間: {time.time() - start:.1f}秒, {ivf.n_lists}セル")
+    for nprobe in (4, 16, 64):
+        start = time.time()
+        approx_results = [ivf.search(q, k=k, nprobe=nprobe)[0] for q in queries]
+        elapsed_ms = (time.time() - start) / len(queries) * 1000
+        print(f"  nprobe={nprobe:4d}: recall@{k}={recall(exact_results, approx_results):.3f}, {elapsed_ms:.2f} ms/クエリ")
+
+    # int8スカラー量子化 + float32での再計算
+    print("\n【int8量子化】")
+    start = time.time()
+    quantized = QuantizedEmbeddingIndex().build(matrix)
+    print(f"  構築時間: {time.time() - start:.1f}秒, int8行列: {quantized.codes.nbytes / (1024 * 1024):.1f} MB")
+    for rerank in (k, k * 2, k * 4):
+        start = time.time()
+        approx_results = [quantized.search(q, k=k, rerank=rerank)[0] for q in queries]
+        elapsed_ms = (time.time() - start) / len(queries) * 1000
+        print(f"  rerank={rerank:4d}: recall@{k}={recall(exact_results, approx_results):.3f}, {elapsed_ms:.2f} ms/クエリ")
+
+    # バイナリ符号（Hamming距離）で絞り込み + float32での再計算
+    print("\n【バイナリ符号（Hamming距離）】")
+    start = time.time()
+    binary = BinaryEmbeddingIndex().build(matrix)
+    print(f"  構築時間: {time.time() - start:.1f}秒, 符号: {binary.codes.nbytes / 1024:.0f} KB"
+          f"（1件{binary.codes.shape[0] * 8}バイト）")
+    start = time.time()
+    for q in queries:
+        binary.hamming_distances(q)
+    print(f"  Hamming距離の全件計算: {(time.time() - start) / len(queries) * 1000:.2f} ms/クエリ")
+    for rerank in (k * 4, k * 10, k * 20):
+        start = time.time()
+        approx_results = [binary.search(q, k=k, rerank=rerank)[0] for q in queries]
+        elapsed_ms = (time.time() - start) / len(queries) * 1000
+        print(f"  rerank={rerank:5d}: recall@{k}={recall(exact_results, approx_results):.3f}, {elapsed_ms:.2f} ms/クエリ")
+
+    print("\n" + "=" * 80)
+    print("ベンチマーク完了")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,8 +3,8 @@
 # ============================================
 import pandas as pd
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+from sklearn.preprocessing import normalize
 from fastapi import FastAPI, HTTPException
 from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
@@ -12,6 +12,8 @@ from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 import json
+import heapq
+from collections import deque
 import re
 import time
 import os
@@ -28,6 +30,45 @@ es_data = None
 vectorizer = None
 tfidf_matrix = None
 sentence_model = None  # Sentence-BERTモデル
+embedding_matrix = None  # L2正規化済みエンベディング行列（float32、es_dataの行位置と対応）
+hnsw_index = None  # セマンティック検索用のHNSWインデックス（前処理済みデータに含まれる場合のみ）
+quantized_index = None  # セマンティック検索用のint8量子化インデックス（前処理済みデータに含まれる場合のみ）
+ivf_index = None  # セマンティック検索用のIVFインデックス（前処理済みデータに含まれる場合のみ）
+pca_index = None  # セマンティック検索用のPCA次元削減インデックス（前処理済みデータに含まれる場合のみ）
+binary_index = None  # セマンティック検索用のバイナリ符号インデックス（SEMANTIC_SEARCH_MODEが'binary'の場合のみ）
+tfidf_index = None  # TF-IDFの転置インデックス（TFIDF_SEARCH_MODEが'inverted'の場合のみ）
+es_features = None  # ボーナス計算用の特徴配列（es_dataの行位置と対応）
+es_lookup = None  # 企業名・業界・業界大分類 → es_dataの行位置のルックアップインデックス
+company_table = None  # 企業ごとの集計テーブル（給与・難易度・ES件数・代表行など）
+company_index = None  # 企業ごとのセントロイドによる企業検索インデックス（エンベディングがある場合のみ）
+industry_table = None  # 業界ごとの集計テーブル（ES件数・通過/内定件数・大分類）
+industry_stats = {}  # 業界名・業界大分類 → 業界統計（読み込み時に計算済み）
+
+# セマンティック検索の方式
+# （'exact': 全件スキャン, 'hnsw': HNSW近似最近傍探索, 'int8': int8量子化スキャン + 再計算, 'binary': Hamming距離で絞り込み + 再計算,
+#   'ivf': k-meansのセルのうちクエリに近いIVF_NPROBE個だけを走査, 'pca': PCAで削減した次元でスキャン + 再計算）
+SEMANTIC_SEARCH_MODE = os.getenv('SEMANTIC_SEARCH_MODE', 'exact')
+HNSW_EF_SEARCH = int(os.getenv('HNSW_EF_SEARCH', '128'))
+INT8_RERANK = int(os.getenv('INT8_RERANK', '400'))
+BINARY_RERANK = int(os.getenv('BINARY_RERANK', '2000'))
+IVF_NPROBE = int(os.getenv('IVF_NPROBE', '16'))
+PCA_RERANK = int(os.getenv('PCA_RERANK', '400'))
+
+# TF-IDF検索の方式（'exact': 疎行列との内積で全件スコアリング, 'inverted': 転置インデックスで上位候補のみ）
+TFIDF_SEARCH_MODE = os.getenv('TFIDF_SEARCH_MODE', 'exact')
+
+# TF-IDFでテーマキーワード（ES_THEME_CATEGORIES）の出現回数に加算するブースト量
+TFIDF_KEYWORD_BOOST = float(os.getenv('TFIDF_KEYWORD_BOOST', '3'))
+
+# 内定とみなす選考結果（onlyAcceptedの絞り込みと企業セントロイドの構築で使う）
+ACCEPTED_RESULT_STATUSES = ['内定', '内々定', '最終面接通過']
+
+# 絞り込み検索で、対象ESの行だけを行列から取り出して計算する件数の上限（全ES件数に対する割合）
+# 対象が連続した行（業界のパーティション）でなく、これより多い場合は通常の内容類似度（全件の内積または近似探索）をマスクで絞り込む
+FILTER_GATHER_MAX_FRACTION = 0.05
+
+# /analyze_batchで1回に受け付けるリクエスト数の上限（入力ES数 × ES件数の行列を確保するため）
+ANALYZE_BATCH_MAX_SIZE = int(os.getenv('ANALYZE_BATCH_MAX_SIZE', '64'))
 
 # 選択肢用データ
 universities_list = []
@@ -253,6 +294,68 @@ EPISODE_TYPES = {
     }
 }
 
+# 強みのカテゴリ定義
+STRENGTH_CATEGORIES = {
+    '行動力・実行力': ['行動力', '実行力', '有言実行', '実行する', '行動する', '動く', '実践', 'やり遂げる', '成し遂げる'],
+    'コミュニケーション力': ['コミュニケーション', '説明', '伝える', '話す', 'プレゼン', '対話', '傾聴', '聞く'],
+    'リーダーシップ': ['リーダーシップ', 'リーダー', '統率', '率いる', '導く', 'まとめる', '引っ張る'],
+    '課題解決力': ['課題解決', '問題解決', '解決力', '分析', '改善', '工夫', '対策'],
+    '粘り強さ・継続力': ['粘り強い', '継続', '諦めない', 'やり抜く', '最後まで', '根気'],
+    '協調性・チームワーク': ['協調性', 'チームワーク', '協力', '連携', '協働', 'サポート'],
+    '創造性・発想力': ['創造', '発想', 'アイデア', '企画', '新しい', '斬新', '独創'],
+    '計画性・緻密さ': ['計画', '緻密', '細かい', '丁寧', '正確', '几帳面', '段取り'],
+    '挑戦心・向上心': ['挑戦', '向上心', 'チャレンジ', '成長', '学ぶ', '吸収'],
+    '柔軟性・適応力': ['柔軟', '適応', '対応', '臨機応変', '変化', '順応'],
+    '責任感': ['責任感', '責任', '誠実', '真摯', 'やり遂げる'],
+}
+
+# 弱みのカテゴリ定義
+WEAKNESS_CATEGORIES = {
+    '突っ走る・周りが見えない': ['突っ走', '周りを気にせず', '一人で進', '周りが見えない', '置いてい'],
+    '心配性・慎重すぎる': ['心配性', '慎重すぎ', '考えすぎ', '不安', '躊躇'],
+    'せっかち': ['せっかち', '焦る', '急ぐ', '待てない'],
+    '完璧主義': ['完璧主義', '完璧', '細かい', '妥協できない'],
+    '人に頼れない': ['頼れない', '一人で抱え', '相談できない', '自分で'],
+    '優柔不断': ['優柔不断', '決められない', '迷う', '決断が遅い'],
+    '計画性がない': ['計画性がない', '行き当たり', '無計画'],
+}
+
+# ボーナス計算用の特徴コード（es_featuresの列・コードの並び順）
+THEME_LABELS = list(ES_THEME_CATEGORIES.keys()) + ['その他']
+EPISODE_TYPE_NAMES = list(EPISODE_TYPES.keys())
+EPISODE_CATEGORY_NAMES = list(dict.fromkeys(config['category'] for config in EPISODE_TYPES.values()))
+STRENGTH_NAMES = list(STRENGTH_CATEGORIES.keys())
+WEAKNESS_NAMES = list(WEAKNESS_CATEGORIES.keys())
+STRUCTURE_KEYS = ['situation', 'task', 'action', 'result', 'learning']
+
+# STARフレームワークの要素ごとのキーワード（analyze_es_structure）
+STRUCTURE_KEYWORDS = {
+    'situation': ['において', 'で', 'に所属', 'に参加', '当時', 'では', 'として'],          # 状況説明
+    'task': ['目標', '課題', 'したい', 'を目指', '改善', '向上', '問題', '必要'],             # 課題・目標
+    'action': ['私は', '取り組んだ', '実施', '工夫', '提案', '導入', '行った', '考えた'],     # 具体的行動
+    'result': ['結果', '達成', '向上', '%', '増加', '成功', '実現', '完成'],                  # 成果・結果
+    'learning': ['学んだ', '得た', '身につけた', '気づいた', '経験から', '理解した', '成長'],  # 学び
+}
+
+# ガクチカ分析・ES分析のチェック項目のキーワード（analyze_gakuchika / analyze_es_answers）
+GAKUCHIKA_CHECK_KEYWORDS = {
+    'quantitative': ['数値', '結果', '成果', '%', '人'],
+    'problem_solving': ['課題', '問題', '解決', '改善'],
+    'teamwork': ['チーム', '協力', '連携', 'メンバー'],
+    'learning': ['学んだ', '得た', '成長'],
+}
+ES_ANSWER_CHECK_KEYWORDS = {
+    'quantitative': ['数値', '結果', '成果', '%', '人', '件', '倍'],
+    'problem_solving': ['課題', '問題', '解決', '改善', '克服'],
+    'teamwork': ['チーム', '協力', '連携', 'メンバー', '組織'],
+    'learning': ['学んだ', '得た', '成長', '経験'],
+    'concreteness': ['具体的', '例えば', '実際に'],
+}
+EPISODE_TYPE_CATEGORY_CODES = np.array(
+    [EPISODE_CATEGORY_NAMES.index(config['category']) for config in EPISODE_TYPES.values()],
+    dtype=np.int16
+)
+
 # FastAPIアプリケーションの初期化
 base_dir = os.path.dirname(os.path.abspath(__file__))
 template_dir = os.path.join(os.path.dirname(base_dir), 'templates')
@@ -285,12 +388,95 @@ class AnalyzeRequest(BaseModel):
     major: Optional[str] = ""
     graduationYear: Optional[str] = ""
     onlyAccepted: Optional[bool] = False  # 内定のみに絞るフィルター
+    nprobe: Optional[int] = None  # IVF検索で走査するセル数（省略時はIVF_NPROBE、SEMANTIC_SEARCH_MODE=ivfのみ）
 
 class SimilarityAnalysisRequest(BaseModel):
     userES: str
     similarES: str
     question: Optional[str] = ""
 
+# ============================================
+# キーワード辞書の一括マッチング（Aho-Corasick）
+# ============================================
+
+class KeywordMatcher:
+    """
+    複数キーワードの出現をテキスト1回の走査で検出するAho-Corasickオートマトン
+
+    テーマ・エピソードタイプ・強み/弱み・STARなどのキーワード辞書を1つにまとめて構築し、
+    各抽出関数はfind()の結果（出現したキーワードの集合）を参照する。
+    判定結果は「kw in text」を各キーワードで繰り返した場合と同じ
+    """
+
+    def __init__(self, keywords):
+        self.keywords = list(dict.fromkeys(kw for kw in keywords if kw))
+
+        # トライ木を構築
+        goto = [{}]
+        outputs = [[]]
+        for keyword in self.keywords:
+            state = 0
+            for ch in keyword:
+                next_state = goto[state].get(ch)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][ch] = next_state
+                    goto.append({})
+                    outputs.append([])
+                state = next_state
+            outputs[state].append(keyword)
+
+        # 幅優先で失敗遷移を設定し、失敗先の出力を引き継ぐ
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in goto[state].items():
+                queue.append(next_state)
+                fallback = fail[state]
+                while fallback and ch not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[next_state] = goto[fallback].get(ch, 0)
+                outputs[next_state] = outputs[next_state] + outputs[fail[next_state]]
+
+        self._goto = goto
+        self._fail = fail
+        self._outputs = [tuple(output) for output in outputs]
+
+    def find(self, text):
+        """テキスト中に出現するキーワードの集合を返す"""
+        goto = self._goto
+        fail = self._fail
+        outputs = self._outputs
+
+        found = set()
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if outputs[state]:
+                found.update(outputs[state])
+        return found
+
+
+def _collect_keywords():
+    """KeywordMatcherに登録する全キーワード辞書のキーワード"""
+    keyword_lists = list(ES_THEME_CATEGORIES.values())
+    keyword_lists += [config['keywords'] for config in EPISODE_TYPES.values()]
+    keyword_lists += list(STRENGTH_CATEGORIES.values())
+    keyword_lists += list(WEAKNESS_CATEGORIES.values())
+    keyword_lists += list(STRUCTURE_KEYWORDS.values())
+    keyword_lists += list(GAKUCHIKA_CHECK_KEYWORDS.values())
+    keyword_lists += list(ES_ANSWER_CHECK_KEYWORDS.values())
+    return [keyword for keywords in keyword_lists for keyword in keywords]
+
+KEYWORD_MATCHER = KeywordMatcher(_collect_keywords())
+
+def find_keywords(text):
+    """テキスト中に出現する（キーワード辞書の）キーワードの集合"""
+    return KEYWORD_MATCHER.find(str(text))
+
 # ============================================
 # データ処理関数
 # ============================================
@@ -334,17 +520,17 @@ def extract_major_industry_category(industry):
 
     return None
 
-def categorize_es_themes(text):
-    """ESのテーマをマルチラベルで判定"""
+def categorize_es_themes(text, found=None):
+    """ESのテーマをマルチラベルで判定（foundはfind_keywords(text)の結果、省略時は照合する）"""
     if pd.isna(text) or not text:
         return []
 
-    text_str = str(text)
+    found = find_keywords(text) if found is None else found
     matched_themes = []
 
     for theme_name, keywords in ES_THEME_CATEGORIES.items():
         # キーワードマッチング
-        keyword_count = sum(1 for kw in keywords if kw in text_str)
+        keyword_count = sum(1 for kw in keywords if kw in found)
 
         # 閾値を超えたらテーマとして認定（2個以上）
         if keyword_count >= 2:
@@ -358,9 +544,9 @@ def categorize_es_themes(text):
 
     return matched_themes if matched_themes else [{'theme': 'その他', 'score': 0}]
 
-def extract_strengths_and_weaknesses(text):
+def extract_strengths_and_weaknesses(text, found=None):
     """
-    ESテキストから強み・弱みを抽出
+    ESテキストから強み・弱みを抽出（foundはfind_keywords(text)の結果、省略時は照合する）
 
     Returns:
         dict: {
@@ -378,39 +564,13 @@ def extract_strengths_and_weaknesses(text):
             'weakness_keywords': []
         }
 
-    text_str = str(text)
-
-    # 強みのカテゴリ定義
-    STRENGTH_CATEGORIES = {
-        '行動力・実行力': ['行動力', '実行力', '有言実行', '実行する', '行動する', '動く', '実践', 'やり遂げる', '成し遂げる'],
-        'コミュニケーション力': ['コミュニケーション', '説明', '伝える', '話す', 'プレゼン', '対話', '傾聴', '聞く'],
-        'リーダーシップ': ['リーダーシップ', 'リーダー', '統率', '率いる', '導く', 'まとめる', '引っ張る'],
-        '課題解決力': ['課題解決', '問題解決', '解決力', '分析', '改善', '工夫', '対策'],
-        '粘り強さ・継続力': ['粘り強い', '継続', '諦めない', 'やり抜く', '最後まで', '根気'],
-        '協調性・チームワーク': ['協調性', 'チームワーク', '協力', '連携', '協働', 'サポート'],
-        '創造性・発想力': ['創造', '発想', 'アイデア', '企画', '新しい', '斬新', '独創'],
-        '計画性・緻密さ': ['計画', '緻密', '細かい', '丁寧', '正確', '几帳面', '段取り'],
-        '挑戦心・向上心': ['挑戦', '向上心', 'チャレンジ', '成長', '学ぶ', '吸収'],
-        '柔軟性・適応力': ['柔軟', '適応', '対応', '臨機応変', '変化', '順応'],
-        '責任感': ['責任感', '責任', '誠実', '真摯', 'やり遂げる'],
-    }
-
-    # 弱みのカテゴリ定義
-    WEAKNESS_CATEGORIES = {
-        '突っ走る・周りが見えない': ['突っ走', '周りを気にせず', '一人で進', '周りが見えない', '置いてい'],
-        '心配性・慎重すぎる': ['心配性', '慎重すぎ', '考えすぎ', '不安', '躊躇'],
-        'せっかち': ['せっかち', '焦る', '急ぐ', '待てない'],
-        '完璧主義': ['完璧主義', '完璧', '細かい', '妥協できない'],
-        '人に頼れない': ['頼れない', '一人で抱え', '相談できない', '自分で'],
-        '優柔不断': ['優柔不断', '決められない', '迷う', '決断が遅い'],
-        '計画性がない': ['計画性がない', '行き当たり', '無計画'],
-    }
+    found = find_keywords(text) if found is None else found
 
     # 強みを抽出
     matched_strengths = []
     strength_keywords = []
     for category, keywords in STRENGTH_CATEGORIES.items():
-        matched = [kw for kw in keywords if kw in text_str]
+        matched = [kw for kw in keywords if kw in found]
         if matched:
             matched_strengths.append(category)
             strength_keywords.extend(matched)
@@ -419,7 +579,7 @@ def extract_strengths_and_weaknesses(text):
     matched_weaknesses = []
     weakness_keywords = []
     for category, keywords in WEAKNESS_CATEGORIES.items():
-        matched = [kw for kw in keywords if kw in text_str]
+        matched = [kw for kw in keywords if kw in found]
         if matched:
             matched_weaknesses.append(category)
             weakness_keywords.extend(matched)
@@ -431,25 +591,8 @@ def extract_strengths_and_weaknesses(text):
         'weakness_keywords': weakness_keywords
     }
 
-def extract_theme_keywords_for_weighting(text):
-    """重要キーワードに重み付けしたテキストを生成"""
-    if pd.isna(text) or not text:
-        return str(text)
-
-    text_str = str(text)
-    weighted_text = text_str
-
-    # テーマ別に重要キーワードを抽出して重み付け
-    for theme_name, keywords in ES_THEME_CATEGORIES.items():
-        for keyword in keywords:
-            if keyword in text_str:
-                # キーワードを3回繰り返して重要度を上げる
-                weighted_text += f" {keyword} {keyword} {keyword}"
-
-    return weighted_text
-
-def analyze_es_structure(text):
-    """ESの構造を分析してスコアリング（STARフレームワーク）"""
+def analyze_es_structure(text, found=None):
+    """ESの構造を分析してスコアリング（STARフレームワーク、foundはfind_keywords(text)の結果）"""
     if pd.isna(text) or not text:
         return {
             'situation': 0,
@@ -459,44 +602,23 @@ def analyze_es_structure(text):
             'learning': 0
         }
 
-    text_str = str(text)
+    found = find_keywords(text) if found is None else found
 
+    # 状況説明・課題・行動・成果・学びのキーワード数（STRUCTURE_KEYWORDS）
     structure_features = {
-        'situation': 0,  # 状況説明
-        'task': 0,       # 課題・目標
-        'action': 0,     # 具体的行動
-        'result': 0,     # 成果・結果
-        'learning': 0    # 学び
+        key: sum(1 for kw in keywords if kw in found)
+        for key, keywords in STRUCTURE_KEYWORDS.items()
     }
 
-    # 状況説明の検出
-    situation_keywords = ['において', 'で', 'に所属', 'に参加', '当時', 'では', 'として']
-    structure_features['situation'] = sum(1 for kw in situation_keywords if kw in text_str)
-
-    # 課題・目標の検出
-    task_keywords = ['目標', '課題', 'したい', 'を目指', '改善', '向上', '問題', '必要']
-    structure_features['task'] = sum(1 for kw in task_keywords if kw in text_str)
-
-    # 具体的行動の検出
-    action_keywords = ['私は', '取り組んだ', '実施', '工夫', '提案', '導入', '行った', '考えた']
-    structure_features['action'] = sum(1 for kw in action_keywords if kw in text_str)
-
-    # 成果の検出
-    result_keywords = ['結果', '達成', '向上', '%', '増加', '成功', '実現', '完成']
-    structure_features['result'] = sum(1 for kw in result_keywords if kw in text_str)
-
-    # 学びの検出
-    learning_keywords = ['学んだ', '得た', '身につけた', '気づいた', '経験から', '理解した', '成長']
-    structure_features['learning'] = sum(1 for kw in learning_keywords if kw in text_str)
-
     return structure_features
 
-def classify_episode_type(text):
+def classify_episode_type(text, found=None):
     """
     ESテキストからエピソードタイプを判定
 
     Args:
         text (str): ES本文
+        found (set): find_keywords(text)の結果（省略時は照合する）
 
     Returns:
         dict: {
@@ -512,7 +634,7 @@ def classify_episode_type(text):
             'matched_keywords': []
         }
 
-    text_str = str(text)
+    found = find_keywords(text) if found is None else found
 
     # 各エピソードタイプでマッチング
     episode_scores = []
@@ -522,7 +644,7 @@ def classify_episode_type(text):
         weight = config['weight']
 
         # マッチしたキーワードをカウント
-        matched_keywords = [kw for kw in keywords if kw in text_str]
+        matched_keywords = [kw for kw in keywords if kw in found]
         match_count = len(matched_keywords)
 
         if match_count > 0:
@@ -551,13 +673,14 @@ def classify_episode_type(text):
         'matched_keywords': []
     }
 
-def classify_multiple_episode_types(text, top_n=2):
+def classify_multiple_episode_types(text, top_n=2, found=None):
     """
     複数のエピソードタイプを返す（マルチラベル対応）
 
     Args:
         text (str): ES本文
         top_n (int): 返すエピソードタイプの最大数
+        found (set): find_keywords(text)の結果（省略時は照合する）
 
     Returns:
         list: エピソードタイプのリスト
@@ -565,7 +688,7 @@ def classify_multiple_episode_types(text, top_n=2):
     if pd.isna(text) or not text:
         return [{'type': 'その他の経験', 'confidence': 0}]
 
-    text_str = str(text)
+    found = find_keywords(text) if found is None else found
 
     episode_scores = []
 
@@ -573,7 +696,7 @@ def classify_multiple_episode_types(text, top_n=2):
         keywords = config['keywords']
         weight = config['weight']
 
-        matched_keywords = [kw for kw in keywords if kw in text_str]
+        matched_keywords = [kw for kw in keywords if kw in found]
         match_count = len(matched_keywords)
 
         if match_count > 0:
@@ -593,20 +716,127 @@ def classify_multiple_episode_types(text, top_n=2):
 
     return [{'type': 'その他の経験', 'confidence': 0}]
 
-def extract_quantitative_achievement_score(text):
-    """
-    定量的成果のスコアを計算（網羅的パターン対応）
+# 定量的成果の正規表現（パターン群ごとにコンパイル済み、extract_quantitative_achievement_scoreの加点順）
+ACHIEVEMENT_PATTERN_FAMILIES = {
+    # カテゴリ1: パーセンテージ系
+    'percentage_positive': [r'(\d+(?:\.\d+)?)%?(?:％)?(?:向上|増加|改善|達成|上昇|伸び|アップ|UP|成長|拡大|上がった|高まった)'],
+    'percentage_reduction': [r'(\d+(?:\.\d+)?)%?(?:％)?(?:削減|減少|短縮|カット|削った|減らした|低減)'],
+    'point_increase': [r'(\d+(?:\.\d+)?)(?:ポイント|pt|点)(?:向上|上昇|アップ|増加|改善)'],
+    # カテゴリ2: 倍数系
+    'multiplier': [r'(\d+(?:\.\d+)?)倍'],
+    # カテゴリ3: 人数・規模系
+    'people': [
+        r'(\d+)人(?:以上)?(?:の|を|に|へ)?(?:生徒|学生|社員|メンバー|顧客|お客様|参加者|受講者)',
+        r'(?:生徒|学生|社員|メンバー|顧客|お客様|参加者|受講者)(?:数)?(?:が)?(\d+)人',
+        r'(\d+)名(?:の|を|に|へ)?(?:生徒|学生|社員|メンバー|顧客|お客様|参加者|受講者)',
+    ],
+    'team': [r'(\d+)人(?:チーム|のチーム|規模|体制|メンバー構成)'],
+    # カテゴリ4: 金額系
+    'money': [
+        r'(\d+)(?:万|億)?円(?:の)?(?:売上|売り上げ|利益|収益|収入)',
+        r'(?:売上|売り上げ|利益|収益|収入)(?:が)?(\d+)(?:万|億)?円',
+        r'(\d+)(?:万|億)(?:円)?(?:の)?(?:売上|売り上げ|利益|収益|収入)',
+    ],
+    'cost_reduction': [r'(\d+)(?:万|億)?円(?:の)?(?:削減|コスト削減|経費削減|節約)'],
+    # カテゴリ5: 順位・ランキング系
+    'ranking': [
+        r'(?:第)?([1-3])位(?:を)?(?:獲得|達成|入賞)',
+        r'([1-3])位(?:に)?(?:なった|なり|入った)',
+        r'(?:全国|地区|県|市|学内)(?:で)?([1-3])位',
+    ],
+    'top': [r'(?:トップ|TOP|No\.1|ナンバーワン)'],
+    'awards': [r'(?:優勝|準優勝|入賞|受賞|表彰|金賞|銀賞|銅賞|最優秀賞|優秀賞)'],
+    # カテゴリ6: 目標達成系
+    'achievement_rate': [r'(?:目標)?(?:達成率)(?:が)?(\d+(?:\.\d+)?)%'],
+    'goal_achieved': [r'目標(?:を)?(?:達成|クリア|突破|超え)'],
+    # カテゴリ7: 期間・頻度系
+    'consecutive': [r'(\d+)(?:ヶ月|か月|ヵ月|カ月|年|週)(?:連続|継続)'],
+    'time_based': [r'(\d+)(?:ヶ月|か月|週間|日)(?:で|以内に)(?:達成|実現|完成|完了)'],
+    # カテゴリ8: その他の定量的表現
+    'satisfaction_score': [r'(?:満足度|評価)(?:が)?(\d+(?:\.\d+)?)(?:点|/10|/5)'],
+    'participant_numbers': [r'(\d+)人(?:が|の)?(?:参加|応募|エントリー|集まった)'],
+    'frequency': [r'(\d+)回(?:以上)?(?:実施|開催|実行|達成)'],
+    'success_rate': [r'(?:合格率|成功率|達成率)(?:が)?(\d+(?:\.\d+)?)%'],
+}
 
-    Args:
-        text (str): ES本文
+# パターン群がマッチするために必要な文字（各グループのいずれか1文字が本文に必要）
+# 本文に含まれない場合はそのパターン群の正規表現を実行しない
+# _DIGITSは\dに一致する文字（全角数字などUnicodeの数字を含む）を表す
+_DIGITS = None
+ACHIEVEMENT_PATTERN_TRIGGERS = {
+    'percentage_positive': [_DIGITS, '向増改達上伸アU成拡高'],
+    'percentage_reduction': [_DIGITS, '削減短カ低'],
+    'point_increase': [_DIGITS, 'ポp点', '向上ア増改'],
+    'multiplier': [_DIGITS, '倍'],
+    'people': [_DIGITS, '人名'],
+    'team': [_DIGITS, '人'],
+    'money': [_DIGITS, '円万億'],
+    'cost_reduction': [_DIGITS, '円'],
+    'ranking': ['123', '位'],
+    'top': ['トTNナ'],
+    'awards': ['優入受表金銀銅'],
+    'achievement_rate': [_DIGITS, '率', '%'],
+    'goal_achieved': ['目'],
+    'consecutive': [_DIGITS, '連継'],
+    'time_based': [_DIGITS, 'ヶか週日', '達実完'],
+    'satisfaction_score': [_DIGITS, '満評'],
+    'participant_numbers': [_DIGITS, '人'],
+    'frequency': [_DIGITS, '回'],
+    'success_rate': [_DIGITS, '率', '%'],
+}
 
-    Returns:
-        float: 成果スコア（0.0〜1.0）
+
+class AchievementScanner:
     """
-    if pd.isna(text) or not text:
-        return 0.0
+    定量的成果のパターン群をまとめて走査するスキャナ
 
-    text_str = str(text)
+    正規表現は生成時に一度だけコンパイルする。各パターン群に必要な文字が本文に
+    含まれるかを先に判定し、一致し得ないパターン群は実行しない。
+    各パターン群の結果はre.findall（moneyは最初に一致したパターンのみ、
+    top・goal_achievedはre.searchの有無）と同じ
+    """
+
+    def __init__(self, families=None, triggers=None):
+        families = families or ACHIEVEMENT_PATTERN_FAMILIES
+        triggers = triggers or ACHIEVEMENT_PATTERN_TRIGGERS
+        self.families = {
+            name: [re.compile(pattern) for pattern in patterns]
+            for name, patterns in families.items()
+        }
+        self.triggers = triggers
+        self._digit_pattern = re.compile(r'\d')
+
+    def _can_match(self, name, text, has_digit):
+        for group in self.triggers[name]:
+            if group is _DIGITS:
+                if not has_digit:
+                    return False
+            elif not any(ch in text for ch in group):
+                return False
+        return True
+
+    def scan(self, text):
+        """パターン群ごとのマッチ結果を返す（一致し得ないパターン群は空リスト）"""
+        has_digit = self._digit_pattern.search(text) is not None
+        captures = {}
+        for name, patterns in self.families.items():
+            if not self._can_match(name, text, has_digit):
+                captures[name] = []
+                continue
+
+            if name in ('top', 'goal_achieved'):
+                captures[name] = [True] if patterns[0].search(text) else []
+            elif name == 'money':
+                # 最初にマッチしたパターンの結果のみ（加点は1回）
+                captures[name] = next((m for m in (p.findall(text) for p in patterns) if m), [])
+            else:
+                captures[name] = [match for pattern in patterns for match in pattern.findall(text)]
+        return captures
+
+ACHIEVEMENT_SCANNER = AchievementScanner()
+
+def score_achievement_captures(captures):
+    """AchievementScanner.scan()の結果から定量的成果のスコアを計算（0.0〜1.0）"""
     score = 0.0
 
     # ============================================
@@ -614,11 +844,7 @@ def extract_quantitative_achievement_score(text):
     # ============================================
 
     # パターン1-1: ◯%向上/増加/改善/達成/上昇
-    percentage_positive = re.findall(
-        r'(\d+(?:\.\d+)?)%?(?:％)?(?:向上|増加|改善|達成|上昇|伸び|アップ|UP|成長|拡大|上がった|高まった)',
-        text_str
-    )
-    for match in percentage_positive:
+    for match in captures['percentage_positive']:
         value = float(match)
         if value >= 100:
             score += 0.35  # 100%以上（2倍以上）
@@ -636,11 +862,7 @@ def extract_quantitative_achievement_score(text):
             score += 0.05  # 5%未満
 
     # パターン1-2: ◯%削減/減少/短縮（コスト削減・効率化）
-    percentage_reduction = re.findall(
-        r'(\d+(?:\.\d+)?)%?(?:％)?(?:削減|減少|短縮|カット|削った|減らした|低減)',
-        text_str
-    )
-    for match in percentage_reduction:
+    for match in captures['percentage_reduction']:
         value = float(match)
         if value >= 50:
             score += 0.30
@@ -654,11 +876,7 @@ def extract_quantitative_achievement_score(text):
             score += 0.10
 
     # パターン1-3: ◯ポイント向上（満足度など）
-    point_increase = re.findall(
-        r'(\d+(?:\.\d+)?)(?:ポイント|pt|点)(?:向上|上昇|アップ|増加|改善)',
-        text_str
-    )
-    for match in point_increase:
+    for match in captures['point_increase']:
         value = float(match)
         if value >= 20:
             score += 0.25
@@ -674,8 +892,7 @@ def extract_quantitative_achievement_score(text):
     # ============================================
 
     # パターン2-1: ◯倍
-    multiplier = re.findall(r'(\d+(?:\.\d+)?)倍', text_str)
-    for match in multiplier:
+    for match in captures['multiplier']:
         value = float(match)
         if value >= 5:
             score += 0.35  # 5倍以上
@@ -691,32 +908,23 @@ def extract_quantitative_achievement_score(text):
     # ============================================
 
     # パターン3-1: ◯人（対象者数）
-    people_patterns = [
-        r'(\d+)人(?:以上)?(?:の|を|に|へ)?(?:生徒|学生|社員|メンバー|顧客|お客様|参加者|受講者)',
-        r'(?:生徒|学生|社員|メンバー|顧客|お客様|参加者|受講者)(?:数)?(?:が)?(\d+)人',
-        r'(\d+)名(?:の|を|に|へ)?(?:生徒|学生|社員|メンバー|顧客|お客様|参加者|受講者)',
-    ]
-
-    for pattern in people_patterns:
-        people_matches = re.findall(pattern, text_str)
-        for match in people_matches:
-            value = int(match)
-            if value >= 200:
-                score += 0.25  # 200人以上
-            elif value >= 100:
-                score += 0.20  # 100-200人
-            elif value >= 50:
-                score += 0.15  # 50-100人
-            elif value >= 20:
-                score += 0.10  # 20-50人
-            elif value >= 10:
-                score += 0.08  # 10-20人
-            else:
-                score += 0.05  # 10人未満
+    for match in captures['people']:
+        value = int(match)
+        if value >= 200:
+            score += 0.25  # 200人以上
+        elif value >= 100:
+            score += 0.20  # 100-200人
+        elif value >= 50:
+            score += 0.15  # 50-100人
+        elif value >= 20:
+            score += 0.10  # 20-50人
+        elif value >= 10:
+            score += 0.08  # 10-20人
+        else:
+            score += 0.05  # 10人未満
 
     # パターン3-2: チーム規模
-    team_patterns = re.findall(r'(\d+)人(?:チーム|のチーム|規模|体制|メンバー構成)', text_str)
-    for match in team_patterns:
+    for match in captures['team']:
         value = int(match)
         if value >= 20:
             score += 0.15
@@ -730,26 +938,11 @@ def extract_quantitative_achievement_score(text):
     # ============================================
 
     # パターン4-1: 売上・利益
-    money_patterns = [
-        r'(\d+)(?:万|億)?円(?:の)?(?:売上|売り上げ|利益|収益|収入)',
-        r'(?:売上|売り上げ|利益|収益|収入)(?:が)?(\d+)(?:万|億)?円',
-        r'(\d+)(?:万|億)(?:円)?(?:の)?(?:売上|売り上げ|利益|収益|収入)',
-    ]
-
-    has_money_achievement = False
-    for pattern in money_patterns:
-        money_matches = re.findall(pattern, text_str)
-        if money_matches:
-            has_money_achievement = True
-            score += 0.20  # 金額を伴う成果
-            break
+    if captures['money']:
+        score += 0.20  # 金額を伴う成果
 
     # パターン4-2: コスト削減
-    cost_reduction = re.findall(
-        r'(\d+)(?:万|億)?円(?:の)?(?:削減|コスト削減|経費削減|節約)',
-        text_str
-    )
-    if cost_reduction:
+    if captures['cost_reduction']:
         score += 0.20
 
     # ============================================
@@ -757,32 +950,21 @@ def extract_quantitative_achievement_score(text):
     # ============================================
 
     # パターン5-1: 順位
-    ranking_patterns = [
-        r'(?:第)?([1-3])位(?:を)?(?:獲得|達成|入賞)',
-        r'([1-3])位(?:に)?(?:なった|なり|入った)',
-        r'(?:全国|地区|県|市|学内)(?:で)?([1-3])位',
-    ]
-
-    for pattern in ranking_patterns:
-        ranking_matches = re.findall(pattern, text_str)
-        for match in ranking_matches:
-            rank = int(match)
-            if rank == 1:
-                score += 0.30  # 1位
-            elif rank == 2:
-                score += 0.20  # 2位
-            elif rank == 3:
-                score += 0.15  # 3位
+    for match in captures['ranking']:
+        rank = int(match)
+        if rank == 1:
+            score += 0.30  # 1位
+        elif rank == 2:
+            score += 0.20  # 2位
+        elif rank == 3:
+            score += 0.15  # 3位
 
     # パターン5-2: トップ
-    if re.search(r'(?:トップ|TOP|No\.1|ナンバーワン)', text_str):
+    if captures['top']:
         score += 0.25
 
     # パターン5-3: 優勝・入賞
-    awards = re.findall(
-        r'(?:優勝|準優勝|入賞|受賞|表彰|金賞|銀賞|銅賞|最優秀賞|優秀賞)',
-        text_str
-    )
+    awards = captures['awards']
     if '優勝' in awards:
         score += 0.30
     elif '準優勝' in awards or '金賞' in awards or '最優秀賞' in awards:
@@ -795,11 +977,7 @@ def extract_quantitative_achievement_score(text):
     # ============================================
 
     # パターン6-1: 目標達成率
-    achievement_rate = re.findall(
-        r'(?:目標)?(?:達成率)(?:が)?(\d+(?:\.\d+)?)%',
-        text_str
-    )
-    for match in achievement_rate:
+    for match in captures['achievement_rate']:
         value = float(match)
         if value >= 120:
             score += 0.25  # 120%以上達成
@@ -809,7 +987,7 @@ def extract_quantitative_achievement_score(text):
             score += 0.10  # 80%以上
 
     # パターン6-2: 目標達成（定性的）
-    if re.search(r'目標(?:を)?(?:達成|クリア|突破|超え)', text_str):
+    if captures['goal_achieved']:
         score += 0.15
 
     # ============================================
@@ -817,11 +995,7 @@ def extract_quantitative_achievement_score(text):
     # ============================================
 
     # パターン7-1: 連続記録
-    consecutive = re.findall(
-        r'(\d+)(?:ヶ月|か月|ヵ月|カ月|年|週)(?:連続|継続)',
-        text_str
-    )
-    for match in consecutive:
+    for match in captures['consecutive']:
         value = int(match)
         if value >= 12:
             score += 0.20  # 12ヶ月以上連続
@@ -831,11 +1005,7 @@ def extract_quantitative_achievement_score(text):
             score += 0.10  # 3-6ヶ月連続
 
     # パターン7-2: 期間内での成果
-    time_based = re.findall(
-        r'(\d+)(?:ヶ月|か月|週間|日)(?:で|以内に)(?:達成|実現|完成|完了)',
-        text_str
-    )
-    if time_based:
+    if captures['time_based']:
         score += 0.10  # 期限を意識した成果
 
     # ============================================
@@ -843,19 +1013,11 @@ def extract_quantitative_achievement_score(text):
     # ============================================
 
     # パターン8-1: 満足度スコア
-    satisfaction_score = re.findall(
-        r'(?:満足度|評価)(?:が)?(\d+(?:\.\d+)?)(?:点|/10|/5)',
-        text_str
-    )
-    if satisfaction_score:
+    if captures['satisfaction_score']:
         score += 0.15
 
     # パターン8-2: 参加者数・応募者数
-    participant_numbers = re.findall(
-        r'(\d+)人(?:が|の)?(?:参加|応募|エントリー|集まった)',
-        text_str
-    )
-    for match in participant_numbers:
+    for match in captures['participant_numbers']:
         value = int(match)
         if value >= 100:
             score += 0.15
@@ -865,11 +1027,7 @@ def extract_quantitative_achievement_score(text):
             score += 0.10
 
     # パターン8-3: 回数・頻度
-    frequency = re.findall(
-        r'(\d+)回(?:以上)?(?:実施|開催|実行|達成)',
-        text_str
-    )
-    for match in frequency:
+    for match in captures['frequency']:
         value = int(match)
         if value >= 50:
             score += 0.15
@@ -879,11 +1037,7 @@ def extract_quantitative_achievement_score(text):
             score += 0.10
 
     # パターン8-4: 合格率・成功率
-    success_rate = re.findall(
-        r'(?:合格率|成功率|達成率)(?:が)?(\d+(?:\.\d+)?)%',
-        text_str
-    )
-    if success_rate:
+    if captures['success_rate']:
         score += 0.15
 
     # ============================================
@@ -891,9 +1045,24 @@ def extract_quantitative_achievement_score(text):
     # ============================================
 
     # スコアの上限を1.0に制限
-    final_score = min(score, 1.0)
+    return min(score, 1.0)
 
-    return final_score
+def extract_quantitative_achievement_score(text):
+    """
+    定量的成果のスコアを計算（網羅的パターン対応）
+
+    パターン群の抽出はACHIEVEMENT_SCANNER、加点はscore_achievement_capturesで行う
+
+    Args:
+        text (str): ES本文
+
+    Returns:
+        float: 成果スコア（0.0〜1.0）
+    """
+    if pd.isna(text) or not text:
+        return 0.0
+
+    return score_achievement_captures(ACHIEVEMENT_SCANNER.scan(str(text)))
 
 def calculate_detail_score(text):
     """
@@ -1165,159 +1334,1303 @@ def calculate_detail_score(text):
 
     return final_score
 
-def load_csv_data(csv_path):
-    """CSVデータを読み込んで整形"""
-    global es_data, vectorizer, tfidf_matrix, sentence_model
+# ============================================
+# ES本文の分析結果（取り込み時・クエリ時で共通）
+# ============================================
 
-    print(f"\n📂 CSVデータを読み込み中: {csv_path}")
-    df = pd.read_csv(csv_path)
-    print(f"✅ {len(df)}件のデータを読み込みました")
+class DocumentProfile:
+    """
+    1件のES本文の分析結果をまとめたもの
 
-    # 🆕 データソース別の統計を表示
-    if 'data_source' in df.columns:
-        print("\n📊 データソース別の内訳:")
-        source_counts = df['data_source'].value_counts()
-        for source, count in source_counts.items():
-            print(f"  - {source}: {count}件")
+    キーワード辞書の照合（find_keywords）は1回だけ行い、テーマ・エピソードタイプ・
+    強み弱み・STAR構造の抽出とTF-IDFのキーワードブーストで共有する。取り込み時の各ESと
+    /analyzeの入力ESの両方でこのクラスを使い、入力ESは1リクエストにつき1回だけ分析する
+    """
 
-    print("🔧 データ整形中...")
+    __slots__ = (
+        'themes', 'episode_info', 'episode_types_multi', 'strengths_weaknesses',
+        'structure', 'achievement_score', 'detail_score', 'keywords'
+    )
 
-    es_data = pd.DataFrame({
-        'company_name': df['p-company-summary__name'].apply(clean_text),
-        'industry': df['p-company-summary__stage-sub'].apply(remove_prefix),
-        'title': df['p-company-heading-contents__title'].apply(clean_text),
-        'user_info': df.get('c-panel-variant2__header-user', pd.Series()).apply(clean_text),
-        'question_1': df['u-font-light'].apply(clean_text),
-        'answer_1': df['c-show-more__content'].apply(clean_text),
-        'question_2': df.get('u-font-light (2)', pd.Series()).apply(clean_text),
-        'answer_2': df.get('c-show-more__content (2)', pd.Series()).apply(clean_text),
-        'question_3': df.get('u-font-light (3)', pd.Series()).apply(clean_text),
-        'answer_3': df.get('c-show-more__content (3)', pd.Series()).apply(clean_text),
-        'avg_salary': df.get('p-company-table (11)', pd.Series()).apply(clean_text),
-        'employee_count': df.get('p-company-summary__stage-sub (3)', pd.Series()).apply(remove_prefix),
-        # 🆕 データソース情報を保持
-        'data_source': df.get('data_source', pd.Series(dtype='object')),
-        'original_url': df.get('original_url', pd.Series(dtype='object'))
-    })
+    def __init__(self, text):
+        found = find_keywords(text) if not pd.isna(text) and text else set()
 
-    es_data['university'] = es_data['user_info'].apply(extract_university)
+        self.themes = categorize_es_themes(text, found)
+        self.episode_info = classify_episode_type(text, found)
+        self.episode_types_multi = classify_multiple_episode_types(text, top_n=2, found=found)
+        self.strengths_weaknesses = extract_strengths_and_weaknesses(text, found)
+        self.structure = analyze_es_structure(text, found)
+        self.achievement_score = extract_quantitative_achievement_score(text)
+        self.detail_score = calculate_detail_score(text)
+        self.keywords = found
 
-    es_data['result_status'] = es_data['title'].apply(
-        lambda x: '内定' if '内定' in str(x) else ('通過' if '通過' in str(x) else '不明')
-    )
+    def structure_vector(self):
+        """STAR構造のキーワード数（STRUCTURE_KEYS順のint32配列）"""
+        return np.array([self.structure[key] for key in STRUCTURE_KEYS], dtype=np.int32)
 
-    es_data = es_data[es_data['result_status'].isin(['通過', '内定'])]
+# ============================================
+# TF-IDF（テーマキーワードのブースト）
+# ============================================
 
-    es_data['combined_answer'] = (
-        es_data['answer_1'].fillna('') + ' ' +
-        es_data['answer_2'].fillna('') + ' ' +
-        es_data['answer_3'].fillna('')
-    ).str.strip()
+# TF-IDFベクトル化のパラメータ（語彙の選定はfit_tfidf_vectorizerで行う）
+TFIDF_PARAMS = {
+    'max_features': 3000,  # 1000 → 3000に増加
+    'min_df': 2,
+    'max_df': 0.8,
+    'ngram_range': (1, 3)  # (1,2) → (1,3)に拡張
+}
 
-    es_data = es_data[es_data['combined_answer'].str.len() > 50]
+# テーマキーワードごとの辞書内の出現数（複数テーマに含まれるキーワードはその分ブーストする）
+THEME_KEYWORD_MULTIPLICITY = {}
+for _keywords in ES_THEME_CATEGORIES.values():
+    for _keyword in _keywords:
+        THEME_KEYWORD_MULTIPLICITY[_keyword] = THEME_KEYWORD_MULTIPLICITY.get(_keyword, 0) + 1
 
-    print(f"✅ 有効なESデータ: {len(es_data)}件")
+def keyword_boost_matrix(keyword_sets, vocabulary, boost=None):
+    """
+    各文書で出現したテーマキーワードの語（トークン）にブースト量を加算する疎行列
 
-    # テーマカテゴリ分析を追加
-    print("🔧 ESのテーマ分析中...")
-    es_data['themes'] = es_data['combined_answer'].apply(categorize_es_themes)
+    Args:
+        keyword_sets: 各文書のfind_keywords()の結果
+        vocabulary: 語 → 列番号
+        boost: 1出現あたりの加算量（省略時はTFIDF_KEYWORD_BOOST）
 
-    # エピソードタイプ分析を追加
-    print("🔧 エピソードタイプ分析中...")
-    es_data['episode_type'] = es_data['combined_answer'].apply(classify_episode_type)
-    es_data['episode_types_multi'] = es_data['combined_answer'].apply(
-        lambda x: classify_multiple_episode_types(x, top_n=2)
-    )
+    Returns:
+        csr_matrix: (文書数, 語彙数)
+    """
+    boost = TFIDF_KEYWORD_BOOST if boost is None else boost
+    tokenize = CountVectorizer().build_analyzer()
+
+    rows, cols, values = [], [], []
+    for row, found in enumerate(keyword_sets):
+        for keyword in found:
+            multiplicity = THEME_KEYWORD_MULTIPLICITY.get(keyword)
+            if not multiplicity:
+                continue
+            for token in tokenize(keyword):
+                col = vocabulary.get(token)
+                if col is not None:
+                    rows.append(row)
+                    cols.append(col)
+                    values.append(boost * multiplicity)
+
+    return sparse.csr_matrix((values, (rows, cols)), shape=(len(keyword_sets), len(vocabulary)), dtype=np.float64)
+
+def fit_tfidf_vectorizer(texts, keyword_sets):
+    """
+    本文の語の出現回数にテーマキーワードのブーストを加えてTF-IDFを学習
 
-    # 強み・弱みの抽出を追加
-    print("🔧 強み・弱み分析中...")
-    es_data['strengths_weaknesses'] = es_data['combined_answer'].apply(extract_strengths_and_weaknesses)
+    語彙の選定（min_df / max_df / max_features）とIDFはブースト後の出現回数で計算し、
+    語彙とIDFを固定したTfidfVectorizerを返す（transform_tfidfでクエリ側も同じ変換を行う）
 
-    # エピソードタイプの統計を出力
-    episode_type_counts = {}
-    for episode_info in es_data['episode_type']:
-        episode_type = episode_info['type']
-        episode_type_counts[episode_type] = episode_type_counts.get(episode_type, 0) + 1
+    Returns:
+        tuple: (TfidfVectorizer, TF-IDF行列)
+    """
+    n_docs = len(texts)
+
+    # 本文の語の出現回数（テーマキーワードの語は本文に出現しなくても語彙に加える）
+    counter = CountVectorizer(ngram_range=TFIDF_PARAMS['ngram_range'], min_df=TFIDF_PARAMS['min_df'])
+    counts = counter.fit_transform(texts).astype(np.float64)
+    vocabulary = dict(counter.vocabulary_)
+    tokenize = CountVectorizer().build_analyzer()
+    for keyword in THEME_KEYWORD_MULTIPLICITY:
+        for token in tokenize(keyword):
+            vocabulary.setdefault(token, len(vocabulary))
+    counts.resize((n_docs, len(vocabulary)))
+    counts = (counts + keyword_boost_matrix(keyword_sets, vocabulary)).tocsc()
+
+    # ブースト後の文書頻度・出現回数で語彙を選定
+    document_frequency = np.diff(counts.indptr)
+    keep = (document_frequency >= TFIDF_PARAMS['min_df']) & (document_frequency <= TFIDF_PARAMS['max_df'] * n_docs)
+    kept_columns = np.flatnonzero(keep)
+    term_frequency = np.asarray(counts[:, kept_columns].sum(axis=0)).ravel()
+    kept_columns = kept_columns[np.argsort(-term_frequency, kind='stable')[:TFIDF_PARAMS['max_features']]]
+
+    terms = np.empty(len(vocabulary), dtype=object)
+    for term, col in vocabulary.items():
+        terms[col] = term
+    order = np.argsort(terms[kept_columns])
+    kept_columns = kept_columns[order]
+    counts = counts[:, kept_columns].tocsr()
+
+    # 語彙とIDF（smooth_idf）を固定したTfidfVectorizer
+    vectorizer = TfidfVectorizer(ngram_range=TFIDF_PARAMS['ngram_range'], vocabulary={
+        term: i for i, term in enumerate(terms[kept_columns])
+    })
+    vectorizer.fit([''])
+    document_frequency = np.diff(counts.tocsc().indptr)
+    vectorizer.idf_ = np.log((1 + n_docs) / (1 + document_frequency)) + 1
 
-    print("\n📊 エピソードタイプ別の分布:")
-    for episode_type, count in sorted(episode_type_counts.items(), key=lambda x: x[1], reverse=True)[:10]:
-        print(f"  - {episode_type}: {count}件")
+    return vectorizer, build_tfidf_matrix(counts.multiply(vectorizer.idf_))
 
-    # 重要キーワードの重み付けテキストを生成
-    print("\n🔧 キーワード重み付け中...")
-    es_data['weighted_answer'] = es_data['combined_answer'].apply(extract_theme_keywords_for_weighting)
+def build_tfidf_matrix(matrix):
+    """
+    TF-IDF行列をL2正規化済みのfloat32 CSR（列番号はソート済み）に変換する
 
-    print("🔧 TF-IDFベクトル化中（最適化済みパラメータ）...")
-    vectorizer = TfidfVectorizer(
-        max_features=3000,  # 1000 → 3000に増加
-        min_df=2,
-        max_df=0.8,
-        ngram_range=(1, 3)  # (1,2) → (1,3)に拡張
-    )
+    起動時に一度だけ変換しておけば、クエリのスコアは疎行列とベクトルの内積1回で計算でき、
+    cosine_similarityによるリクエストごとの再正規化が不要になる（メモリも約半分）
+    """
+    matrix = sparse.csr_matrix(matrix, dtype=np.float32)
+    matrix = normalize(matrix, norm='l2', copy=False)
+    matrix.sum_duplicates()
+    matrix.sort_indices()
+    return matrix
 
-    # 重み付けされたテキストを使用してベクトル化
-    tfidf_matrix = vectorizer.fit_transform(es_data['weighted_answer'])
-    print(f"✅ ベクトル化完了: {tfidf_matrix.shape}")
+def tfidf_scores(input_vector, matrix):
+    """
+    正規化済みTF-IDF行列と入力ベクトル（1行）のコサイン類似度
 
-    # ============================================
-    # セマンティックエンベディング生成（Sentence-BERT）
-    # ============================================
-    print("🔧 セマンティックエンベディング生成中...")
-    try:
-        from sentence_transformers import SentenceTransformer
-        import time
+    Args:
+        input_vector: transform_tfidfの結果（1行、L2正規化済み）
+        matrix: build_tfidf_matrixの結果
 
-        # tqdmのインポート（進捗表示用）
-        try:
-            from tqdm import tqdm
-            has_tqdm = True
-        except ImportError:
-            print("  ⚠️ tqdmがインストールされていません。進捗表示なしで実行します。")
-            has_tqdm = False
+    Returns:
+        np.ndarray: 各行の類似度（float64）
+    """
+    query = np.asarray(input_vector.toarray(), dtype=np.float32).ravel()
+    return (matrix @ query).astype(np.float64)
 
-        # 1. モデルのロード
-        if sentence_model is None:
-            print("  📥 セマンティックモデルをダウンロード中...")
-            # 軽量モデルを使用（384次元、約2倍速い）
-            sentence_model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
+def transform_tfidf(texts, keyword_sets=None):
+    """
+    本文をTF-IDFベクトルに変換（テーマキーワードの語に出現回数のブーストを加える）
 
-            # GPU対応（利用可能な場合）
-            try:
-                import torch
-                device = 'cuda' if torch.cuda.is_available() else 'cpu'
-                print(f"  🖥️  使用デバイス: {device}")
-                sentence_model = sentence_model.to(device)
-            except ImportError:
-                print("  🖥️  使用デバイス: cpu")
+    Args:
+        texts: 本文のリスト（重み付け用の文字列の付け足しはしない）
+        keyword_sets: 各本文のfind_keywords()の結果（省略時は照合する）
+    """
+    if keyword_sets is None:
+        keyword_sets = [find_keywords(text) for text in texts]
 
-            print("  ✅ モデルロード完了")
+    counts = CountVectorizer.transform(vectorizer, texts).astype(np.float64)
+    counts = counts + keyword_boost_matrix(keyword_sets, vectorizer.vocabulary_)
+    return build_tfidf_matrix(counts.multiply(vectorizer.idf_))
 
-        # 2. まず100件でテスト（所要時間の予測）
-        print("\n  🧪 テスト: 最初の100件を処理して所要時間を予測...")
-        test_start = time.time()
-        test_count = min(100, len(es_data))
-        test_texts = es_data['weighted_answer'].head(test_count).apply(lambda x: str(x)[:512]).tolist()
-        test_embeddings = sentence_model.encode(
-            test_texts,
-            convert_to_tensor=False,
-            show_progress_bar=False,
-            batch_size=32
-        )
-        test_time = time.time() - test_start
+# ============================================
+# 転置インデックス（TF-IDFの候補生成）
+# ============================================
 
-        estimated_total_time = (test_time / test_count) * len(es_data)
-        print(f"  ⏱️  {test_count}件の処理時間: {test_time:.2f}秒")
-        print(f"  📊 予想所要時間: {estimated_total_time / 60:.1f}分")
+class InvertedIndex:
+    """
+    正規化済みTF-IDF行列の転置インデックス（MaxScore方式の上限による上位k件の枝刈り）
 
-        # 3. 全データをバッチ処理
-        print(f"\n  🚀 全データのエンベディング生成中（{len(es_data)}件）...")
+    語ごとのポスティングリストを重みの降順（インパクト順）に並べ、語ごとの重みの上限（max_weights）を持つ。
+    検索時は寄与（クエリの重み × 文書の重み）の大きいポスティングから順に読み、
+    - 読み終えた部分までの部分スコアで仮の上位k件を選び、その正確なスコアのk件目を閾値とする
+    - 各リストの未読部分の上限（次のポスティングの寄与）の合計が閾値を下回ったら読むのをやめる
+    - 「部分スコア + まだ読んでいないリストの上限」が閾値に届かない文書は候補から外す
+    残った候補は行列の行を取り出して正確にスコアを計算するため、
+    返す上位k件は全件スキャン（tfidf_scores）と一致する
 
-        # テキストを一括で準備（長さ制限を512文字に）
-        all_texts = es_data['weighted_answer'].apply(lambda x: str(x)[:512]).tolist()
+    Args:
+        matrix: build_tfidf_matrixの結果（行はes_dataの行位置と対応）
+    """
 
-        # バッチサイズの設定
-        batch_size = 32  # CPUの場合は16-32が最適
-        all_embeddings = []
+    # 浮動小数点誤差で閾値ちょうどの文書を落とさないための余裕
+    BOUND_SLACK = 1e-5
+    # 1回の読み進めで寄与の下限をこの倍率で下げる
+    IMPACT_DECAY = 0.3
+
+    def __init__(self, matrix=None):
+        self.matrix = None
+        self.indptr = None
+        self.postings = None  # 語ごとの文書の行位置（重みの降順）
+        self.weights = None  # postingsと同じ並びの重み
+        self.max_weights = None  # 語ごとの重みの上限
+        if matrix is not None:
+            self.build(matrix)
+
+    def __len__(self):
+        return 0 if self.matrix is None else self.matrix.shape[0]
+
+    def build(self, matrix):
+        """行列を列方向に並べ替えてポスティングリストを構築する"""
+        self.matrix = matrix
+        csc = matrix.tocsc()
+        n_terms = csc.shape[1]
+        term_ids = np.repeat(np.arange(n_terms), np.diff(csc.indptr))
+        order = np.lexsort((-csc.data, term_ids))
+        self.indptr = csc.indptr.astype(np.int64)
+        self.postings = csc.indices[order].astype(np.int32)
+        self.weights = csc.data[order].astype(np.float32)
+        self.max_weights = np.zeros(n_terms, dtype=np.float32)
+        non_empty = np.flatnonzero(np.diff(self.indptr))
+        self.max_weights[non_empty] = self.weights[self.indptr[non_empty]]
+        return self
+
+    def candidates(self, query_vector, k):
+        """
+        上位k件に入りうる文書の行位置（昇順）
+
+        Args:
+            query_vector: transform_tfidfの結果（1行）
+            k: 取得件数
+        """
+        query = sparse.csr_matrix(query_vector)
+        terms = query.indices
+        query_weights = query.data.astype(np.float32)
+        n = len(self)
+        if len(terms) == 0 or k <= 0:
+            return np.empty(0, dtype=np.int64)
+
+        # 語ごとのリスト（重みは符号を反転して昇順にし、searchsortedで読む位置を求める）
+        negative_weights = [-self.weights[self.indptr[t]:self.indptr[t + 1]] for t in terms]
+        postings = [self.postings[self.indptr[t]:self.indptr[t + 1]] for t in terms]
+        dense_query = np.zeros(self.matrix.shape[1], dtype=np.float32)
+        dense_query[terms] = query_weights
+
+        min_impact = float((query_weights * self.max_weights[terms]).max()) * self.IMPACT_DECAY
+        while min_impact > 1e-6:
+            # 寄与がmin_impact以上のポスティングを読み、未読部分の上限を求める
+            counts = [
+                int(np.searchsorted(weights, -min_impact / w, side='right'))
+                for weights, w in zip(negative_weights, query_weights)
+            ]
+            remaining = np.array([
+                -weights[count] * w if count < len(weights) else 0.0
+                for weights, count, w in zip(negative_weights, counts, query_weights)
+            ])
+            remaining_bound = float(remaining.sum())
+
+            if sum(counts) >= k:
+                docs = np.concatenate([p[:count] for p, count in zip(postings, counts)])
+                impacts = np.concatenate([
+                    -weights[:count] * w for weights, count, w in zip(negative_weights, counts, query_weights)
+                ])
+                partial = np.bincount(docs, weights=impacts, minlength=n)
+
+                # 閾値: 部分スコアの上位k件の正確なスコアのうち最小のもの（実在するk件なので上位k件の下限になる）
+                threshold = float((self.matrix[select_top_k(partial, k)] @ dense_query).min()) - self.BOUND_SLACK
+                if remaining_bound < threshold:
+                    # 文書ごとの上限 = 部分スコア + 読んだリストを除いた未読部分の上限
+                    seen_bound = np.bincount(docs, weights=np.repeat(remaining, counts), minlength=n)
+                    return np.flatnonzero(partial + remaining_bound - seen_bound >= threshold)
+
+            min_impact *= self.IMPACT_DECAY
+
+        return np.arange(n, dtype=np.int64)
+
+    def search(self, query_vector, k):
+        """
+        上位k件の行位置と類似度を返す（スコアの降順、同点は行位置の昇順）
+
+        Returns:
+            tuple: (行位置の配列, 類似度の配列)
+        """
+        positions = self.candidates(query_vector, k)
+        if len(positions) == 0:
+            return positions, np.empty(0, dtype=np.float64)
+        scores = tfidf_scores(query_vector, self.matrix[positions])
+        top = select_top_k(scores, k)
+        return positions[top], scores[top]
+
+def build_tfidf_index():
+    """tfidf_matrixから転置インデックスを構築する（TFIDF_SEARCH_MODEが'inverted'の場合）"""
+    global tfidf_index
+
+    if TFIDF_SEARCH_MODE != 'inverted' or tfidf_matrix is None:
+        tfidf_index = None
+        return None
+
+    start = time.time()
+    tfidf_index = InvertedIndex(tfidf_matrix)
+    print(f"  ✅ TF-IDF転置インデックス: {len(tfidf_index)}件, {time.time() - start:.1f}秒")
+    return tfidf_index
+
+def compute_tfidf_similarities(input_vector, candidate_count):
+    """
+    全ESとのTF-IDF類似度を計算
+
+    TFIDF_SEARCH_MODEが'inverted'で転置インデックスが構築されている場合は、
+    上位candidate_count件のみ類似度を埋め、それ以外は0とする
+
+    Args:
+        input_vector: transform_tfidfの結果（1行）
+        candidate_count: 転置インデックスで取得する候補数
+
+    Returns:
+        np.ndarray: es_dataの行位置に対応する類似度
+    """
+    if TFIDF_SEARCH_MODE == 'inverted' and tfidf_index is not None:
+        positions, similarities = tfidf_index.search(input_vector, candidate_count)
+        tfidf_similarities = np.zeros(len(tfidf_index))
+        tfidf_similarities[positions] = similarities
+        return tfidf_similarities
+
+    return tfidf_scores(input_vector, tfidf_matrix)
+
+# ============================================
+# エンベディングストア
+# ============================================
+
+def build_embedding_matrix(embeddings):
+    """
+    エンベディングを1つの連続したfloat32行列にまとめ、各行をL2正規化する
+
+    起動時に一度だけ構築し、リクエストごとのnp.vstackと
+    cosine_similarityによる再正規化を不要にする
+
+    Args:
+        embeddings: エンベディングの配列またはリスト（es_dataの行順）
+
+    Returns:
+        np.ndarray: (ES件数, 次元数) のC連続float32行列
+    """
+    matrix = np.array(embeddings, dtype=np.float32, order='C')
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+def sample_recall_queries(matrix, n_queries=200, noise=0.05, seed=0):
+    """インデックスの再現率の評価用クエリを生成（benchmark_vector_search.make_queriesと同じ方式）
+
+    行そのものをクエリにすると自身が必ず1位になり再現率が高く出るため、
+    ランダムに選んだ行にノイズを加えて再正規化したものを使う
+    """
+    rng = np.random.default_rng(seed)
+    rows = np.asarray(matrix[np.sort(rng.choice(len(matrix), size=min(n_queries, len(matrix)), replace=False))])
+    return build_embedding_matrix(rows + rng.normal(scale=noise, size=rows.shape))
+
+def is_normalized_embedding_matrix(matrix, sample_size=1000):
+    """float32で各行がL2正規化済みか（先頭sample_size行で確認）"""
+    if matrix.dtype != np.float32 or matrix.ndim != 2:
+        return False
+    norms = np.linalg.norm(np.asarray(matrix[:sample_size]), axis=1)
+    return bool(np.all(np.abs(norms - 1.0) < 1e-3))
+
+def normalize_query_embedding(embedding):
+    """クエリのエンベディングをfloat32に変換してL2正規化する"""
+    vector = np.asarray(embedding, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector = vector / norm
+    return vector
+
+# ============================================
+# 近似最近傍探索インデックス（HNSW）
+# ============================================
+
+class HNSWIndex:
+    """
+    セマンティックエンベディング用のHNSWグラフインデックス（numpyのみで実装）
+
+    ベクトルはL2正規化済みを前提とし、内積（=コサイン類似度）が大きいほど近いとみなす。
+    保存時はto_state()でグラフ構造のみを辞書にし（クラス自体はpickleしない）、
+    読み込み後はfrom_state()で復元してattach_vectors()でembedding_matrixを再接続する
+
+    Args:
+        M: 第1層以上で各ノードが持つリンク数（第0層は最大2*M）
+        ef_construction: 構築時の探索幅
+        ef_search: 検索時の探索幅（大きいほど再現率が上がり、遅くなる）
+        seed: 層の割り当てに使う乱数シード
+    """
+
+    def __init__(self, M=16, ef_construction=100, ef_search=64, seed=42):
+        self.M = M
+        self.max_links_0 = M * 2
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.seed = seed
+        self.level_mult = 1.0 / np.log(M)
+        self.vectors = None
+        self.node_levels = None
+        self.layers = []  # 層ごとの {ノード: 近傍ノードのint32配列}
+        self.entry_point = -1
+        self.max_level = -1
+
+    def __len__(self):
+        return 0 if self.node_levels is None else len(self.node_levels)
+
+    def to_state(self):
+        """グラフ構造を辞書にする（ベクトル本体は含めない）
+
+        app / src.appのどちらで読み込んでもpickleを復元できるよう、辞書・numpy配列のみで構成する
+        """
+        state = self.__dict__.copy()
+        del state['vectors']
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        """to_state()の辞書からインデックスを復元する"""
+        index = cls(M=state['M'], ef_construction=state['ef_construction'], ef_search=state['ef_search'], seed=state['seed'])
+        index.__dict__.update(state)
+        return index
+
+    def attach_vectors(self, vectors):
+        """グラフと同じ行順のベクトル行列を接続する"""
+        if len(vectors) != len(self):
+            raise ValueError(f"ベクトル数({len(vectors)})とインデックスのノード数({len(self)})が一致しません")
+        self.vectors = vectors
+
+    def build(self, vectors):
+        """全ベクトルを順に挿入してグラフを構築する"""
+        n = len(vectors)
+        rng = np.random.default_rng(self.seed)
+        self.vectors = vectors
+        self.node_levels = np.floor(-np.log(1.0 - rng.random(n)) * self.level_mult).astype(np.int32)
+        self.layers = [{} for _ in range(int(self.node_levels.max()) + 1)] if n > 0 else []
+        self.entry_point = -1
+        self.max_level = -1
+
+        for node in range(n):
+            self._insert(node)
+
+        return self
+
+    def _search_layer(self, query, entry_points, ef, level):
+        """1つの層を貪欲に探索し、(類似度, ノード)を類似度の降順で最大ef件返す"""
+        layer = self.layers[level]
+        visited = np.zeros(len(self.vectors), dtype=bool)
+        entry = np.asarray(entry_points, dtype=np.int64)
+        visited[entry] = True
+
+        entry_sims = (self.vectors[entry] @ query).tolist()
+        candidates = [(-sim, node) for sim, node in zip(entry_sims, entry.tolist())]
+        results = [(sim, node) for sim, node in zip(entry_sims, entry.tolist())]
+        heapq.heapify(candidates)
+        heapq.heapify(results)
+        while len(results) > ef:
+            heapq.heappop(results)
+
+        while candidates:
+            neg_sim, node = heapq.heappop(candidates)
+            if -neg_sim < results[0][0]:
+                break
+
+            neighbors = layer.get(node)
+            if neighbors is None or len(neighbors) == 0:
+                continue
+            neighbors = neighbors[~visited[neighbors]]
+            if len(neighbors) == 0:
+                continue
+            visited[neighbors] = True
+
+            neighbor_sims = self.vectors[neighbors] @ query
+            for sim, neighbor in zip(neighbor_sims.tolist(), neighbors.tolist()):
+                if len(results) < ef or sim > results[0][0]:
+                    heapq.heappush(candidates, (-sim, neighbor))
+                    heapq.heappush(results, (sim, neighbor))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+
+        return sorted(results, reverse=True)
+
+    def _select_neighbors(self, candidates, m):
+        """近傍選択ヒューリスティック（既に選んだノードの方が近い候補は後回しにする）"""
+        if len(candidates) <= m:
+            return [node for _, node in candidates]
+
+        nodes = [node for _, node in candidates]
+        sims = [sim for sim, _ in candidates]
+        candidate_vectors = self.vectors[nodes]
+        pairwise = candidate_vectors @ candidate_vectors.T
+
+        selected = []
+        pruned = []
+        for i in range(len(nodes)):
+            if len(selected) >= m:
+                break
+            if selected and pairwise[i, selected].max() > sims[i]:
+                pruned.append(i)
+                continue
+            selected.append(i)
+
+        # リンク数が足りない場合は除外した候補で補う
+        for i in pruned:
+            if len(selected) >= m:
+                break
+            selected.append(i)
+
+        return [nodes[i] for i in selected]
+
+    def _insert(self, node):
+        query = self.vectors[node]
+        level = int(self.node_levels[node])
+
+        if self.entry_point < 0:
+            for lc in range(level + 1):
+                self.layers[lc][node] = np.empty(0, dtype=np.int32)
+            self.entry_point = node
+            self.max_level = level
+            return
+
+        # 上位層は最近傍1件だけを辿って降りる
+        entry = [self.entry_point]
+        for lc in range(self.max_level, level, -1):
+            entry = [self._search_layer(query, entry, 1, lc)[0][1]]
+
+        for lc in range(min(level, self.max_level), -1, -1):
+            candidates = self._search_layer(query, entry, self.ef_construction, lc)
+            neighbors = self._select_neighbors(candidates, self.M)
+            max_links = self.max_links_0 if lc == 0 else self.M
+            layer = self.layers[lc]
+            layer[node] = np.array(neighbors, dtype=np.int32)
+
+            # 双方向リンクを張り、上限を超えたら近傍を選び直す
+            for neighbor in neighbors:
+                links = np.append(layer[neighbor], np.int32(node))
+                if len(links) > max_links:
+                    link_sims = self.vectors[links] @ self.vectors[neighbor]
+                    order = np.argsort(-link_sims)
+                    links = np.array(
+                        self._select_neighbors(list(zip(link_sims[order].tolist(), links[order].tolist())), max_links),
+                        dtype=np.int32
+                    )
+                layer[neighbor] = links
+
+            entry = [candidate for _, candidate in candidates]
+
+        for lc in range(self.max_level + 1, level + 1):
+            self.layers[lc][node] = np.empty(0, dtype=np.int32)
+        if level > self.max_level:
+            self.max_level = level
+            self.entry_point = node
+
+    def search(self, query, k=10, ef_search=None):
+        """
+        クエリに近いノードを最大k件返す
+
+        Args:
+            query: L2正規化済みのクエリベクトル
+            k: 返す件数
+            ef_search: 探索幅（Noneの場合はインスタンスの既定値、k未満にはしない）
+
+        Returns:
+            tuple: (行位置の配列, コサイン類似度の配列) 類似度の降順
+        """
+        if self.vectors is None or self.entry_point < 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        ef = max(ef_search or self.ef_search, k)
+        entry = [self.entry_point]
+        for lc in range(self.max_level, 0, -1):
+            entry = [self._search_layer(query, entry, 1, lc)[0][1]]
+
+        results = self._search_layer(query, entry, ef, 0)[:k]
+        positions = np.array([node for _, node in results], dtype=np.int64)
+        similarities = np.array([sim for sim, _ in results], dtype=np.float32)
+        return positions, similarities
+
+    def evaluate_recall(self, queries, k=10, ef_search=None):
+        """厳密な全件スキャンに対するrecall@kを計算する"""
+        k = min(k, len(self))
+        hits = 0
+        for query in queries:
+            exact = np.argpartition(-(self.vectors @ query), k - 1)[:k]
+            approx, _ = self.search(query, k=k, ef_search=ef_search)
+            hits += len(np.intersect1d(exact, approx))
+        return hits / max(k * len(queries), 1)
+
+def build_hnsw_index(M=16, ef_construction=100, report_recall=True):
+    """embedding_matrixからHNSWインデックスを構築する（前処理時に実行）"""
+    global hnsw_index
+
+    if embedding_matrix is None:
+        print("⚠️ エンベディングがないためHNSWインデックスを構築できません")
+        return None
+
+    print(f"🔧 HNSWインデックスを構築中（{len(embedding_matrix)}件, M={M}, ef_construction={ef_construction}）...")
+    start = time.time()
+    hnsw_index = HNSWIndex(M=M, ef_construction=ef_construction, ef_search=HNSW_EF_SEARCH).build(embedding_matrix)
+    print(f"  ✅ 構築完了: {time.time() - start:.1f}秒, {hnsw_index.max_level + 1}層")
+
+    if report_recall:
+        sample = sample_recall_queries(embedding_matrix)
+        for ef in (32, 64, 128, 256):
+            recall = hnsw_index.evaluate_recall(sample, k=10, ef_search=ef)
+            print(f"  📊 recall@10 (ef_search={ef}): {recall:.3f}")
+
+    return hnsw_index
+
+# ============================================
+# スカラー量子化インデックス（int8）
+# ============================================
+
+class QuantizedEmbeddingIndex:
+    """
+    セマンティックエンベディングのint8スカラー量子化インデックス
+
+    各次元を offset + scale * code（codeは-127〜127のint8）で近似し、
+    1段目は量子化行列で全件をスキャン、上位rerank件をfloat32ベクトルで正確に再計算する。
+    float32ベクトルは前処理済みの*_embeddings.npyをメモリマップで接続すれば、
+    常駐するのはint8行列（float32の1/4）だけになる
+
+    Args:
+        block_size: 1段目のスキャンでfloat32に展開する行数（キャッシュに収まる程度にする）
+    """
+
+    def __init__(self, block_size=256):
+        self.block_size = block_size
+        self.codes = None
+        self.scale = None
+        self.offset = None
+        self.vectors = None
+
+    def __len__(self):
+        return 0 if self.codes is None else len(self.codes)
+
+    def build(self, vectors):
+        """次元ごとの最小値・最大値からscale / offsetを決めて量子化する"""
+        self.vectors = vectors
+        low = np.min(vectors, axis=0).astype(np.float32)
+        high = np.max(vectors, axis=0).astype(np.float32)
+        self.offset = (high + low) / 2
+        self.scale = (high - low) / 254
+        self.scale[self.scale == 0] = 1.0
+        self.codes = np.empty(vectors.shape, dtype=np.int8)
+        for start in range(0, len(vectors), self.block_size):
+            block = (np.asarray(vectors[start:start + self.block_size], dtype=np.float32) - self.offset) / self.scale
+            self.codes[start:start + self.block_size] = np.clip(np.rint(block), -127, 127)
+        return self
+
+    def to_state(self):
+        """量子化データを辞書にする（npzで保存できるnumpy配列のみ）"""
+        return {'codes': self.codes, 'scale': self.scale, 'offset': self.offset}
+
+    @classmethod
+    def from_state(cls, state):
+        """to_state()の辞書からインデックスを復元する"""
+        index = cls()
+        index.codes = np.asarray(state['codes'], dtype=np.int8)
+        index.scale = np.asarray(state['scale'], dtype=np.float32)
+        index.offset = np.asarray(state['offset'], dtype=np.float32)
+        return index
+
+    def attach_vectors(self, vectors):
+        """再計算に使う（量子化前と同じ行順の）ベクトル行列を接続する"""
+        if len(vectors) != len(self):
+            raise ValueError(f"ベクトル数({len(vectors)})とインデックスの件数({len(self)})が一致しません")
+        self.vectors = vectors
+
+    def approximate_scores(self, query):
+        """量子化行列による全件の近似内積"""
+        query = np.asarray(query, dtype=np.float32)
+        scaled_query = self.scale * query
+        scores = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), self.block_size):
+            scores[start:start + self.block_size] = self.codes[start:start + self.block_size].astype(np.float32) @ scaled_query
+        return scores + float(self.offset @ query)
+
+    def search(self, query, k=100, rerank=None):
+        """
+        量子化スキャンの上位rerank件をfloat32ベクトルで再計算し、上位k件を返す
+
+        Returns:
+            tuple: (行位置の配列, 類似度の配列) 類似度の降順
+        """
+        k = min(k, len(self))
+        rerank = min(max(rerank or k, k), len(self))
+        approximate = self.approximate_scores(query)
+        candidates = np.sort(select_top_k(approximate, rerank))
+        if self.vectors is None:
+            scores = approximate[candidates]
+        else:
+            scores = np.asarray(self.vectors[candidates], dtype=np.float32) @ np.asarray(query, dtype=np.float32)
+        top = select_top_k(scores, k)
+        return candidates[top], scores[top]
+
+    def evaluate_recall(self, queries, k=100, rerank=None):
+        """厳密な全件スキャンに対するrecall@kを計算する"""
+        k = min(k, len(self))
+        hits = 0
+        for query in queries:
+            exact = np.argpartition(-(np.asarray(self.vectors) @ query), k - 1)[:k]
+            approx, _ = self.search(query, k=k, rerank=rerank)
+            hits += len(np.intersect1d(exact, approx))
+        return hits / max(k * len(queries), 1)
+
+def build_quantized_index(report_recall=True):
+    """embedding_matrixからint8量子化インデックスを構築する（前処理時に実行）"""
+    global quantized_index
+
+    if embedding_matrix is None:
+        print("⚠️ エンベディングがないためint8量子化インデックスを構築できません")
+        return None
+
+    print(f"🔧 int8量子化インデックスを構築中（{len(embedding_matrix)}件）...")
+    quantized_index = QuantizedEmbeddingIndex().build(embedding_matrix)
+    print(f"  ✅ 構築完了: {quantized_index.codes.nbytes / (1024 * 1024):.1f} MB（float32: {embedding_matrix.nbytes / (1024 * 1024):.1f} MB）")
+
+    if report_recall:
+        sample = sample_recall_queries(embedding_matrix)
+        for rerank in (100, 200, 400):
+            recall = quantized_index.evaluate_recall(sample, k=100, rerank=rerank)
+            print(f"  📊 recall@100 (rerank={rerank}): {recall:.3f}")
+
+    return quantized_index
+
+# ============================================
+# バイナリ符号インデックス（Hamming距離の事前絞り込み）
+# ============================================
+
+class BinaryEmbeddingIndex:
+    """
+    セマンティックエンベディングの1次元1ビットの符号（np.packbits）によるHamming距離の事前絞り込み
+
+    各次元の平均を引いた値の符号をビットにし（384次元なら1件48バイト）、
+    クエリとの排他的論理和のビット数（Hamming距離）が小さい上位rerank件だけを
+    float32ベクトルとのコサイン類似度で再計算する
+
+    ビット列は8バイト単位に詰めたuint64を語ごとに全件分連続して持ち（codesは(語数, 件数)）、
+    語ごとの排他的論理和とpopcountを全件まとめて計算する
+    """
+
+    def __init__(self):
+        self.center = None
+        self.codes = None
+        self.vectors = None
+
+    def __len__(self):
+        return 0 if self.codes is None else self.codes.shape[1]
+
+    def encode(self, vectors):
+        """ベクトル（1件または複数件）をuint64のビット列に変換する"""
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        bits = np.packbits(vectors > self.center, axis=1)
+        padding = -bits.shape[1] % 8
+        if padding:
+            bits = np.pad(bits, ((0, 0), (0, padding)))
+        return np.ascontiguousarray(bits).view(np.uint64)
+
+    def build(self, vectors):
+        """次元ごとの平均を中心にして全件を符号化する"""
+        self.vectors = vectors
+        self.center = np.asarray(vectors, dtype=np.float32).mean(axis=0)
+        self.codes = np.ascontiguousarray(self.encode(vectors).T)
+        return self
+
+    def hamming_distances(self, query):
+        """全件とのHamming距離"""
+        query_code = self.encode(query)[0]
+        distances = np.zeros(len(self), dtype=np.int32)
+        for word, query_word in zip(self.codes, query_code):
+            distances += popcount(word ^ query_word)
+        return distances
+
+    def search(self, query, k=100, rerank=None):
+        """
+        Hamming距離の小さい上位rerank件をfloat32ベクトルで再計算し、上位k件を返す
+
+        Returns:
+            tuple: (行位置の配列, 類似度の配列) 類似度の降順
+        """
+        k = min(k, len(self))
+        rerank = min(max(rerank or k, k), len(self))
+        candidates = np.sort(select_top_k(-self.hamming_distances(query), rerank))
+        scores = self.vectors[candidates] @ np.asarray(query, dtype=np.float32)
+        top = select_top_k(scores, k)
+        return candidates[top], scores[top]
+
+    def evaluate_recall(self, queries, k=100, rerank=None):
+        """厳密な全件スキャンに対するrecall@kを計算する"""
+        k = min(k, len(self))
+        hits = 0
+        for query in queries:
+            exact = np.argpartition(-(self.vectors @ query), k - 1)[:k]
+            approx, _ = self.search(query, k=k, rerank=rerank)
+            hits += len(np.intersect1d(exact, approx))
+        return hits / max(k * len(queries), 1)
+
+def build_binary_index():
+    """embedding_matrixからバイナリ符号インデックスを構築する（SEMANTIC_SEARCH_MODEが'binary'の場合）"""
+    global binary_index
+
+    if SEMANTIC_SEARCH_MODE != 'binary' or embedding_matrix is None:
+        binary_index = None
+        return None
+
+    start = time.time()
+    binary_index = BinaryEmbeddingIndex().build(embedding_matrix)
+    print(f"  ✅ バイナリ符号インデックス: {len(binary_index)}件, {binary_index.codes.nbytes / 1024:.0f} KB, "
+          f"{time.time() - start:.1f}秒（再計算: 上位{BINARY_RERANK}件）")
+    return binary_index
+
+# ============================================
+# IVFインデックス（k-meansのセルごとの転置リスト）
+# ============================================
+
+class IVFIndex:
+    """
+    セマンティックエンベディングのIVF（Inverted File）インデックス
+
+    エンベディングをk-meansでn_lists個のセルに分け、セルごとに所属するESの行位置のリストを持つ。
+    検索時はクエリとの内積が大きい上位nprobe個のセルだけを走査し、そのESとの類似度を正確に計算する。
+    保持するのはセントロイドと行位置（int32）だけで、ベクトル本体はembedding_matrixを参照する
+
+    Args:
+        n_lists: セル数（省略時は件数の平方根の4倍）
+        seed: k-meansの乱数シード
+    """
+
+    # k-meansの学習に使う最大件数（残りは学習後のセントロイドに割り当てる）
+    MAX_TRAINING_SIZE = 50000
+
+    def __init__(self, n_lists=None, seed=42):
+        self.n_lists = n_lists
+        self.seed = seed
+        self.centroids = None
+        self.list_offsets = None  # セルiのESはpositions[list_offsets[i]:list_offsets[i + 1]]
+        self.positions = None
+        self.vectors = None
+
+    def __len__(self):
+        return 0 if self.positions is None else len(self.positions)
+
+    def build(self, vectors):
+        """k-meansでセントロイドを学習し、全件をいずれかのセルに割り当てる"""
+        from sklearn.cluster import KMeans
+
+        n = len(vectors)
+        self.vectors = vectors
+        n_lists = min(self.n_lists or max(1, int(4 * np.sqrt(n))), n)
+        rng = np.random.default_rng(self.seed)
+        training = vectors[np.sort(rng.choice(n, size=min(n, self.MAX_TRAINING_SIZE), replace=False))]
+        kmeans = KMeans(n_clusters=n_lists, n_init=1, max_iter=25, random_state=self.seed).fit(training)
+        self.centroids = build_embedding_matrix(kmeans.cluster_centers_)
+        self.n_lists = n_lists
+
+        assignments = np.concatenate([
+            np.argmax(vectors[start:start + 8192] @ self.centroids.T, axis=1)
+            for start in range(0, n, 8192)
+        ])
+        self.positions = np.argsort(assignments, kind='stable').astype(np.int32)
+        self.list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=n_lists))]).astype(np.int64)
+        return self
+
+    def to_state(self):
+        """セントロイドと転置リストを辞書にする（npzで保存できるnumpy配列のみ）"""
+        return {'centroids': self.centroids, 'list_offsets': self.list_offsets, 'positions': self.positions}
+
+    @classmethod
+    def from_state(cls, state):
+        """to_state()の辞書からインデックスを復元する"""
+        index = cls()
+        index.centroids = np.asarray(state['centroids'], dtype=np.float32)
+        index.list_offsets = np.asarray(state['list_offsets'], dtype=np.int64)
+        index.positions = np.asarray(state['positions'], dtype=np.int32)
+        index.n_lists = len(index.centroids)
+        return index
+
+    def attach_vectors(self, vectors):
+        """転置リストと同じ行位置を持つベクトル行列を接続する"""
+        if len(vectors) != len(self):
+            raise ValueError(f"ベクトル数({len(vectors)})とインデックスの件数({len(self)})が一致しません")
+        self.vectors = vectors
+
+    def search(self, query, k=100, nprobe=None):
+        """
+        クエリに近い上位nprobe個のセルを走査し、上位k件を返す
+
+        Returns:
+            tuple: (行位置の配列, 類似度の配列) 類似度の降順
+        """
+        nprobe = min(max(nprobe or IVF_NPROBE, 1), self.n_lists)
+        query = np.asarray(query, dtype=np.float32)
+        cells = select_top_k(self.centroids @ query, nprobe)
+        candidates = np.sort(np.concatenate([
+            self.positions[self.list_offsets[cell]:self.list_offsets[cell + 1]] for cell in cells
+        ]))
+        scores = np.asarray(self.vectors[candidates], dtype=np.float32) @ query
+        top = select_top_k(scores, min(k, len(candidates)))
+        return candidates[top].astype(np.int64), scores[top]
+
+    def evaluate_recall(self, queries, k=100, nprobe=None):
+        """厳密な全件スキャンに対するrecall@kを計算する"""
+        k = min(k, len(self))
+        hits = 0
+        for query in queries:
+            exact = np.argpartition(-(self.vectors @ query), k - 1)[:k]
+            approx, _ = self.search(query, k=k, nprobe=nprobe)
+            hits += len(np.intersect1d(exact, approx))
+        return hits / max(k * len(queries), 1)
+
+def build_ivf_index(n_lists=None, report_recall=True):
+    """embedding_matrixからIVFインデックスを構築する（前処理時に実行）"""
+    global ivf_index
+
+    if embedding_matrix is None:
+        print("⚠️ エンベディングがないためIVFインデックスを構築できません")
+        return None
+
+    print(f"🔧 IVFインデックスを構築中（{len(embedding_matrix)}件）...")
+    start = time.time()
+    ivf_index = IVFIndex(n_lists=n_lists).build(embedding_matrix)
+    print(f"  ✅ 構築完了: {time.time() - start:.1f}秒, {ivf_index.n_lists}セル")
+
+    if report_recall:
+        sample = sample_recall_queries(embedding_matrix)
+        for nprobe in (1, 4, 8, 16, 32):
+            recall = ivf_index.evaluate_recall(sample, k=100, nprobe=nprobe)
+            print(f"  📊 recall@100 (nprobe={nprobe}): {recall:.3f}")
+
+    return ivf_index
+
+# ============================================
+# PCA次元削減インデックス
+# ============================================
+
+class PCAEmbeddingIndex:
+    """
+    セマンティックエンベディングをPCAで低次元（128 / 256次元など）に射影したインデックス
+
+    射影後のベクトルもL2正規化し、1段目は低次元の内積で全件をスキャン、
+    上位rerank件を元の次元のベクトルで正確に再計算する。クエリにも同じ射影（平均を引いて主成分へ射影）を適用する。
+    whiten=Trueでは主成分ごとに分散の平方根で割り、分散の大きい成分に類似度が偏らないようにする
+
+    Args:
+        n_components: 射影後の次元数
+        whiten: 白色化するか
+        block_size: 射影時に一度に処理する行数
+    """
+
+    def __init__(self, n_components=256, whiten=False, block_size=8192):
+        self.n_components = n_components
+        self.whiten = whiten
+        self.block_size = block_size
+        self.mean = None
+        self.components = None  # (n_components, 元の次元数)。白色化する場合はスケール済み
+        self.explained_variance = None
+        self.reduced = None  # 射影後のL2正規化済み行列
+        self.vectors = None
+
+    def __len__(self):
+        return 0 if self.reduced is None else len(self.reduced)
+
+    def fit(self, vectors):
+        """共分散行列の固有分解で主成分を求める"""
+        n, dim = vectors.shape
+        self.mean = np.asarray(vectors, dtype=np.float64).mean(axis=0)
+        covariance = np.zeros((dim, dim))
+        for start in range(0, n, self.block_size):
+            block = np.asarray(vectors[start:start + self.block_size], dtype=np.float64) - self.mean
+            covariance += block.T @ block
+        covariance /= max(n - 1, 1)
+
+        eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+        order = np.argsort(eigenvalues)[::-1][:min(self.n_components, dim)]
+        self.explained_variance = eigenvalues[order]
+        components = eigenvectors[:, order].T
+        if self.whiten:
+            components = components / np.sqrt(np.maximum(self.explained_variance, 1e-12))[:, None]
+        self.components = components.astype(np.float32)
+        self.mean = self.mean.astype(np.float32)
+        return self
+
+    def project(self, vectors):
+        """平均を引いて主成分に射影し、L2正規化する"""
+        vectors = np.atleast_2d(vectors)
+        return build_embedding_matrix(np.vstack([
+            (np.asarray(vectors[start:start + self.block_size], dtype=np.float32) - self.mean) @ self.components.T
+            for start in range(0, len(vectors), self.block_size)
+        ]))
+
+    def build(self, vectors):
+        """主成分を求めて全件を射影する"""
+        self.fit(vectors)
+        self.reduced = self.project(vectors)
+        self.vectors = vectors
+        return self
+
+    def explained_variance_ratio(self, total_variance):
+        """射影後の次元で説明できる分散の割合"""
+        return float(self.explained_variance.sum() / total_variance)
+
+    def to_state(self):
+        """射影と射影後の行列を辞書にする（npzで保存できるnumpy配列のみ）"""
+        return {
+            'mean': self.mean,
+            'components': self.components,
+            'explained_variance': self.explained_variance,
+            'whiten': np.array(self.whiten),
+            'reduced': self.reduced,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        """to_state()の辞書からインデックスを復元する"""
+        index = cls(n_components=len(state['components']), whiten=bool(state['whiten']))
+        index.mean = np.asarray(state['mean'], dtype=np.float32)
+        index.components = np.asarray(state['components'], dtype=np.float32)
+        index.explained_variance = np.asarray(state['explained_variance'])
+        index.reduced = np.asarray(state['reduced'], dtype=np.float32)
+        return index
+
+    def attach_vectors(self, vectors):
+        """再計算に使う（射影前と同じ行順の）ベクトル行列を接続する"""
+        if len(vectors) != len(self):
+            raise ValueError(f"ベクトル数({len(vectors)})とインデックスの件数({len(self)})が一致しません")
+        self.vectors = vectors
+
+    def search(self, query, k=100, rerank=None):
+        """
+        射影後の内積の上位rerank件を元の次元で再計算し、上位k件を返す
+
+        Returns:
+            tuple: (行位置の配列, 類似度の配列) 類似度の降順
+        """
+        k = min(k, len(self))
+        rerank = min(max(rerank or k, k), len(self))
+        reduced_scores = self.reduced @ self.project(query)[0]
+        candidates = np.sort(select_top_k(reduced_scores, rerank))
+        if self.vectors is None:
+            scores = reduced_scores[candidates]
+        else:
+            scores = np.asarray(self.vectors[candidates], dtype=np.float32) @ np.asarray(query, dtype=np.float32)
+        top = select_top_k(scores, k)
+        return candidates[top], scores[top]
+
+    def evaluate_recall(self, queries, k=100, rerank=None):
+        """厳密な全件スキャンに対するrecall@kを計算する"""
+        k = min(k, len(self))
+        hits = 0
+        for query in queries:
+            exact = np.argpartition(-(np.asarray(self.vectors) @ query), k - 1)[:k]
+            approx, _ = self.search(query, k=k, rerank=rerank)
+            hits += len(np.intersect1d(exact, approx))
+        return hits / max(k * len(queries), 1)
+
+def build_pca_index(n_components=256, whiten=False, report_recall=True):
+    """embedding_matrixからPCA次元削減インデックスを構築する（前処理時に実行）"""
+    global pca_index
+
+    if embedding_matrix is None:
+        print("⚠️ エンベディングがないためPCAインデックスを構築できません")
+        return None
+
+    print(f"🔧 PCAインデックスを構築中（{embedding_matrix.shape[1]} → {n_components}次元, 白色化: {whiten}）...")
+    start = time.time()
+    pca_index = PCAEmbeddingIndex(n_components=n_components, whiten=whiten).build(embedding_matrix)
+    total_variance = float(np.asarray(embedding_matrix, dtype=np.float64).var(axis=0, ddof=1).sum())
+    print(f"  ✅ 構築完了: {time.time() - start:.1f}秒, {pca_index.reduced.nbytes / (1024 * 1024):.1f} MB"
+          f"（説明できる分散: {pca_index.explained_variance_ratio(total_variance):.1%}）")
+
+    if report_recall:
+        sample = sample_recall_queries(embedding_matrix)
+        for rerank in (100, 400, 1000):
+            recall = pca_index.evaluate_recall(sample, k=100, rerank=rerank)
+            print(f"  📊 recall@100 (rerank={rerank}): {recall:.3f}")
+
+    return pca_index
+
+def compute_semantic_similarities(query_vector, candidate_count, nprobe=None):
+    """
+    全ESとのセマンティック類似度を計算
+
+    SEMANTIC_SEARCH_MODEが'hnsw' / 'int8' / 'binary' / 'ivf' / 'pca'でインデックスが読み込まれている場合は、
+    HNSW / int8量子化スキャン（上位INT8_RERANK件をfloat32で再計算）/
+    Hamming距離の事前絞り込み（上位BINARY_RERANK件をfloat32で再計算）/ IVF（上位nprobe個のセルを走査）/
+    PCAで削減した次元でのスキャン（上位PCA_RERANK件を元の次元で再計算）で得た
+    上位candidate_count件のみ類似度を埋め、それ以外は0とする
+
+    Args:
+        query_vector: L2正規化済みのクエリベクトル
+        candidate_count: 近似探索で取得する候補数
+        nprobe: IVFで走査するセル数（省略時はIVF_NPROBE）
+
+    Returns:
+        np.ndarray: es_dataの行位置に対応する類似度
+    """
+    if SEMANTIC_SEARCH_MODE == 'hnsw' and hnsw_index is not None:
+        positions, similarities = hnsw_index.search(query_vector, k=candidate_count, ef_search=HNSW_EF_SEARCH)
+        semantic_similarities = np.zeros(len(embedding_matrix), dtype=np.float32)
+        semantic_similarities[positions] = similarities
+        return semantic_similarities
+
+    if SEMANTIC_SEARCH_MODE == 'int8' and quantized_index is not None:
+        positions, similarities = quantized_index.search(query_vector, k=candidate_count, rerank=INT8_RERANK)
+        semantic_similarities = np.zeros(len(quantized_index), dtype=np.float32)
+        semantic_similarities[positions] = similarities
+        return semantic_similarities
+
+    if SEMANTIC_SEARCH_MODE == 'binary' and binary_index is not None:
+        positions, similarities = binary_index.search(query_vector, k=candidate_count, rerank=BINARY_RERANK)
+        semantic_similarities = np.zeros(len(binary_index), dtype=np.float32)
+        semantic_similarities[positions] = similarities
+        return semantic_similarities
+
+    if SEMANTIC_SEARCH_MODE == 'ivf' and ivf_index is not None:
+        positions, similarities = ivf_index.search(query_vector, k=candidate_count, nprobe=nprobe)
+        semantic_similarities = np.zeros(len(ivf_index), dtype=np.float32)
+        semantic_similarities[positions] = similarities
+        return semantic_similarities
+
+    if SEMANTIC_SEARCH_MODE == 'pca' and pca_index is not None:
+        positions, similarities = pca_index.search(query_vector, k=candidate_count, rerank=PCA_RERANK)
+        semantic_similarities = np.zeros(len(pca_index), dtype=np.float32)
+        semantic_similarities[positions] = similarities
+        return semantic_similarities
+
+    return embedding_matrix @ query_vector
+
+def sort_by_industry_partition(df):
+    """
+    ESを業界大分類（INDUSTRY_MAJOR_CATEGORIES順、該当なしは最後）→ 業界 → 企業名の順に並べ替える
+    （同じキーの中では元の順序を維持）
+
+    TF-IDF行列・エンベディング行列はes_dataと同じ行順で作るため、各大分類・業界のESが
+    行列の連続した行（パーティション）になり、業界で絞り込んだ検索は行列のスライスで済む
+    """
+    category_codes = {category: code for code, category in enumerate(INDUSTRY_MAJOR_CATEGORIES)}
+    major_codes = np.array([
+        category_codes.get(extract_major_industry_category(industry), len(INDUSTRY_MAJOR_CATEGORIES))
+        for industry in df['industry']
+    ])
+    industry_codes, _ = pd.factorize(df['industry'], sort=True)
+    company_codes, _ = pd.factorize(df['company_name'], sort=True)
+    return df.iloc[np.lexsort((company_codes, industry_codes, major_codes))]
+
+def load_csv_data(csv_path):
+    """CSVデータを読み込んで整形"""
+    global es_data, vectorizer, tfidf_matrix, sentence_model, embedding_matrix, es_features, es_lookup, company_table
+    global industry_table, industry_stats
+
+    print(f"\n📂 CSVデータを読み込み中: {csv_path}")
+    df = pd.read_csv(csv_path)
+    print(f"✅ {len(df)}件のデータを読み込みました")
+
+    # 🆕 データソース別の統計を表示
+    if 'data_source' in df.columns:
+        print("\n📊 データソース別の内訳:")
+        source_counts = df['data_source'].value_counts()
+        for source, count in source_counts.items():
+            print(f"  - {source}: {count}件")
+
+    print("🔧 データ整形中...")
+
+    es_data = pd.DataFrame({
+        'company_name': df['p-company-summary__name'].apply(clean_text),
+        'industry': df['p-company-summary__stage-sub'].apply(remove_prefix),
+        'title': df['p-company-heading-contents__title'].apply(clean_text),
+        'user_info': df.get('c-panel-variant2__header-user', pd.Series()).apply(clean_text),
+        'question_1': df['u-font-light'].apply(clean_text),
+        'answer_1': df['c-show-more__content'].apply(clean_text),
+        'question_2': df.get('u-font-light (2)', pd.Series()).apply(clean_text),
+        'answer_2': df.get('c-show-more__content (2)', pd.Series()).apply(clean_text),
+        'question_3': df.get('u-font-light (3)', pd.Series()).apply(clean_text),
+        'answer_3': df.get('c-show-more__content (3)', pd.Series()).apply(clean_text),
+        'avg_salary': df.get('p-company-table (11)', pd.Series()).apply(clean_text),
+        'employee_count': df.get('p-company-summary__stage-sub (3)', pd.Series()).apply(remove_prefix),
+        # 🆕 データソース情報を保持
+        'data_source': df.get('data_source', pd.Series(dtype='object')),
+        'original_url': df.get('original_url', pd.Series(dtype='object'))
+    })
+
+    es_data['university'] = es_data['user_info'].apply(extract_university)
+
+    es_data['result_status'] = es_data['title'].apply(
+        lambda x: '内定' if '内定' in str(x) else ('通過' if '通過' in str(x) else '不明')
+    )
+
+    es_data = es_data[es_data['result_status'].isin(['通過', '内定'])]
+
+    es_data['combined_answer'] = (
+        es_data['answer_1'].fillna('') + ' ' +
+        es_data['answer_2'].fillna('') + ' ' +
+        es_data['answer_3'].fillna('')
+    ).str.strip()
+
+    es_data = es_data[es_data['combined_answer'].str.len() > 50]
+
+    # 業界大分類・業界ごとのESを連続した行にする（以降の行列もすべてこの並びで作る）
+    es_data = sort_by_industry_partition(es_data)
+
+    print(f"✅ 有効なESデータ: {len(es_data)}件")
+
+    # テーマ・エピソードタイプ・強み弱み・STAR構造・定量的成果・詳細度を1件ずつまとめて分析
+    print("🔧 ES本文の分析中（テーマ・エピソードタイプ・強み弱み・構造・成果・詳細度）...")
+    profiles = [DocumentProfile(text) for text in es_data['combined_answer']]
+
+    es_data['themes'] = [profile.themes for profile in profiles]
+    es_data['episode_type'] = [profile.episode_info for profile in profiles]
+    es_data['episode_types_multi'] = [profile.episode_types_multi for profile in profiles]
+    es_data['strengths_weaknesses'] = [profile.strengths_weaknesses for profile in profiles]
+
+    # 分析結果（リスト・辞書）をビットマスク列に変換
+    es_data = add_es_analysis_mask_columns(es_data)
+
+    # 定量的成果・詳細度・構造の特徴量を追加（ボーナス計算用）
+    add_es_feature_columns(es_data, profiles)
+
+    # エピソードタイプの統計を出力
+    episode_type_counts = {
+        EPISODE_TYPE_NAMES[code]: count
+        for code, count in enumerate(np.bincount(es_data['episode_type_code'], minlength=len(EPISODE_TYPE_NAMES)))
+        if count > 0
+    }
+
+    print("\n📊 エピソードタイプ別の分布:")
+    for episode_type, count in sorted(episode_type_counts.items(), key=lambda x: x[1], reverse=True)[:10]:
+        print(f"  - {episode_type}: {count}件")
+
+    print(f"🔧 TF-IDFベクトル化中（テーマキーワードのブースト: +{TFIDF_KEYWORD_BOOST:g}）...")
+    vectorizer, tfidf_matrix = fit_tfidf_vectorizer(
+        es_data['combined_answer'].tolist(),
+        [profile.keywords for profile in profiles]
+    )
+    del profiles
+    print(f"✅ ベクトル化完了: {tfidf_matrix.shape}")
+    build_tfidf_index()
+
+    # ============================================
+    # セマンティックエンベディング生成（Sentence-BERT）
+    # ============================================
+    print("🔧 セマンティックエンベディング生成中...")
+    try:
+        from sentence_transformers import SentenceTransformer
+        import time
+
+        # tqdmのインポート（進捗表示用）
+        try:
+            from tqdm import tqdm
+            has_tqdm = True
+        except ImportError:
+            print("  ⚠️ tqdmがインストールされていません。進捗表示なしで実行します。")
+            has_tqdm = False
+
+        # 1. モデルのロード
+        if sentence_model is None:
+            print("  📥 セマンティックモデルをダウンロード中...")
+            # 軽量モデルを使用（384次元、約2倍速い）
+            sentence_model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
+
+            # GPU対応（利用可能な場合）
+            try:
+                import torch
+                device = 'cuda' if torch.cuda.is_available() else 'cpu'
+                print(f"  🖥️  使用デバイス: {device}")
+                sentence_model = sentence_model.to(device)
+            except ImportError:
+                print("  🖥️  使用デバイス: cpu")
+
+            print("  ✅ モデルロード完了")
+
+        # 2. まず100件でテスト（所要時間の予測）
+        print("\n  🧪 テスト: 最初の100件を処理して所要時間を予測...")
+        test_start = time.time()
+        test_count = min(100, len(es_data))
+        test_texts = es_data['combined_answer'].head(test_count).apply(lambda x: str(x)[:512]).tolist()
+        test_embeddings = sentence_model.encode(
+            test_texts,
+            convert_to_tensor=False,
+            show_progress_bar=False,
+            batch_size=32
+        )
+        test_time = time.time() - test_start
+
+        estimated_total_time = (test_time / test_count) * len(es_data)
+        print(f"  ⏱️  {test_count}件の処理時間: {test_time:.2f}秒")
+        print(f"  📊 予想所要時間: {estimated_total_time / 60:.1f}分")
+
+        # 3. 全データをバッチ処理
+        print(f"\n  🚀 全データのエンベディング生成中（{len(es_data)}件）...")
+
+        # テキストを一括で準備（長さ制限を512文字に）
+        all_texts = es_data['combined_answer'].apply(lambda x: str(x)[:512]).tolist()
+
+        # バッチサイズの設定
+        batch_size = 32  # CPUの場合は16-32が最適
+        embedding_batches = []
 
         # バッチ処理ループ
         batch_range = range(0, len(all_texts), batch_size)
@@ -1336,33 +2649,39 @@ def load_csv_data(csv_path):
             )
 
             # リストに追加
-            if isinstance(batch_embeddings, list):
-                all_embeddings.extend(batch_embeddings)
-            else:
-                # numpyアレイの場合
-                all_embeddings.extend(batch_embeddings.tolist() if hasattr(batch_embeddings, 'tolist') else list(batch_embeddings))
+            embedding_batches.append(np.asarray(batch_embeddings, dtype=np.float32))
 
-        # 4. DataFrameに格納
-        es_data['semantic_embedding'] = all_embeddings
+        # 4. 正規化済みの連続行列にまとめ、DataFrameには行ビューを格納（メモリは共有）
+        embedding_matrix = build_embedding_matrix(np.vstack(embedding_batches))
+        es_data['semantic_embedding'] = list(embedding_matrix)
 
         # 5. 結果確認
-        print(f"\n  ✅ セマンティックエンベディング完了（{len(all_embeddings)}件）")
-        if len(all_embeddings) > 0:
-            first_embedding = all_embeddings[0]
-            if hasattr(first_embedding, '__len__'):
-                print(f"  📏 エンベディング次元: {len(first_embedding)}")
+        print(f"\n  ✅ セマンティックエンベディング完了（{len(embedding_matrix)}件）")
+        print(f"  📏 エンベディング次元: {embedding_matrix.shape[1]}")
+        build_binary_index()
 
     except ImportError:
         print("⚠️ sentence-transformersがインストールされていません。")
         print("   pip install sentence-transformers でインストールしてください。")
         print("   TF-IDFのみを使用します。")
         es_data['semantic_embedding'] = None
+        embedding_matrix = None
 
     except Exception as e:
         print(f"⚠️ セマンティックエンベディング生成エラー: {e}")
         import traceback
         traceback.print_exc()
         es_data['semantic_embedding'] = None
+        embedding_matrix = None
+
+    # ボーナス計算用の特徴配列を構築
+    es_features = build_es_feature_arrays(es_data)
+
+    # 企業・業界のルックアップインデックスと企業テーブルを構築
+    es_lookup = build_lookup_indexes(es_data)
+    company_table = build_company_table(es_data)
+    industry_table, industry_stats = build_industry_stats(es_data)
+    build_company_index()
 
     print("\n📊 データ統計:")
     print(f"  - ユニーク企業数: {es_data['company_name'].nunique()}")
@@ -1413,488 +2732,1372 @@ def load_csv_data(csv_path):
     print(f"  - 業界: {len(industries_list)}種類")
     print(f"  - 企業: {len(companies_list)}社")
 
-def load_preprocessed_data(preprocessed_dir='es_preprocessed_data', csv_basename='unified_es_data'):
-    """前処理済みデータを読み込む（高速起動用）"""
-    global es_data, vectorizer, tfidf_matrix, sentence_model
-    global universities_list, industries_list, companies_list, common_questions
-    global company_counts, industry_counts
+def get_preprocessed_file_paths(preprocessed_dir, csv_basename):
+    """前処理済みデータ（必須ファイル）のパスを返す"""
+    return {
+        'es_data': os.path.join(preprocessed_dir, f'{csv_basename}_es_data.pkl'),
+        'tfidf_matrix': os.path.join(preprocessed_dir, f'{csv_basename}_tfidf_matrix.npz'),
+        'vectorizer': os.path.join(preprocessed_dir, f'{csv_basename}_vectorizer.pkl'),
+        'embeddings': os.path.join(preprocessed_dir, f'{csv_basename}_embeddings.npy')
+    }
+
+def get_optional_preprocessed_file_paths(preprocessed_dir, csv_basename):
+    """前処理済みデータ（存在すれば読み込むインデックス類）のパスを返す"""
+    return {
+        'hnsw_index': os.path.join(preprocessed_dir, f'{csv_basename}_hnsw_index.pkl'),
+        'quantized_embeddings': os.path.join(preprocessed_dir, f'{csv_basename}_embeddings_int8.npz'),
+        'ivf_index': os.path.join(preprocessed_dir, f'{csv_basename}_ivf_index.npz'),
+        'pca_embeddings': os.path.join(preprocessed_dir, f'{csv_basename}_embeddings_pca.npz'),
+        'company_centroids': os.path.join(preprocessed_dir, f'{csv_basename}_company_centroids.npz')
+    }
+
+def save_preprocessed_data(preprocessed_dir='es_preprocessed_data', csv_basename='unified_es_data', build_hnsw=True,
+                           build_int8=False, build_ivf=False, build_pca=False, pca_dim=256, pca_whiten=False):
+    """読み込み済みのデータとインデックスを前処理済みデータとして保存する
+
+    Args:
+        preprocessed_dir: 保存先ディレクトリ
+        csv_basename: ファイル名のプレフィックス
+        build_hnsw: HNSWインデックスを構築して保存するか
+        build_int8: int8量子化エンベディングを構築して保存するか（SEMANTIC_SEARCH_MODE=int8で使用）
+        build_ivf: IVFインデックスを構築して保存するか（SEMANTIC_SEARCH_MODE=ivfで使用）
+        build_pca: PCAで次元削減したエンベディングを保存するか（SEMANTIC_SEARCH_MODE=pcaで使用）
+        pca_dim: PCAの次元数（128 / 256など）
+        pca_whiten: PCAで白色化するか
+    """
+    if es_data is None or len(es_data) == 0:
+        print("❌ データが読み込まれていません")
+        return False
+
+    os.makedirs(preprocessed_dir, exist_ok=True)
+    preprocessed_files = get_preprocessed_file_paths(preprocessed_dir, csv_basename)
+    optional_files = get_optional_preprocessed_file_paths(preprocessed_dir, csv_basename)
+
+    print(f"\n💾 前処理済みデータを保存中: {preprocessed_dir}")
+
+    # semantic_embeddingはembedding_matrixの行ビューで、pickleすると行ごとの配列として2重に保存されるため除く
+    with open(preprocessed_files['es_data'], 'wb') as f:
+        pickle.dump(es_data.drop(columns=['semantic_embedding'], errors='ignore'), f)
+    sparse.save_npz(preprocessed_files['tfidf_matrix'], tfidf_matrix)
+    with open(preprocessed_files['vectorizer'], 'wb') as f:
+        pickle.dump(vectorizer, f)
+
+    if embedding_matrix is not None:
+        np.save(preprocessed_files['embeddings'], embedding_matrix)
+
+        if build_hnsw:
+            index = hnsw_index
+            if index is None or len(index) != len(embedding_matrix):
+                index = build_hnsw_index()
+            with open(optional_files['hnsw_index'], 'wb') as f:
+                pickle.dump(index.to_state(), f)
+
+        if build_int8:
+            index = quantized_index
+            if index is None or len(index) != len(embedding_matrix):
+                index = build_quantized_index()
+            np.savez(optional_files['quantized_embeddings'], **index.to_state())
+
+        if build_ivf:
+            index = ivf_index
+            if index is None or len(index) != len(embedding_matrix):
+                index = build_ivf_index()
+            np.savez(optional_files['ivf_index'], **index.to_state())
+
+        if build_pca:
+            index = pca_index
+            if (index is None or len(index) != len(embedding_matrix) or
+                    index.components.shape[0] != pca_dim or index.whiten != pca_whiten):
+                index = build_pca_index(n_components=pca_dim, whiten=pca_whiten)
+            np.savez(optional_files['pca_embeddings'], **index.to_state())
+
+        if company_index is not None:
+            np.savez(optional_files['company_centroids'], **company_index.to_state())
+
+    for name, path in {**preprocessed_files, **optional_files}.items():
+        if os.path.exists(path):
+            size_mb = os.path.getsize(path) / (1024 * 1024)
+            print(f"  ✅ {name}: {size_mb:.2f} MB")
+
+    return True
+
+def load_preprocessed_data(preprocessed_dir='es_preprocessed_data', csv_basename='unified_es_data'):
+    """前処理済みデータを読み込む（高速起動用）"""
+    global es_data, vectorizer, tfidf_matrix, sentence_model, embedding_matrix, hnsw_index, quantized_index, ivf_index, pca_index
+    global es_features, es_lookup, company_table
+    global industry_table, industry_stats
+    global universities_list, industries_list, companies_list, common_questions
+    global company_counts, industry_counts
+
+    print(f"\n⚡ 前処理済みデータを読み込み中...")
+    print(f"📂 保存先: {preprocessed_dir}")
+
+    # 前処理済みデータのファイルパス
+    preprocessed_files = get_preprocessed_file_paths(preprocessed_dir, csv_basename)
+    optional_files = get_optional_preprocessed_file_paths(preprocessed_dir, csv_basename)
+
+    # すべてのファイルが存在するかチェック
+    all_files_exist = all(os.path.exists(f) for f in preprocessed_files.values())
+
+    if not all_files_exist:
+        print("❌ 前処理済みデータが見つかりません")
+        print("💡 CSVから読み込む必要があります")
+        return False
+
+    try:
+        # es_dataを読み込み
+        with open(preprocessed_files['es_data'], 'rb') as f:
+            es_data = pickle.load(f)
+        print(f"  ✅ es_data: {len(es_data)}件")
+
+        # 古い前処理済みデータはエンベディングの複製を持つため除き、読み込んだembedding_matrixの行ビューに置き換える
+        if 'semantic_embedding' in es_data.columns:
+            print("  🔧 es_dataのsemantic_embedding列を除去中...（前処理済みデータを再保存すると次回から不要です）")
+            es_data = es_data.drop(columns=['semantic_embedding'])
+        es_data['semantic_embedding'] = None
+
+        # 特徴列がない古い前処理済みデータの場合はここで計算する
+        if 'theme_mask' not in es_data.columns:
+            es_data = add_es_analysis_mask_columns(es_data)
+        if not has_es_feature_columns(es_data):
+            print("  🔧 特徴量（成果・詳細度・構造）を計算中...（前処理済みデータを再保存すると次回から不要です）")
+            add_es_feature_columns(es_data)
+        es_features = build_es_feature_arrays(es_data)
+        print(f"  ✅ es_features")
+
+        # TF-IDF行列を読み込み
+        tfidf_matrix = build_tfidf_matrix(sparse.load_npz(preprocessed_files['tfidf_matrix']))
+        print(f"  ✅ tfidf_matrix: {tfidf_matrix.shape}")
+        build_tfidf_index()
+
+        # Vectorizerを読み込み
+        with open(preprocessed_files['vectorizer'], 'rb') as f:
+            vectorizer = pickle.load(f)
+        print(f"  ✅ vectorizer")
+
+        # セマンティックエンベディングを読み込み
+        if os.path.exists(preprocessed_files['embeddings']):
+            # Sentence-BERTモデルをロード（エンベディング計算には不要だが、モデルは必要）
+            try:
+                from sentence_transformers import SentenceTransformer
+                if sentence_model is None:
+                    print("  📥 Sentence-BERTモデルをロード中...")
+                    sentence_model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
+                    print("  ✅ モデルロード完了")
+            except ImportError:
+                print("  ⚠️ sentence-transformersが利用できません。セマンティック検索は無効です。")
+
+            # エンベディングを読み込み、正規化済みの連続行列を構築
+            # int8モードでは正規化済みfloat32のファイルをメモリマップし、再計算で使う行だけを読む
+            # （pcaモードも同様に、削減した次元の行列だけを常駐させる）
+            use_int8 = SEMANTIC_SEARCH_MODE == 'int8' and os.path.exists(optional_files['quantized_embeddings'])
+            use_pca = SEMANTIC_SEARCH_MODE == 'pca' and os.path.exists(optional_files['pca_embeddings'])
+            use_mmap = use_int8 or use_pca
+            embedding_matrix = np.load(preprocessed_files['embeddings'], mmap_mode='r' if use_mmap else None)
+            if not (use_mmap and is_normalized_embedding_matrix(embedding_matrix)):
+                embedding_matrix = build_embedding_matrix(embedding_matrix)
+            es_data['semantic_embedding'] = list(embedding_matrix)
+            print(f"  ✅ semantic_embeddings: {embedding_matrix.shape}")
+            build_binary_index()
+
+            # int8量子化エンベディングを読み込み（オプション）
+            if use_int8:
+                with np.load(optional_files['quantized_embeddings']) as state:
+                    quantized_index = QuantizedEmbeddingIndex.from_state(state)
+                try:
+                    quantized_index.attach_vectors(embedding_matrix)
+                    print(f"  ✅ quantized_embeddings: {quantized_index.codes.nbytes / (1024 * 1024):.1f} MB"
+                          f"（検索モード: {SEMANTIC_SEARCH_MODE}, 再計算: 上位{INT8_RERANK}件）")
+                except ValueError as e:
+                    print(f"  ⚠️ int8量子化エンベディングを使用しません: {e}")
+                    quantized_index = None
+
+            # IVFインデックスを読み込み（オプション）
+            if SEMANTIC_SEARCH_MODE == 'ivf' and os.path.exists(optional_files['ivf_index']):
+                with np.load(optional_files['ivf_index']) as state:
+                    ivf_index = IVFIndex.from_state(state)
+                try:
+                    ivf_index.attach_vectors(embedding_matrix)
+                    print(f"  ✅ ivf_index: {ivf_index.n_lists}セル（検索モード: {SEMANTIC_SEARCH_MODE}, nprobe: {IVF_NPROBE}）")
+                except ValueError as e:
+                    print(f"  ⚠️ IVFインデックスを使用しません: {e}")
+                    ivf_index = None
+
+            # PCAで次元削減したエンベディングを読み込み（オプション）
+            if use_pca:
+                with np.load(optional_files['pca_embeddings']) as state:
+                    pca_index = PCAEmbeddingIndex.from_state(state)
+                try:
+                    pca_index.attach_vectors(embedding_matrix)
+                    print(f"  ✅ pca_embeddings: {pca_index.reduced.shape}（検索モード: {SEMANTIC_SEARCH_MODE}, 再計算: 上位{PCA_RERANK}件）")
+                except ValueError as e:
+                    print(f"  ⚠️ PCAで次元削減したエンベディングを使用しません: {e}")
+                    pca_index = None
+
+            # HNSWインデックスを読み込み（オプション）
+            if os.path.exists(optional_files['hnsw_index']):
+                with open(optional_files['hnsw_index'], 'rb') as f:
+                    hnsw_index = HNSWIndex.from_state(pickle.load(f))
+                try:
+                    hnsw_index.attach_vectors(embedding_matrix)
+                    print(f"  ✅ hnsw_index: {len(hnsw_index)}件（検索モード: {SEMANTIC_SEARCH_MODE}）")
+                except ValueError as e:
+                    print(f"  ⚠️ HNSWインデックスを使用しません: {e}")
+                    hnsw_index = None
+
+        # 企業・業界のルックアップインデックスと企業テーブルを構築
+        es_lookup = build_lookup_indexes(es_data)
+        company_table = build_company_table(es_data)
+        industry_table, industry_stats = build_industry_stats(es_data)
+        # 企業セントロイドは保存済みのものがあれば使い、エンベディング行列全体を読まない
+        if os.path.exists(optional_files['company_centroids']):
+            with np.load(optional_files['company_centroids']) as state:
+                build_company_index(state)
+        else:
+            build_company_index()
+
+        # 選択肢を抽出
+        universities_list = sorted(es_data['university'].dropna().unique().tolist())
+        universities_list = [u for u in universities_list if u != "不明" and str(u).strip() != ""]
+
+        industries_list = sorted(es_data['industry'].dropna().unique().tolist())
+        industries_list = [i for i in industries_list if i and str(i).strip() != ""]
+
+        companies_list = es_data['company_name'].dropna().unique().tolist()
+        companies_list = [c for c in companies_list if c and str(c).strip() != "" and len(str(c).strip()) > 1]
+        companies_list = sorted(companies_list, key=lambda x: str(x))
+
+        company_counts = es_data['company_name'].value_counts().to_dict()
+        industry_counts = es_data['industry'].value_counts().to_dict()
+
+        common_questions = [
+            "学生時代に力を入れたこと（ガクチカ）",
+            "志望動機",
+            "自己PR",
+            "あなたの強みとエピソード",
+            "挑戦したこと・チャレンジ",
+            "困難を乗り越えた経験",
+            "チームで成果を出した経験",
+            "リーダーシップを発揮した経験",
+            "インターンで学びたいこと",
+            "将来のキャリアビジョン"
+        ]
+
+        print(f"\n✅ 前処理済みデータの読み込みが完了しました")
+        print(f"  - 大学: {len(universities_list)}校")
+        print(f"  - 業界: {len(industries_list)}種類")
+        print(f"  - 企業: {len(companies_list)}社")
+
+        return True
+
+    except Exception as e:
+        print(f"❌ 前処理済みデータの読み込みに失敗しました: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+# ============================================
+# ボーナススコア計算エンジン（事前計算済みの特徴配列を使用）
+# ============================================
+
+def add_es_feature_columns(df, profiles=None):
+    """成果スコア・詳細度・構造（STAR）の特徴量をdfの列として追加（取り込み時に1回だけ実行）
+
+    Args:
+        profiles: dfの各行のDocumentProfile（省略時はcombined_answerから分析する）
+    """
+    if profiles is None:
+        profiles = [DocumentProfile(text) for text in df['combined_answer']]
+
+    df['achievement_score'] = np.array([profile.achievement_score for profile in profiles], dtype=np.float64)
+    df['detail_score'] = np.array([profile.detail_score for profile in profiles], dtype=np.float64)
+
+    structures = np.array([profile.structure_vector() for profile in profiles], dtype=np.int32).reshape(-1, len(STRUCTURE_KEYS))
+    for i, key in enumerate(STRUCTURE_KEYS):
+        df[f'structure_{key}'] = structures[:, i]
+
+    return df
+
+def has_es_feature_columns(df):
+    """取り込み時に計算する特徴列がすべて揃っているか"""
+    columns = ['achievement_score', 'detail_score'] + [f'structure_{key}' for key in STRUCTURE_KEYS]
+    return all(column in df.columns for column in columns)
+
+def encode_mask(names, labels):
+    """名前のリストを、labelsの並び順に対応したビットマスク（整数）に変換"""
+    mask = 0
+    for name in names:
+        if name in labels:
+            mask |= 1 << labels.index(name)
+    return mask
+
+def decode_mask(mask, labels):
+    """ビットマスクを名前のリストに戻す"""
+    mask = int(mask)
+    return [label for i, label in enumerate(labels) if (mask >> i) & 1]
+
+_POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+def popcount(values):
+    """整数配列の各要素の立っているビット数を数える"""
+    values = np.asarray(values)
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    # numpy 2.0未満: バイト単位のテーブル参照で集計
+    values = np.ascontiguousarray(values)
+    return _POPCOUNT_TABLE[values.view(np.uint8)].reshape(values.shape + (values.itemsize,)).sum(axis=-1)
+
+def encode_es_analysis(themes, episode_info, strengths_weaknesses):
+    """テーマ・エピソードタイプ・強み弱みの分析結果をビットマスクとコードに変換"""
+    episode_type = episode_info.get('type', 'その他の経験') if isinstance(episode_info, dict) else 'その他の経験'
+    if not isinstance(strengths_weaknesses, dict):
+        strengths_weaknesses = {}
+
+    return {
+        'themes': np.uint32(encode_mask([t['theme'] for t in themes[:3]], THEME_LABELS)),
+        'episode_type': EPISODE_TYPE_NAMES.index(episode_type),
+        'episode_category': int(EPISODE_TYPE_CATEGORY_CODES[EPISODE_TYPE_NAMES.index(episode_type)]),
+        'strengths': np.uint32(encode_mask(strengths_weaknesses.get('strengths', []), STRENGTH_NAMES)),
+        'weaknesses': np.uint32(encode_mask(strengths_weaknesses.get('weaknesses', []), WEAKNESS_NAMES)),
+    }
+
+def add_es_analysis_mask_columns(df):
+    """
+    テーマ・強み弱み・エピソードタイプの分析結果（リスト・辞書の列）をビットマスク列に置き換える
+
+    追加する列:
+        - theme_mask: 上位3テーマ（THEME_LABELSのビット）
+        - strength_mask / weakness_mask: 強み・弱み（STRENGTH_NAMES / WEAKNESS_NAMESのビット）
+        - episode_type_code / episode_confidence: 主エピソードタイプのコードと信頼度
+        - episode_types_mask: 上位2エピソードタイプ（EPISODE_TYPE_NAMESのビット）
+
+    Returns:
+        DataFrame: 元のthemes / strengths_weaknesses / episode_type / episode_types_multi列を削除したもの
+    """
+    encoded = [
+        encode_es_analysis(themes, episode_info, sw)
+        for themes, episode_info, sw in zip(df['themes'], df['episode_type'], df['strengths_weaknesses'])
+    ]
+
+    df['theme_mask'] = np.array([e['themes'] for e in encoded], dtype=np.uint32)
+    df['strength_mask'] = np.array([e['strengths'] for e in encoded], dtype=np.uint32)
+    df['weakness_mask'] = np.array([e['weaknesses'] for e in encoded], dtype=np.uint32)
+    df['episode_type_code'] = np.array([e['episode_type'] for e in encoded], dtype=np.int16)
+    df['episode_confidence'] = np.array(
+        [info.get('confidence', 0) if isinstance(info, dict) else 0 for info in df['episode_type']],
+        dtype=np.int16
+    )
+    df['episode_types_mask'] = np.array(
+        [encode_mask([t['type'] for t in types], EPISODE_TYPE_NAMES) for types in df['episode_types_multi']],
+        dtype=np.uint32
+    )
+
+    return df.drop(columns=['themes', 'strengths_weaknesses', 'episode_type', 'episode_types_multi'])
+
+def build_es_feature_arrays(df):
+    """
+    es_dataの特徴列から、ボーナス計算用のnumpy配列をまとめて構築
+
+    Returns:
+        dict: 各配列の1次元目がes_dataの行位置に対応する
+            - achievement / detail: 成果スコア・詳細度（float64）
+            - structure: STAR構造のキーワード数（int32, 列はSTRUCTURE_KEYS順）
+            - episode_type / episode_category: エピソードタイプ・カテゴリのコード（int16）
+            - themes / strengths / weaknesses: 上位3テーマ・強み・弱みのビットマスク（uint32）
+    """
+    episode_type = df['episode_type_code'].to_numpy(dtype=np.int16)
+
+    return {
+        'achievement': df['achievement_score'].to_numpy(dtype=np.float64),
+        'detail': df['detail_score'].to_numpy(dtype=np.float64),
+        'structure': np.column_stack([df[f'structure_{key}'].to_numpy(dtype=np.int32) for key in STRUCTURE_KEYS]),
+        'episode_type': episode_type,
+        'episode_category': EPISODE_TYPE_CATEGORY_CODES[episode_type],
+        'themes': df['theme_mask'].to_numpy(dtype=np.uint32),
+        'strengths': df['strength_mask'].to_numpy(dtype=np.uint32),
+        'weaknesses': df['weakness_mask'].to_numpy(dtype=np.uint32),
+    }
+
+def extract_input_features(profile):
+    """入力ESの分析結果（DocumentProfile）からボーナス計算用の特徴量を作る（es_featuresの1行分と同じ形式）"""
+    features = encode_es_analysis(profile.themes, profile.episode_info, profile.strengths_weaknesses)
+    features['achievement'] = profile.achievement_score
+    features['detail'] = profile.detail_score
+    features['structure'] = profile.structure_vector()
+    return features
+
+def calculate_bonus_scores(input_features, positions):
+    """
+    候補ESに対するボーナス/ペナルティを配列演算でまとめて計算
+
+    Args:
+        input_features: extract_input_featuresの戻り値
+        positions: 候補ESのes_data内の行位置
+
+    Returns:
+        np.ndarray: 候補ごとのボーナス合計（加算式）
+    """
+    total_bonus = np.zeros(len(positions))
+
+    # --------------------------------------------
+    # 1. テーマ一致ボーナス（最大+0.08）
+    # --------------------------------------------
+    theme_overlap = popcount(es_features['themes'][positions] & input_features['themes'])
+    total_bonus += np.select(
+        [theme_overlap >= 3, theme_overlap == 2, theme_overlap == 1],
+        [0.08, 0.05, 0.03],  # 3つ一致 / 2つ一致 / 1つ一致
+        0.0
+    )
+
+    # --------------------------------------------
+    # 2. 定量的成果の一致度ボーナス（最大+0.10）
+    # --------------------------------------------
+    input_achievement = input_features['achievement']
+    es_achievement = es_features['achievement'][positions]
+    total_bonus += np.select(
+        [
+            (input_achievement > 0.4) & (es_achievement > 0.4),  # 両方とも成果が強い
+            (input_achievement > 0.2) & (es_achievement > 0.2),  # 両方とも成果がある
+            np.abs(input_achievement - es_achievement) < 0.15,   # 成果レベルが近い
+            ((input_achievement > 0.3) & (es_achievement < 0.1)) |
+            ((input_achievement < 0.1) & (es_achievement > 0.3)),  # 成果レベルが大きく異なる（ペナルティ）
+        ],
+        [0.10, 0.06, 0.04, -0.08],
+        0.0
+    )
+
+    # --------------------------------------------
+    # 3. 詳細度の一致度ボーナス（最大+0.08）
+    # --------------------------------------------
+    input_detail = input_features['detail']
+    es_detail = es_features['detail'][positions]
+    detail_diff = np.abs(input_detail - es_detail)
+    total_bonus += np.select(
+        [detail_diff < 0.1, detail_diff < 0.2, detail_diff < 0.3, detail_diff > 0.5],
+        [0.06, 0.04, 0.02, -0.04],
+        0.0
+    )
+    # 両方とも詳細度が高い場合は追加ボーナス
+    total_bonus += np.where((input_detail > 0.6) & (es_detail > 0.6), 0.02, 0.0)
+
+    # --------------------------------------------
+    # 4. エピソードタイプ一致ボーナス（最大+0.08）
+    # --------------------------------------------
+    input_episode_type = input_features['episode_type']
+    input_episode_category = input_features['episode_category']
+    es_episode_type = es_features['episode_type'][positions]
+    es_episode_category = es_features['episode_category'][positions]
+    other_type = EPISODE_TYPE_NAMES.index('その他の経験')
+    other_category = EPISODE_CATEGORY_NAMES.index('その他')
+    total_bonus += np.select(
+        [
+            es_episode_type == input_episode_type,  # 完全一致
+            (es_episode_category == input_episode_category) & (input_episode_category != other_category),  # 同じカテゴリ
+            (input_episode_type != other_type) & (es_episode_type == other_type),  # 入力が具体的なのにESが曖昧
+        ],
+        [0.08, 0.05, -0.03],
+        0.0
+    )
+
+    # --------------------------------------------
+    # 5. 強み・弱みの一致度ボーナス（最大+0.15）
+    # --------------------------------------------
+    es_strengths = es_features['strengths'][positions]
+    strength_overlap = popcount(es_strengths & input_features['strengths'])
+    total_bonus += np.select([strength_overlap >= 2, strength_overlap == 1], [0.10, 0.05], 0.0)
+
+    weakness_overlap = popcount(es_features['weaknesses'][positions] & input_features['weaknesses'])
+    total_bonus += np.where(weakness_overlap >= 1, 0.05, 0.0)
+
+    # 強みが完全に異なる場合は軽いペナルティ
+    if input_features['strengths'] != 0:
+        total_bonus += np.where((es_strengths != 0) & (strength_overlap == 0), -0.03, 0.0)
+
+    return total_bonus
+
+def bonus_upper_bound(input_features):
+    """
+    入力ESに対してcalculate_bonus_scoresが取りうるボーナス合計の上限
+
+    各ボーナスの最大値（テーマ+0.08, 成果+0.10, 詳細度+0.08, エピソード+0.08, 強み・弱み+0.15）のうち、
+    入力ESの特徴から到達できないものは除く（calculate_bonus_scoresの条件を変えたらここも合わせる）
+    """
+    theme_count = min(int(popcount(input_features['themes'])), 3)
+    strength_count = int(popcount(input_features['strengths']))
+    input_achievement = input_features['achievement']
+
+    upper_bound = (0.0, 0.03, 0.05, 0.08)[theme_count]
+    upper_bound += 0.10 if input_achievement > 0.4 else 0.06 if input_achievement > 0.2 else 0.04
+    upper_bound += 0.08 if input_features['detail'] > 0.6 else 0.06
+    upper_bound += 0.08
+    upper_bound += 0.10 if strength_count >= 2 else 0.05 if strength_count == 1 else 0.0
+    upper_bound += 0.05 if input_features['weaknesses'] != 0 else 0.0
+    return upper_bound
+
+def score_candidates(content_scores, positions, input_features):
+    """
+    候補ESに構造類似度とボーナスを適用して最終スコアを計算
+    （calculate_similarityとcalculate_individual_similarityで共通）
+
+    Args:
+        content_scores: 候補ESの内容類似度（TF-IDF + セマンティック）
+        positions: 候補ESのes_data内の行位置
+        input_features: extract_input_featuresの戻り値
+
+    Returns:
+        tuple: (構造類似度の配列, 0.0〜1.0に制限した最終スコアの配列)
+    """
+    # 構造の一致度
+    input_structure = input_features['structure']
+    structure_scores = (
+        np.minimum(es_features['structure'][positions], input_structure).sum(axis=1) /
+        max(int(input_structure.sum()), 1)
+    )
+
+    # 最終スコア = 内容類似度 * 0.8 + 構造類似度 * 0.2 + ボーナス（0.0〜1.0に制限）
+    base_scores = content_scores * 0.8 + structure_scores * 0.2
+    final_scores = np.clip(base_scores + calculate_bonus_scores(input_features, positions), 0.0, 1.0)
+
+    return structure_scores, final_scores
+
+def score_top_candidates(content_similarities, top_n, input_features, candidates=None):
+    """
+    内容類似度の高い順に候補を広げながら最終スコアを計算し、最終スコア上位top_n件を返す（閾値アルゴリズム）
+
+    構造類似度（最大1.0）とボーナス（bonus_upper_bound）には上限があるため、
+    未計算のESの最終スコアは「次の内容類似度 * 0.8 + 構造の上限 * 0.2 + ボーナスの上限」を超えない。
+    この上限が現在のtop_n件目の最終スコア以下になった時点で候補の追加をやめる。
+    候補は内容類似度の降順（同点は行位置の昇順）の先頭部分なので、
+    全件に最終スコアを計算した場合と同じtop_n件が同じ順で得られる
+
+    Args:
+        content_similarities: 全ESの内容類似度（es_dataの行位置に対応、candidatesを指定した場合はその並び）
+        top_n: 取得件数
+        input_features: extract_input_featuresの戻り値
+        candidates: 対象ESの行位置（昇順、省略時は全ES）
+
+    Returns:
+        tuple: (SimilarityResult, 最終スコアを計算した件数)
+    """
+    if candidates is None:
+        candidates = np.arange(len(content_similarities))
+
+    n = len(content_similarities)
+    pool_size = min(top_n * 2, n)
+    order = select_top_k(content_similarities, pool_size)
+    structure_scores, final_scores = score_candidates(content_similarities[order], candidates[order], input_features)
+
+    structure_upper_bound = 1.0 if input_features['structure'].sum() > 0 else 0.0
+    extra_upper_bound = structure_upper_bound * 0.2 + bonus_upper_bound(input_features)
+
+    while pool_size < n:
+        expanded = select_top_k(content_similarities, min(pool_size * 2, n))
+        if pool_size >= top_n:
+            kth_score = np.partition(final_scores, pool_size - top_n)[pool_size - top_n]
+            next_upper_bound = min(content_similarities[expanded[pool_size]] * 0.8 + extra_upper_bound + 1e-9, 1.0)
+            if next_upper_bound <= kth_score:
+                break
+
+        added = expanded[pool_size:]
+        added_structure, added_final = score_candidates(content_similarities[added], candidates[added], input_features)
+        order = expanded
+        structure_scores = np.concatenate([structure_scores, added_structure])
+        final_scores = np.concatenate([final_scores, added_final])
+        pool_size = len(expanded)
+
+    return SimilarityResult(candidates[order], final_scores, structure_scores).top(top_n), pool_size
+
+# ============================================
+# 企業・業界のルックアップインデックス
+# ============================================
+
+def build_lookup_indexes(df):
+    """企業名・業界・業界大分類・大学・選考結果ごとのes_data行位置を事前に構築
+
+    /analyzeの各処理で全件の文字列比較を繰り返さないよう、読み込み時に一度だけ作る。
+    種類の少ない選考結果と業界大分類は、検索の絞り込み用のboolマスクも作っておく
+
+    Returns:
+        dict: {
+            'company': {企業名: 行位置の配列},
+            'industry': {業界名: 行位置の配列},
+            'major_category': {大分類: 行位置の配列},
+            'university': {大学名: 行位置の配列},
+            'result_status': {選考結果: 行位置の配列},
+            'masks': {('result_status' | 'major_category', 値): boolマスク}
+        }
+    """
+    def group_positions(column):
+        return {
+            name: np.asarray(positions, dtype=np.int64)
+            for name, positions in df.groupby(column, sort=False).indices.items()
+        }
+
+    company_index = group_positions('company_name')
+    industry_index = group_positions('industry')
+    university_index = group_positions('university')
+    status_index = group_positions('result_status')
+
+    major_category_index = {}
+    for major_category in INDUSTRY_MAJOR_CATEGORIES:
+        matched = [positions for name, positions in industry_index.items() if str(name).startswith(major_category)]
+        major_category_index[major_category] = (
+            np.sort(np.concatenate(matched)) if matched else np.empty(0, dtype=np.int64)
+        )
+
+    masks = {}
+    for key, index in (('result_status', status_index), ('major_category', major_category_index)):
+        for name, positions in index.items():
+            mask = np.zeros(len(df), dtype=bool)
+            mask[positions] = True
+            masks[(key, name)] = mask
+
+    return {
+        'company': company_index,
+        'industry': industry_index,
+        'major_category': major_category_index,
+        'university': university_index,
+        'result_status': status_index,
+        'masks': masks
+    }
+
+def get_company_positions(company_name):
+    """企業名に一致するESの行位置（es_dataの並び順）"""
+    return es_lookup['company'].get(company_name, np.empty(0, dtype=np.int64))
+
+def get_industry_positions(industry):
+    """業界名を含む（部分一致、正規表現としては解釈しない）ESの行位置
+
+    判定は業界名の種類数だけで済むため、全件の文字列比較は行わない
+    """
+    industry_index = es_lookup['industry']
+    names = pd.Series(list(industry_index.keys()), dtype=object)
+    matched = [industry_index[name] for name in names[names.str.contains(industry, na=False, regex=False)]]
+    return np.sort(np.concatenate(matched)) if matched else np.empty(0, dtype=np.int64)
+
+def get_major_category_positions(major_category):
+    """業界大分類で始まる業界のESの行位置"""
+    return es_lookup['major_category'].get(major_category, np.empty(0, dtype=np.int64))
+
+def positions_mask(positions):
+    """行位置の配列をes_dataの行位置に対応するboolマスクにする"""
+    mask = np.zeros(len(es_data), dtype=bool)
+    mask[positions] = True
+    return mask
+
+def build_filter_mask(result_statuses=None, industry=None, major_category=None, company=None, university=None, base=None):
+    """
+    検索の絞り込み条件を、すべての条件を満たすESのboolマスク（es_dataの行位置に対応）にまとめる
+
+    選考結果・業界大分類は読み込み時に作ったマスク、企業・業界・大学はルックアップインデックスの
+    行位置から作る。calculate_similarityのmaskに渡すと、検索の中で絞り込んだ上で上位k件を返す
+
+    Args:
+        result_statuses: 選考結果のリスト（いずれかに一致）
+        industry: 業界名（get_industry_positionsと同じ部分一致）
+        major_category: 業界大分類
+        company: 企業名
+        university: 大学名
+        base: さらに絞り込む元のマスク
+
+    Returns:
+        np.ndarray: boolマスク（条件もbaseも指定しない場合はNone）
+    """
+    masks = [] if base is None else [base]
+    if result_statuses is not None:
+        status_masks = [es_lookup['masks'].get(('result_status', status)) for status in result_statuses]
+        masks.append(np.logical_or.reduce(
+            [m for m in status_masks if m is not None] or [np.zeros(len(es_data), dtype=bool)]
+        ))
+    if major_category is not None:
+        masks.append(es_lookup['masks'].get(('major_category', major_category), np.zeros(len(es_data), dtype=bool)))
+    if industry is not None:
+        masks.append(positions_mask(get_industry_positions(industry)))
+    if company is not None:
+        masks.append(positions_mask(get_company_positions(company)))
+    if university is not None:
+        masks.append(positions_mask(es_lookup['university'].get(university, np.empty(0, dtype=np.int64))))
+
+    if len(masks) == 0:
+        return None
+    return np.logical_and.reduce(masks)
+
+
+def build_company_table(df):
+    """企業ごとの集計テーブルを構築（読み込み時に一度だけ計算）
+
+    代表行は企業の最初のES。給与・難易度は代表行から計算し、リクエストごとの
+    正規表現による給与の解析や企業ごとの絞り込みを不要にする
+
+    Returns:
+        DataFrame: company_nameをインデックスとし、以下の列を持つ
+            representative_position: 代表行のes_data内の行位置
+            industry: 最頻出の業界（同数の場合は名前順で先のもの、なければ'不明'）
+            avg_salary / employee_count: 代表行の表示用の値
+            salary_numeric: 代表行の給与（円、不明の場合はNaN）
+            difficulty: estimate_company_difficultyによる難易度
+            es_count / accepted_count / passed_count: ES件数・内定件数・通過件数
+    """
+    first_rows = df.drop_duplicates('company_name', keep='first')
+    first_rows = first_rows[first_rows['company_name'].notna()]
+
+    table = pd.DataFrame({
+        'representative_position': df.index.get_indexer(first_rows.index),
+        'avg_salary': first_rows['avg_salary'].to_numpy(),
+        'employee_count': first_rows['employee_count'].to_numpy(),
+        'salary_numeric': [extract_salary_numeric(v) for v in first_rows['avg_salary']],
+        'difficulty': [estimate_company_difficulty(row) for _, row in first_rows.iterrows()],
+    }, index=pd.Index(first_rows['company_name'].to_numpy(), name='company_name'))
+    table['salary_numeric'] = table['salary_numeric'].astype(float)
+
+    # ES件数・内定件数・通過件数
+    status = df['result_status']
+    counts = pd.DataFrame({
+        'es_count': 1,
+        'accepted_count': (status == '内定').astype(int),
+        'passed_count': (status == '通過').astype(int),
+    }).groupby(df['company_name'].to_numpy()).sum()
+    table = table.join(counts)
+
+    # 最頻出の業界（Series.mode()[0]と同じく、同数の場合は名前順で先のもの）
+    industry_counts = (
+        df.dropna(subset=['industry'])
+        .groupby(['company_name', 'industry']).size()
+        .reset_index(name='count')
+        .sort_values(['company_name', 'count', 'industry'], ascending=[True, False, True])
+        .drop_duplicates('company_name')
+        .set_index('company_name')['industry']
+    )
+    table['industry'] = industry_counts.reindex(table.index).fillna('不明')
+
+    return table
+
+def get_company_profile(company_name):
+    """企業テーブルの行（存在しない場合はNone）"""
+    if company_name not in company_table.index:
+        return None
+    return company_table.loc[company_name]
+
+
+class CompanyCentroidIndex:
+    """
+    企業単位のベクトル検索インデックス（企業ごとのセントロイド）
+
+    各企業の内定ES（ACCEPTED_RESULT_STATUSES、1件もない企業は全ES）のエンベディングの平均を
+    L2正規化してセントロイドとする。1段目でクエリとセントロイドの内積から企業を直接順位付けし、
+    2段目で上位企業のESだけを調べて最も類似するESを取り出すため、計算量はES件数ではなく企業数に比例する。
+    ベクトル本体はembedding_matrixを参照する。セントロイドは前処理済みデータに保存し、
+    読み込み時に（int8/pcaモードではメモリマップの）エンベディング行列全体を読まずに済むようにする
+    """
+
+    BUILD_BLOCK_SIZE = 8192  # セントロイドの計算で一度に読むESの行数
+
+    def __init__(self):
+        self.names = None
+        self.centroids = None
+        self.es_offsets = None  # 企業iのESはes_positions[es_offsets[i]:es_offsets[i + 1]]
+        self.es_positions = None
+        self.vectors = None
+
+    def __len__(self):
+        return 0 if self.names is None else len(self.names)
+
+    def build(self, df, vectors, state=None):
+        """dfの企業名・選考結果とエンベディング行列（dfの行位置と対応）からセントロイドを計算する
+
+        stateにto_state()の辞書を渡した場合、企業名と件数が一致すれば保存済みのセントロイドを使う
+        """
+        codes, names = pd.factorize(df['company_name'], sort=False)
+        valid = codes >= 0
+        accepted = df['result_status'].isin(ACCEPTED_RESULT_STATUSES).to_numpy() & valid
+        has_accepted = np.bincount(codes[accepted], minlength=len(names)) > 0
+        members = accepted | (valid & ~has_accepted[np.where(valid, codes, 0)])
+
+        self.names = np.asarray(names, dtype=object)
+        if state is not None and self._matches_state(state, len(df)):
+            self.centroids = np.asarray(state['centroids'], dtype=np.float32)
+        else:
+            self.centroids = build_embedding_matrix(self._sum_members(codes, members, vectors))
+        self.vectors = vectors
+
+        positions = np.flatnonzero(valid)
+        self.es_positions = positions[np.argsort(codes[valid], kind='stable')].astype(np.int32)
+        self.es_offsets = np.concatenate([[0], np.cumsum(np.bincount(codes[valid], minlength=len(names)))]).astype(np.int64)
+        return self
+
+    def _sum_members(self, codes, members, vectors):
+        """企業×ESの0/1疎行列との積で企業ごとのエンベディングの和を求める（平均と同じ向き）
+
+        メモリマップの行列を一度に読み込まないよう、BUILD_BLOCK_SIZE行ずつ計算して足し合わせる
+        """
+        indicator = sparse.csc_matrix(
+            (np.ones(members.sum(), dtype=np.float32), (codes[members], np.flatnonzero(members))),
+            shape=(len(self.names), len(codes))
+        )
+        sums = np.zeros((len(self.names), vectors.shape[1]), dtype=np.float32)
+        for start in range(0, len(codes), self.BUILD_BLOCK_SIZE):
+            stop = min(start + self.BUILD_BLOCK_SIZE, len(codes))
+            sums += indicator[:, start:stop] @ np.asarray(vectors[start:stop], dtype=np.float32)
+        return sums
+
+    def _matches_state(self, state, n_rows):
+        """保存済みのセントロイドが同じES（件数・企業名の並び）から計算されたものか"""
+        names = np.asarray(state['names'])
+        return (
+            int(state['n_rows']) == n_rows and
+            len(names) == len(self.names) and
+            bool(np.all(names == self.names.astype(str))) and
+            state['centroids'].shape[0] == len(self.names)
+        )
+
+    def to_state(self):
+        """企業名とセントロイドを辞書にする（npzで保存できるnumpy配列のみ）"""
+        return {
+            'names': self.names.astype(str),
+            'centroids': self.centroids,
+            'n_rows': np.array(len(self.vectors)),
+        }
+
+    def search(self, query, k=20, es_per_company=1, mask=None):
+        """
+        セントロイドで上位k社を選び、各社のESから類似度の高い上位es_per_company件を取り出す
+
+        Args:
+            query: L2正規化済みのクエリベクトル
+            k: 1段目で選ぶ企業数
+            es_per_company: 2段目で各社から取り出すES数
+            mask: 2段目の対象にするES（es_dataの行位置に対応するboolマスク、省略時は全ES）
+
+        Returns:
+            tuple: (企業名の配列（セントロイドとの類似度の降順）, ESの行位置の配列)
+        """
+        query = np.asarray(query, dtype=np.float32)
+        companies = select_top_k(self.centroids @ query, min(k, len(self)))
+
+        selected = []
+        for company in companies:
+            positions = self.es_positions[self.es_offsets[company]:self.es_offsets[company + 1]]
+            if mask is not None:
+                positions = positions[mask[positions]]
+            if len(positions) == 0:
+                continue
+            scores = np.asarray(self.vectors[positions], dtype=np.float32) @ query
+            selected.append(positions[select_top_k(scores, es_per_company)])
+
+        positions = np.concatenate(selected).astype(np.int64) if selected else np.empty(0, dtype=np.int64)
+        return self.names[companies], positions
+
+def build_company_index(state=None):
+    """embedding_matrixから企業セントロイドのインデックスを構築する（読み込み時に実行）
+
+    Args:
+        state: 保存済みのCompanyCentroidIndex.to_state()（一致する場合はセントロイドを再計算しない）
+    """
+    global company_index
+
+    if embedding_matrix is None:
+        company_index = None
+        return None
+
+    start = time.time()
+    company_index = CompanyCentroidIndex().build(es_data, embedding_matrix, state=state)
+    print(f"  ✅ company_index: {len(company_index)}社（{time.time() - start:.2f}秒）")
+    return company_index
+
+
+def classify_competition(avg_applicants):
+    """想定応募者数から競争率の区分を判定"""
+    if avg_applicants > 200:
+        return '非常に高'
+    elif avg_applicants > 150:
+        return '高'
+    elif avg_applicants > 100:
+        return '中'
+    return '低'
+
+def summarize_industry(industry, table):
+    """業界名を含む業界（部分一致、正規表現としては解釈しない）の件数を集計して業界統計を作る"""
+    names = pd.Series(table.index, dtype=object)
+    matched = table[names.str.contains(industry, na=False, regex=False).to_numpy()]
+
+    es_count = int(matched['es_count'].sum())
+    major_category = extract_major_industry_category(industry)
+    major_matched = table[table['major_category'] == major_category] if major_category else table.iloc[0:0]
+
+    return {
+        'industry': industry,
+        'majorCategory': major_category,
+        'esCount': es_count,
+        'passedCount': int(matched['passed_count'].sum()),
+        'acceptedCount': int(matched['accepted_count'].sum()),
+        'avgApplicants': es_count * 3,
+        'competition': classify_competition(es_count * 3),
+        'matchedIndustries': matched.index.tolist(),
+        'majorCategoryEsCount': int(major_matched['es_count'].sum())
+    }
+
+def build_industry_stats(df):
+    """業界ごとの集計テーブルと、業界名・業界大分類ごとの業界統計を構築
+
+    業界統計は業界名を含む全業界の合計（analyze_industryやindustryEsCountと同じ判定）で、
+    /analyzeや/industries/{name}/statsはここから返すだけで全件を走査しない
+
+    Returns:
+        tuple: (業界ごとの集計テーブル, {業界名または大分類: 業界統計})
+    """
+    status = df['result_status']
+    table = pd.DataFrame({
+        'es_count': 1,
+        'passed_count': (status == '通過').astype(int),
+        'accepted_count': (status == '内定').astype(int),
+    }).groupby(df['industry'].to_numpy()).sum()
+    table.index.name = 'industry'
+    table['major_category'] = [extract_major_industry_category(name) for name in table.index]
+
+    stats = {name: summarize_industry(name, table) for name in list(table.index) + INDUSTRY_MAJOR_CATEGORIES}
+
+    return table, stats
+
+def get_industry_stats(industry):
+    """業界統計を返す（読み込み時に計算済みでない業界名はその場で集計）"""
+    if industry in industry_stats:
+        return industry_stats[industry]
+    return summarize_industry(industry, industry_table)
+
+
+# ============================================
+# 類似度計算の結果セット
+# ============================================
+
+def select_top_k(scores, k):
+    """スコア上位k件の添字を降順で返す（np.argsort(-scores, kind='stable')[:k]と同じ結果）
+
+    全件をソートせず、np.partitionでk番目の値を求めてから上位k件だけをソートする。
+    k番目の値と同点の要素は添字の小さいものを優先する。
+    """
+    scores = np.asarray(scores)
+    n = len(scores)
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if k >= n:
+        return np.argsort(-scores, kind='stable')
+
+    kth_score = -np.partition(-scores, k - 1)[k - 1]
+    above = np.flatnonzero(scores > kth_score)
+    ties = np.flatnonzero(scores == kth_score)[:k - len(above)]
+    selected = np.concatenate([above, ties])
+
+    # 上位k件だけを（スコア降順、同点は添字昇順で）ソート
+    return selected[np.lexsort((selected, -scores[selected]))]
+
+
+class SimilarityResult:
+    """
+    類似度計算の結果（es_dataの行位置とスコアの配列のみを保持する軽量な結果セット）
+
+    es_dataはコピーせず、表示するサンプルの行だけをto_frame()で取り出す
+
+    Attributes:
+        positions: es_data内の行位置
+        scores: 最終類似度スコア（行位置と同じ並び）
+        structure_scores: 構造類似度（行位置と同じ並び）
+    """
+
+    __slots__ = ('positions', 'scores', 'structure_scores')
+
+    def __init__(self, positions, scores, structure_scores=None):
+        self.positions = np.asarray(positions, dtype=np.int64)
+        self.scores = np.asarray(scores, dtype=np.float64)
+        if structure_scores is None:
+            structure_scores = np.full(len(self.positions), np.nan)
+        self.structure_scores = np.asarray(structure_scores, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def _take(self, indexer):
+        return SimilarityResult(self.positions[indexer], self.scores[indexer], self.structure_scores[indexer])
 
-    print(f"\n⚡ 前処理済みデータを読み込み中...")
-    print(f"📂 保存先: {preprocessed_dir}")
+    def head(self, n):
+        """先頭n件"""
+        return self._take(slice(0, n))
 
-    # 前処理済みデータのファイルパス
-    preprocessed_files = {
-        'es_data': os.path.join(preprocessed_dir, f'{csv_basename}_es_data.pkl'),
-        'tfidf_matrix': os.path.join(preprocessed_dir, f'{csv_basename}_tfidf_matrix.npz'),
-        'vectorizer': os.path.join(preprocessed_dir, f'{csv_basename}_vectorizer.pkl'),
-        'embeddings': os.path.join(preprocessed_dir, f'{csv_basename}_embeddings.npy')
-    }
+    def filter(self, mask):
+        """boolマスク（結果の並びに対応）で絞り込む"""
+        return self._take(np.asarray(mask, dtype=bool))
 
-    # すべてのファイルが存在するかチェック
-    all_files_exist = all(os.path.exists(f) for f in preprocessed_files.values())
+    def sorted(self):
+        """スコアの降順に並べ替える（同点は元の順序を維持）"""
+        return self._take(np.argsort(-self.scores, kind='stable'))
 
-    if not all_files_exist:
-        print("❌ 前処理済みデータが見つかりません")
-        print("💡 CSVから読み込む必要があります")
-        return False
+    def top(self, k):
+        """スコア上位k件を降順で返す（sorted().head(k)と同じ結果で、全件はソートしない）"""
+        return self._take(select_top_k(self.scores, k))
 
-    try:
-        # es_dataを読み込み
-        with open(preprocessed_files['es_data'], 'rb') as f:
-            es_data = pickle.load(f)
-        print(f"  ✅ es_data: {len(es_data)}件")
+    def concat(self, *others):
+        """他の結果を後ろに連結する（並べ替え・重複除去はしない）"""
+        return SimilarityResult(
+            np.concatenate([self.positions] + [o.positions for o in others]),
+            np.concatenate([self.scores] + [o.scores for o in others]),
+            np.concatenate([self.structure_scores] + [o.structure_scores for o in others])
+        )
 
-        # TF-IDF行列を読み込み
-        tfidf_matrix = sparse.load_npz(preprocessed_files['tfidf_matrix'])
-        print(f"  ✅ tfidf_matrix: {tfidf_matrix.shape}")
+    def drop_duplicates(self):
+        """重複した行位置は先に現れたものを残す"""
+        _, first = np.unique(self.positions, return_index=True)
+        return self._take(np.sort(first))
+
+    def merge(self, *others, limit=None):
+        """他の結果と結合してスコアの降順に並べ替え、重複した行位置は先に現れたものを残す
+
+        各結果を降順に並べた上でheapq.mergeで併合するため、全体を再ソートしない。
+        limitを指定した場合は上位limit件に達した時点で併合を打ち切る。
+        """
+        runs = [run.sorted() for run in (self,) + others]
+        merged = heapq.merge(
+            *[zip(-run.scores, range(len(run)), [run_id] * len(run)) for run_id, run in enumerate(runs)],
+            key=lambda item: item[0]
+        )
 
-        # Vectorizerを読み込み
-        with open(preprocessed_files['vectorizer'], 'rb') as f:
-            vectorizer = pickle.load(f)
-        print(f"  ✅ vectorizer")
+        seen = set()
+        taken = []
+        for _, i, run_id in merged:
+            position = runs[run_id].positions[i]
+            if position in seen:
+                continue
+            seen.add(position)
+            taken.append((run_id, i))
+            if limit is not None and len(taken) >= limit:
+                break
+
+        return SimilarityResult(
+            [runs[r].positions[i] for r, i in taken],
+            [runs[r].scores[i] for r, i in taken],
+            [runs[r].structure_scores[i] for r, i in taken]
+        )
 
-        # セマンティックエンベディングを読み込み
-        if os.path.exists(preprocessed_files['embeddings']):
-            # Sentence-BERTモデルをロード（エンベディング計算には不要だが、モデルは必要）
-            try:
-                from sentence_transformers import SentenceTransformer
-                if sentence_model is None:
-                    print("  📥 Sentence-BERTモデルをロード中...")
-                    sentence_model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
-                    print("  ✅ モデルロード完了")
-            except ImportError:
-                print("  ⚠️ sentence-transformersが利用できません。セマンティック検索は無効です。")
+    def column(self, name):
+        """es_dataの列の値を結果の並びで取り出す"""
+        return es_data[name].to_numpy()[self.positions]
 
-            # エンベディングを読み込み
-            embeddings_array = np.load(preprocessed_files['embeddings'])
-            es_data['semantic_embedding'] = list(embeddings_array)
-            print(f"  ✅ semantic_embeddings: {len(es_data['semantic_embedding'])}件")
+    def mean_score(self):
+        return float(self.scores.mean()) if len(self.scores) > 0 else float('nan')
 
-        # 選択肢を抽出
-        universities_list = sorted(es_data['university'].dropna().unique().tolist())
-        universities_list = [u for u in universities_list if u != "不明" and str(u).strip() != ""]
+    def to_frame(self):
+        """結果の行だけをes_dataから取り出し、スコア列を付けたDataFrameを返す"""
+        frame = es_data.iloc[self.positions].copy()
+        frame['similarity_score'] = self.scores
+        frame['structure_score'] = self.structure_scores
+        return frame
 
-        industries_list = sorted(es_data['industry'].dropna().unique().tolist())
-        industries_list = [i for i in industries_list if i and str(i).strip() != ""]
+class QueryVectors:
+    """
+    入力ESのTF-IDFベクトルと正規化済みエンベディング
 
-        companies_list = es_data['company_name'].dropna().unique().tolist()
-        companies_list = [c for c in companies_list if c and str(c).strip() != "" and len(str(c).strip()) > 1]
-        companies_list = sorted(companies_list, key=lambda x: str(x))
+    1リクエストにつき1回だけ計算し、全ESとの類似度計算と企業セントロイドの検索で共有する
+    （エンベディングが使えない場合はembeddingがNone）
+    """
 
-        company_counts = es_data['company_name'].value_counts().to_dict()
-        industry_counts = es_data['industry'].value_counts().to_dict()
+    __slots__ = ('tfidf', 'embedding')
 
-        common_questions = [
-            "学生時代に力を入れたこと（ガクチカ）",
-            "志望動機",
-            "自己PR",
-            "あなたの強みとエピソード",
-            "挑戦したこと・チャレンジ",
-            "困難を乗り越えた経験",
-            "チームで成果を出した経験",
-            "リーダーシップを発揮した経験",
-            "インターンで学びたいこと",
-            "将来のキャリアビジョン"
-        ]
+    def __init__(self, input_text, profile):
+        # TF-IDF（入力ESにもテーマキーワードのブーストを適用）
+        self.tfidf = transform_tfidf([input_text], [profile.keywords])
+        self.embedding = None
 
-        print(f"\n✅ 前処理済みデータの読み込みが完了しました")
-        print(f"  - 大学: {len(universities_list)}校")
-        print(f"  - 業界: {len(industries_list)}種類")
-        print(f"  - 企業: {len(companies_list)}社")
+        try:
+            from sentence_transformers import SentenceTransformer
 
-        return True
+            if sentence_model is not None and embedding_matrix is not None:
+                input_embedding = sentence_model.encode(str(input_text)[:512], convert_to_tensor=False)
+                self.embedding = normalize_query_embedding(input_embedding)
+        except Exception as e:
+            print(f"⚠️ セマンティック類似度計算をスキップ: {e}")
 
-    except Exception as e:
-        print(f"❌ 前処理済みデータの読み込みに失敗しました: {e}")
-        import traceback
-        traceback.print_exc()
-        return False
+    @classmethod
+    def batch(cls, input_texts, profiles):
+        """
+        複数の入力ESのQueryVectorsをまとめて計算（/analyze_batch用）
 
-def calculate_similarity(input_text, top_n=100):
-    """類似度計算（修正版：100%を超えないように調整）
+        TF-IDFはtransform_tfidfを1回、エンベディングはsentence_model.encodeを1回だけ呼ぶ
+        """
+        tfidf = transform_tfidf(input_texts, [profile.keywords for profile in profiles])
+        embeddings = [None] * len(input_texts)
 
-    ハイブリッド方式：TF-IDF + セマンティック + 構造分析 + テーマフィルタリング + 成果・詳細度 + エピソードタイプ
-    ボーナススコアは加算式で適用し、最終スコアは0.0〜1.0の範囲に制限
+        try:
+            from sentence_transformers import SentenceTransformer
+
+            if sentence_model is not None and embedding_matrix is not None:
+                encoded = sentence_model.encode(
+                    [str(text)[:512] for text in input_texts], convert_to_tensor=False, show_progress_bar=False
+                )
+                embeddings = [normalize_query_embedding(embedding) for embedding in encoded]
+        except Exception as e:
+            print(f"⚠️ セマンティック類似度計算をスキップ: {e}")
+
+        queries = []
+        for i, embedding in enumerate(embeddings):
+            query = cls.__new__(cls)
+            query.tfidf = tfidf[i]
+            query.embedding = embedding
+            queries.append(query)
+        return queries
+
+def calculate_content_similarities(input_text, profile, candidate_count, nprobe=None, query=None):
+    """
+    全ESとの内容類似度（TF-IDF + セマンティックのハイブリッド）を計算
 
-    ボーナス内訳：
-    - テーマ一致: 最大+0.08
-    - 定量的成果一致: 最大+0.10
-    - 詳細度一致: 最大+0.08
-    - エピソードタイプ一致: 最大+0.08
+    Args:
+        input_text: 入力テキスト
+        profile: 入力ESのDocumentProfile
+        candidate_count: 近似探索（転置インデックス・HNSW）で取得する候補数
+        nprobe: IVFで走査するセル数（省略時はIVF_NPROBE）
+        query: 入力ESのQueryVectors（省略時はinput_textから計算する）
+
+    Returns:
+        np.ndarray: es_dataの行位置に対応する内容類似度
     """
-    # 入力テキストにも同じ重み付けを適用
-    weighted_input = extract_theme_keywords_for_weighting(input_text)
+    if query is None:
+        query = QueryVectors(input_text, profile)
 
     # TF-IDF類似度
-    input_vector = vectorizer.transform([weighted_input])
-    tfidf_similarities = cosine_similarity(input_vector, tfidf_matrix)[0]
+    tfidf_similarities = compute_tfidf_similarities(query.tfidf, candidate_count=candidate_count)
 
     # セマンティック類似度（BERT）
     semantic_similarities = np.zeros(len(es_data))
     has_semantic = False
 
-    try:
-        from sentence_transformers import SentenceTransformer
-
-        if sentence_model is not None and es_data['semantic_embedding'].iloc[0] is not None:
-            # 入力テキストのエンベディング生成
-            input_embedding = sentence_model.encode(str(input_text)[:512], convert_to_tensor=False)
-
-            # 全ESとの類似度計算
-            embeddings_matrix = np.vstack(es_data['semantic_embedding'].values)
-            semantic_similarities = cosine_similarity([input_embedding], embeddings_matrix)[0]
+    if query.embedding is not None:
+        try:
+            # 全ESとの類似度計算（正規化済み行列との内積 = コサイン類似度）
+            semantic_similarities = compute_semantic_similarities(
+                query.embedding,
+                candidate_count=candidate_count,
+                nprobe=nprobe
+            )
             has_semantic = True
-    except Exception as e:
-        print(f"⚠️ セマンティック類似度計算をスキップ: {e}")
+        except Exception as e:
+            print(f"⚠️ セマンティック類似度計算をスキップ: {e}")
 
     # ハイブリッドスコア（セマンティックが使える場合は重視）
     if has_semantic:
-        combined_similarities = (
+        return (
             tfidf_similarities * 0.3 +      # キーワードマッチ
             semantic_similarities * 0.7     # 意味マッチ
         )
-    else:
-        combined_similarities = tfidf_similarities
-
-    # 構造分析による追加スコアリング
-    input_structure = analyze_es_structure(input_text)
+    return tfidf_similarities
 
-    result = es_data.copy()
-    result['similarity_score'] = combined_similarities
-
-    # 上位候補に対して構造類似度を計算
-    result = result.sort_values('similarity_score', ascending=False).head(top_n * 2)
+def mask_candidates(mask):
+    """
+    boolマスクの対象ESの行位置
 
-    # 構造類似度を追加
-    structure_scores = []
-    for idx, row in result.iterrows():
-        es_structure = analyze_es_structure(row['combined_answer'])
+    対象が連続した行（sort_by_industry_partitionで並べた業界大分類・業界のパーティション）の場合は
+    sliceを返し、TF-IDF行列・エンベディング行列から行をコピーせずにスライスで取り出せるようにする
+    """
+    positions = np.flatnonzero(mask)
+    if len(positions) > 0 and positions[-1] - positions[0] + 1 == len(positions):
+        return slice(int(positions[0]), int(positions[-1]) + 1)
+    return positions
 
-        # 構造の一致度を計算
-        structure_similarity = sum(
-            min(input_structure[key], es_structure[key])
-            for key in input_structure.keys()
-        ) / max(sum(input_structure.values()), 1)
+def gather_content_similarities(query, positions):
+    """
+    指定したESのみの内容類似度を計算
 
-        structure_scores.append(structure_similarity)
+    対象ESのTF-IDFとエンベディングは計算済みの行列（tfidf_matrix・embedding_matrix）から
+    行位置で取り出すため、計算量は対象ES数に比例し、コーパスの本文をベクトル化し直すこともない
 
-    result['structure_score'] = structure_scores
+    Args:
+        query: 入力ESのQueryVectors
+        positions: 対象ESのes_data内の行位置（連続した行の場合はslice）
 
-    # 最終スコア = 内容類似度 * 0.8 + 構造類似度 * 0.2
-    result['similarity_score'] = (
-        result['similarity_score'] * 0.8 +
-        result['structure_score'] * 0.2
+    Returns:
+        np.ndarray: positionsと同じ並びの内容類似度
+    """
+    tfidf_similarities = tfidf_scores(query.tfidf, tfidf_matrix[positions])
+    if query.embedding is None:
+        return tfidf_similarities
+
+    semantic_similarities = np.asarray(embedding_matrix[positions], dtype=np.float32) @ query.embedding
+    return (
+        tfidf_similarities * 0.3 +
+        semantic_similarities * 0.7
     )
 
-    # テーマフィルタリング強化
-    # 入力ESのテーマを抽出
-    input_themes = categorize_es_themes(input_text)
-    input_theme_names = set([t['theme'] for t in input_themes[:3]])  # 上位3テーマ
+def calculate_content_similarities_batch(queries, candidate_count, nprobes=None):
+    """
+    複数の入力ESと全ESの内容類似度をまとめて計算（/analyze_batch用）
 
-    # 入力ESの特徴を事前計算
-    input_achievement = extract_quantitative_achievement_score(input_text)
-    input_detail = calculate_detail_score(input_text)
-    input_episode_info = classify_episode_type(input_text)
-    input_episode_type = input_episode_info['type']
-    input_episode_category = EPISODE_TYPES.get(input_episode_type, {}).get('category', 'その他')
+    全件スキャンの場合は、TF-IDF（疎行列 × 入力ESの疎行列）とセマンティック（エンベディング行列 × 入力ESの行列）を
+    それぞれ1回の行列積で計算する。近似探索（転置インデックス・HNSWなど）を使う場合は入力ESごとに
+    calculate_content_similaritiesと同じ計算を行う
 
-    # 強み・弱みを事前計算
-    input_sw = extract_strengths_and_weaknesses(input_text)
-    input_strengths = set(input_sw['strengths'])
-    input_weaknesses = set(input_sw['weaknesses'])
+    Args:
+        queries: 入力ESのQueryVectorsのリスト
+        candidate_count: 近似探索で取得する候補数
+        nprobes: 入力ESごとのIVFで走査するセル数（省略時はIVF_NPROBE）
 
-    print("  🎯 ボーナススコアを計算中...")
+    Returns:
+        np.ndarray: (ES件数, 入力ES数) の内容類似度
+    """
+    if nprobes is None:
+        nprobes = [None] * len(queries)
 
-    # ============================================
-    # ボーナススコアの計算（加算式に変更）
-    # ============================================
+    # TF-IDF類似度
+    if tfidf_index is None:
+        # 入力ESの行列は疎行列のまま掛け、(ES件数, 入力ES数) の結果だけを密行列にする
+        query_matrix = sparse.vstack([query.tfidf for query in queries]).astype(np.float32)
+        tfidf_similarities = np.asarray((tfidf_matrix @ query_matrix.T).toarray(), dtype=np.float64)
+    else:
+        tfidf_similarities = np.column_stack([
+            compute_tfidf_similarities(query.tfidf, candidate_count=candidate_count) for query in queries
+        ])
 
-    for idx, row in result.iterrows():
-        base_score = row['similarity_score']
-        total_bonus = 0.0  # ボーナスの合計
-
-        # --------------------------------------------
-        # 1. テーマ一致ボーナス（最大+0.08）
-        # --------------------------------------------
-        es_themes = row['themes']
-        es_theme_names = set([t['theme'] for t in es_themes[:3]])
-        theme_overlap = len(input_theme_names & es_theme_names)
-
-        if theme_overlap >= 3:
-            total_bonus += 0.08  # 3つ一致
-        elif theme_overlap == 2:
-            total_bonus += 0.05  # 2つ一致
-        elif theme_overlap == 1:
-            total_bonus += 0.03  # 1つ一致
-
-        # --------------------------------------------
-        # 2. 定量的成果の一致度ボーナス（最大+0.10）
-        # --------------------------------------------
-        es_achievement = extract_quantitative_achievement_score(row['combined_answer'])
-
-        if input_achievement > 0.4 and es_achievement > 0.4:
-            total_bonus += 0.10  # 両方とも成果が強い
-        elif input_achievement > 0.2 and es_achievement > 0.2:
-            total_bonus += 0.06  # 両方とも成果がある
-        elif abs(input_achievement - es_achievement) < 0.15:
-            total_bonus += 0.04  # 成果レベルが近い
-        elif (input_achievement > 0.3 and es_achievement < 0.1) or \
-             (input_achievement < 0.1 and es_achievement > 0.3):
-            total_bonus -= 0.08  # 成果レベルが大きく異なる（ペナルティ）
-
-        # --------------------------------------------
-        # 3. 詳細度の一致度ボーナス（最大+0.08）
-        # --------------------------------------------
-        es_detail = calculate_detail_score(row['combined_answer'])
-        detail_diff = abs(input_detail - es_detail)
-
-        if detail_diff < 0.1:
-            total_bonus += 0.06  # 詳細度が非常に近い
-        elif detail_diff < 0.2:
-            total_bonus += 0.04  # 詳細度が近い
-        elif detail_diff < 0.3:
-            total_bonus += 0.02  # 詳細度がやや近い
-        elif detail_diff > 0.5:
-            total_bonus -= 0.04  # 詳細度が大きく異なる（ペナルティ）
-
-        # 両方とも詳細度が高い場合は追加ボーナス
-        if input_detail > 0.6 and es_detail > 0.6:
-            total_bonus += 0.02
-
-        # --------------------------------------------
-        # 4. エピソードタイプ一致ボーナス（最大+0.08）
-        # --------------------------------------------
-        es_episode_info = row.get('episode_type', {})
-        if isinstance(es_episode_info, dict):
-            es_episode_type = es_episode_info.get('type', 'その他の経験')
-            es_episode_category = EPISODE_TYPES.get(es_episode_type, {}).get('category', 'その他')
-
-            if input_episode_type == es_episode_type:
-                total_bonus += 0.08  # 完全一致
-            elif input_episode_category == es_episode_category and input_episode_category != 'その他':
-                total_bonus += 0.05  # 同じカテゴリ（ビジネス経験、課外活動など）
-            elif input_episode_type != 'その他の経験' and es_episode_type == 'その他の経験':
-                total_bonus -= 0.03  # 入力が具体的なのにESが曖昧（小さなペナルティ）
-
-        # --------------------------------------------
-        # 5. 強み・弱みの一致度ボーナス（最大+0.15）
-        # --------------------------------------------
-        es_sw = row.get('strengths_weaknesses', {})
-        if isinstance(es_sw, dict):
-            es_strengths = set(es_sw.get('strengths', []))
-            es_weaknesses = set(es_sw.get('weaknesses', []))
-
-            # 強みの一致度
-            strength_overlap = len(input_strengths & es_strengths)
-            if strength_overlap >= 2:
-                total_bonus += 0.10  # 2つ以上の強みが一致
-            elif strength_overlap == 1:
-                total_bonus += 0.05  # 1つの強みが一致
-
-            # 弱みの一致度
-            weakness_overlap = len(input_weaknesses & es_weaknesses)
-            if weakness_overlap >= 1:
-                total_bonus += 0.05  # 弱みが1つ以上一致
-
-            # 強みが完全に異なる場合は小さなペナルティ
-            if len(input_strengths) > 0 and len(es_strengths) > 0 and strength_overlap == 0:
-                total_bonus -= 0.03  # 強みが全く異なる場合は軽いペナルティ（-0.06 → -0.03に変更）
-
-        # --------------------------------------------
-        # 最終スコア計算（加算式）
-        # --------------------------------------------
-        final_score = base_score + total_bonus
-
-        # ✅ スコアを0.0〜1.0の範囲に制限（重要！）
-        final_score = max(0.0, min(1.0, final_score))
-
-        result.at[idx, 'similarity_score'] = final_score
-
-    # 最終的にtop_nに絞る
-    result = result.sort_values('similarity_score', ascending=False).head(top_n)
+    if any(query.embedding is None for query in queries):
+        return tfidf_similarities
 
-    return result
+    # セマンティック類似度（BERT）
+    try:
+        if SEMANTIC_SEARCH_MODE == 'exact':
+            semantic_similarities = embedding_matrix @ np.stack([query.embedding for query in queries]).T
+        else:
+            semantic_similarities = np.column_stack([
+                compute_semantic_similarities(query.embedding, candidate_count=candidate_count, nprobe=nprobe)
+                for query, nprobe in zip(queries, nprobes)
+            ])
+    except Exception as e:
+        print(f"⚠️ セマンティック類似度計算をスキップ: {e}")
+        return tfidf_similarities
 
-def calculate_individual_similarity(input_text, target_es_data):
-    """特定のESに対してのみ類似度を計算（志望企業のES用）
+    # ハイブリッドスコア（セマンティックが使える場合は重視）
+    return (
+        tfidf_similarities * 0.3 +      # キーワードマッチ
+        semantic_similarities * 0.7     # 意味マッチ
+    )
 
-    Args:
-        input_text: 入力テキスト
-        target_es_data: 計算対象のESデータ（DataFrame）
+def calculate_similarity(input_text, top_n=100, profile=None, nprobe=None, query=None, mask=None):
+    """類似度計算（修正版：100%を超えないように調整）
 
-    Returns:
-        類似度計算済みのDataFrame
+    ハイブリッド方式：TF-IDF + セマンティック + 構造分析 + テーマフィルタリング + 成果・詳細度 + エピソードタイプ
+    ボーナススコアは加算式で適用し、最終スコアは0.0〜1.0の範囲に制限
+
+    ボーナス内訳：
+    - テーマ一致: 最大+0.08
+    - 定量的成果一致: 最大+0.10
+    - 詳細度一致: 最大+0.08
+    - エピソードタイプ一致: 最大+0.08
+    - 強み・弱み一致: 最大+0.15
+
+    ボーナスは取り込み時に計算済みの特徴配列（es_features）を使ってcalculate_bonus_scoresで計算する。
+    ボーナスの上限を使って候補数を決めるため（score_top_candidates）、全ESに最終スコアを計算した場合と同じ結果になる
+    profileには入力ESのDocumentProfileを渡せる（省略時はinput_textを分析する）
+    nprobeはSEMANTIC_SEARCH_MODE=ivfのときに走査するセル数（省略時はIVF_NPROBE）
+    queryには入力ESのQueryVectorsを渡せる（省略時はinput_textから計算する）
+    maskには絞り込み条件のboolマスク（build_filter_mask）を渡せる。指定した場合は絞り込んだ中での上位top_n件が返る。
+    対象が連続した行か全ESのFILTER_GATHER_MAX_FRACTION以下の場合は対象ESの行だけを計算済みの行列から取り出して計算し、
+    それ以外は通常の内容類似度（SEMANTIC_SEARCH_MODE・TFIDF_SEARCH_MODEに従う）を計算してから上位の選択を対象ESに限る
     """
-    if len(target_es_data) == 0:
-        return target_es_data
+    if profile is None:
+        profile = DocumentProfile(input_text)
 
-    # 入力テキストにも同じ重み付けを適用
-    weighted_input = extract_theme_keywords_for_weighting(input_text)
+    # 入力ESの特徴を事前計算
+    input_features = extract_input_features(profile)
+
+    if mask is not None:
+        if query is None:
+            query = QueryVectors(input_text, profile)
+        rows = mask_candidates(mask)
+        if isinstance(rows, slice):
+            combined_similarities = gather_content_similarities(query, rows)
+            candidates = np.arange(rows.start, rows.stop)
+        elif len(rows) <= len(mask) * FILTER_GATHER_MAX_FRACTION:
+            combined_similarities = gather_content_similarities(query, rows)
+            candidates = rows
+        else:
+            # 近似探索では対象外のESも候補に含まれるため、対象の割合に応じて候補数を増やす
+            candidate_count = min(len(mask), int(np.ceil(top_n * 4 * len(mask) / max(len(rows), 1))))
+            combined_similarities = calculate_content_similarities(
+                input_text, profile, candidate_count=candidate_count, nprobe=nprobe, query=query
+            )[rows]
+            candidates = rows
+    else:
+        candidates = None
+        combined_similarities = calculate_content_similarities(
+            input_text, profile, candidate_count=top_n * 4, nprobe=nprobe, query=query
+        )
 
-    # TF-IDF類似度（テキストから直接計算）
-    input_vector = vectorizer.transform([weighted_input])
+    # 内容類似度の高い順に候補を広げ、ボーナスの上限で上位top_n件が確定した時点で打ち切る
+    result, scored_count = score_top_candidates(combined_similarities, top_n, input_features, candidates=candidates)
+    print(f"  🎯 ボーナススコアを計算: {scored_count}件")
 
-    # 対象ESのテキストをベクトル化
-    target_texts = []
-    for _, row in target_es_data.iterrows():
-        weighted_text = extract_theme_keywords_for_weighting(row['combined_answer'])
-        target_texts.append(weighted_text)
+    return result
 
-    target_tfidf_matrix = vectorizer.transform(target_texts)
-    tfidf_similarities = cosine_similarity(input_vector, target_tfidf_matrix)[0]
+def calculate_similarity_batch(input_texts, profiles, queries, top_n=100, nprobes=None):
+    """
+    複数の入力ESの類似度計算をまとめて行う（/analyze_batch用）
 
-    # セマンティック類似度（BERT）
-    semantic_similarities = np.zeros(len(target_es_data))
-    has_semantic = False
+    内容類似度はcalculate_content_similarities_batchで全入力ES分を一度に計算し、
+    最終スコアは入力ESごとにscore_top_candidatesで計算する（calculate_similarityと同じ結果）
 
-    try:
-        from sentence_transformers import SentenceTransformer
+    Args:
+        input_texts: 入力テキストのリスト
+        profiles: 入力ESのDocumentProfileのリスト
+        queries: 入力ESのQueryVectorsのリスト（QueryVectors.batch）
+        top_n: 入力ESごとの取得件数
+        nprobes: 入力ESごとのIVFで走査するセル数
 
-        if sentence_model is not None and target_es_data['semantic_embedding'].iloc[0] is not None:
-            # 入力テキストのエンベディング生成
-            input_embedding = sentence_model.encode(str(input_text)[:512], convert_to_tensor=False)
+    Returns:
+        list: 入力ESごとのSimilarityResult
+    """
+    if len(input_texts) == 0:
+        return []
 
-            # 対象ESとの類似度計算
-            embeddings_matrix = np.vstack(target_es_data['semantic_embedding'].values)
-            semantic_similarities = cosine_similarity([input_embedding], embeddings_matrix)[0]
-            has_semantic = True
-    except Exception as e:
-        print(f"⚠️ セマンティック類似度計算をスキップ: {e}")
+    combined_similarities = calculate_content_similarities_batch(queries, candidate_count=top_n * 4, nprobes=nprobes)
 
-    # ハイブリッドスコア
-    if has_semantic:
-        combined_similarities = (
-            tfidf_similarities * 0.3 +
-            semantic_similarities * 0.7
+    results = []
+    scored_total = 0
+    for i, profile in enumerate(profiles):
+        result, scored_count = score_top_candidates(
+            np.ascontiguousarray(combined_similarities[:, i]), top_n, extract_input_features(profile)
         )
-    else:
-        combined_similarities = tfidf_similarities
-
-    # 構造分析
-    input_structure = analyze_es_structure(input_text)
-
-    result = target_es_data.copy()
-    result['similarity_score'] = combined_similarities
-
-    # 構造類似度を計算
-    structure_scores = []
-    for idx, row in result.iterrows():
-        es_structure = analyze_es_structure(row['combined_answer'])
-        structure_similarity = sum(
-            min(input_structure[key], es_structure[key])
-            for key in input_structure.keys()
-        ) / max(sum(input_structure.values()), 1)
-        structure_scores.append(structure_similarity)
-
-    result['structure_score'] = structure_scores
-
-    # 最終スコア = 内容類似度 * 0.8 + 構造類似度 * 0.2
-    result['similarity_score'] = (
-        result['similarity_score'] * 0.8 +
-        result['structure_score'] * 0.2
-    )
+        results.append(result)
+        scored_total += scored_count
+    print(f"  🎯 ボーナススコアを計算: {scored_total}件（{len(profiles)}件の入力ES）")
 
-    # テーマフィルタリング強化
-    input_themes = categorize_es_themes(input_text)
-    input_theme_names = set([t['theme'] for t in input_themes[:3]])
+    return results
 
-    # 入力ESの特徴を事前計算
-    input_achievement = extract_quantitative_achievement_score(input_text)
-    input_detail = calculate_detail_score(input_text)
-    input_episode_info = classify_episode_type(input_text)
-    input_episode_type = input_episode_info['type']
-    input_episode_category = EPISODE_TYPES.get(input_episode_type, {}).get('category', 'その他')
-
-    # 強み・弱みを事前計算
-    input_sw = extract_strengths_and_weaknesses(input_text)
-    input_strengths = set(input_sw['strengths'])
-    input_weaknesses = set(input_sw['weaknesses'])
-
-    # ボーナススコアの計算
-    for idx, row in result.iterrows():
-        base_score = row['similarity_score']
-        total_bonus = 0.0
-
-        # テーマ一致ボーナス
-        es_themes = row['themes']
-        es_theme_names = set([t['theme'] for t in es_themes[:3]])
-        theme_overlap = len(input_theme_names & es_theme_names)
-
-        if theme_overlap >= 3:
-            total_bonus += 0.08
-        elif theme_overlap == 2:
-            total_bonus += 0.05
-        elif theme_overlap == 1:
-            total_bonus += 0.03
-
-        # 定量的成果の一致度ボーナス
-        es_achievement = extract_quantitative_achievement_score(row['combined_answer'])
-
-        if input_achievement > 0.4 and es_achievement > 0.4:
-            total_bonus += 0.10
-        elif input_achievement > 0.2 and es_achievement > 0.2:
-            total_bonus += 0.06
-        elif abs(input_achievement - es_achievement) < 0.15:
-            total_bonus += 0.04
-        elif (input_achievement > 0.3 and es_achievement < 0.1) or \
-             (input_achievement < 0.1 and es_achievement > 0.3):
-            total_bonus -= 0.08
-
-        # 詳細度の一致度ボーナス
-        es_detail = calculate_detail_score(row['combined_answer'])
-        detail_diff = abs(input_detail - es_detail)
-
-        if detail_diff < 0.1:
-            total_bonus += 0.06
-        elif detail_diff < 0.2:
-            total_bonus += 0.04
-        elif detail_diff < 0.3:
-            total_bonus += 0.02
-        elif detail_diff > 0.5:
-            total_bonus -= 0.04
-
-        if input_detail > 0.6 and es_detail > 0.6:
-            total_bonus += 0.02
-
-        # エピソードタイプ一致ボーナス
-        es_episode_info = row.get('episode_type', {})
-        if isinstance(es_episode_info, dict):
-            es_episode_type = es_episode_info.get('type', 'その他の経験')
-            es_episode_category = EPISODE_TYPES.get(es_episode_type, {}).get('category', 'その他')
-
-            if input_episode_type == es_episode_type:
-                total_bonus += 0.08
-            elif input_episode_category == es_episode_category and input_episode_category != 'その他':
-                total_bonus += 0.05
-            elif input_episode_type != 'その他の経験' and es_episode_type == 'その他の経験':
-                total_bonus -= 0.03
-
-        # 強み・弱みの一致度ボーナス
-        es_sw = row.get('strengths_weaknesses', {})
-        if isinstance(es_sw, dict):
-            es_strengths = set(es_sw.get('strengths', []))
-            es_weaknesses = set(es_sw.get('weaknesses', []))
-
-            strength_overlap = len(input_strengths & es_strengths)
-            if strength_overlap >= 2:
-                total_bonus += 0.10
-            elif strength_overlap == 1:
-                total_bonus += 0.05
-
-            weakness_overlap = len(input_weaknesses & es_weaknesses)
-            if weakness_overlap >= 1:
-                total_bonus += 0.05
-
-            if len(input_strengths) > 0 and len(es_strengths) > 0 and strength_overlap == 0:
-                total_bonus -= 0.03
-
-        # 最終スコア計算
-        final_score = base_score + total_bonus
-        final_score = max(0.0, min(1.0, final_score))
-
-        result.at[idx, 'similarity_score'] = final_score
+def calculate_individual_similarity(input_text, target_positions, profile=None, query=None):
+    """特定のESに対してのみ類似度を計算（志望企業のES用）
 
-    return result
+    対象ESの内容類似度はgather_content_similaritiesで計算済みの行列から行位置で取り出して計算する
+
+    Args:
+        input_text: 入力テキスト
+        target_positions: 計算対象ESのes_data内の行位置
+        profile: 入力ESのDocumentProfile（省略時はinput_textを分析する）
+        query: 入力ESのQueryVectors（省略時はinput_textから計算する）
+
+    Returns:
+        SimilarityResult: 類似度計算済みの結果（target_positionsと同じ並び）
+    """
+    target_positions = np.asarray(target_positions, dtype=np.int64)
+    if len(target_positions) == 0:
+        return SimilarityResult(target_positions, [])
+
+    if profile is None:
+        profile = DocumentProfile(input_text)
+    if query is None:
+        query = QueryVectors(input_text, profile)
+
+    combined_similarities = gather_content_similarities(query, target_positions)
+
+    # 構造類似度・ボーナススコアを適用
+    structure_scores, final_scores = score_candidates(
+        combined_similarities,
+        target_positions,
+        extract_input_features(profile)
+    )
+
+    return SimilarityResult(target_positions, final_scores, structure_scores)
 
 def extract_salary_numeric(salary_str):
     """給与から数値を抽出"""
@@ -1934,34 +4137,67 @@ def calculate_match_score(similarity_score, company_difficulty, industry_match,
     )
     return min(int(score * 100), 100)
 
+def search_company_candidates(similar_es, input_text, profile, query, company_count=20, mask=None):
+    """企業セントロイドによる2段階の企業検索
+
+    1段目でcompany_indexからクエリに近い上位company_count社を選び、2段目で各社のESから
+    エンベディングの類似度が高いESを取り出して最終スコアを計算する（similar_esに含まれるESは再計算しない）
+
+    Args:
+        similar_es: 類似度計算の結果（SimilarityResult）
+        input_text: 入力テキスト
+        profile: 入力ESのDocumentProfile
+        query: 入力ESのQueryVectors
+        company_count: 1段目で選ぶ企業数
+        mask: 2段目の対象にするESの絞り込み条件（build_filter_mask、省略時は全ES）
+
+    Returns:
+        SimilarityResult: 選んだ企業のES（similar_esの同じ企業のESを含む）をスコアの降順に並べたもの
+    """
+    names, positions = company_index.search(query.embedding, k=company_count, es_per_company=3, mask=mask)
+    positions = positions[~np.isin(positions, similar_es.positions)]
+    candidates = similar_es.merge(calculate_individual_similarity(input_text, positions, profile=profile, query=query))
+    return candidates.filter(np.isin(candidates.column('company_name'), names))
+
 def get_top_companies(similar_es, user_industry, user_university="", top_n=5):
-    """TOP企業を選出"""
+    """TOP企業を選出
+
+    Args:
+        similar_es: 類似度計算の結果（SimilarityResult）。企業セントロイドで選んだ候補
+            （search_company_candidates）を渡すと、その企業の中から選ぶ
+    """
     companies = []
     seen_companies = set()
 
     # まず十分な数の企業を処理（top_nの3倍または最低20社）
     process_count = max(top_n * 3, 20)
 
-    for _, row in similar_es.iterrows():
-        company_name = row['company_name']
-
+    for company_name, industry, university, similarity_score in zip(
+        similar_es.column('company_name'), similar_es.column('industry'),
+        similar_es.column('university'), similar_es.scores
+    ):
         if company_name in seen_companies:
             continue
         seen_companies.add(company_name)
 
-        difficulty = estimate_company_difficulty(row)
-        industry_match = 1.0 if user_industry in row['industry'] else 0.5
-        university_match = 1.0 if user_university and user_university == row.get('university') else 0.5
+        # 給与・難易度は企業テーブルの計算済みの値を使う（企業名が欠損したESは除外）
+        profile = get_company_profile(company_name)
+        if profile is None:
+            continue
+
+        difficulty = profile['difficulty']
+        industry_match = 1.0 if user_industry in industry else 0.5
+        university_match = 1.0 if user_university and user_university == university else 0.5
 
         match_score = calculate_match_score(
-            row['similarity_score'],
+            similarity_score,
             difficulty,
             industry_match,
             university_match
         )
 
         reasons = []
-        if row['similarity_score'] > 0.3:
+        if similarity_score > 0.3:
             reasons.append('ESの内容が類似')
         if industry_match == 1.0:
             reasons.append('志望業界と一致')
@@ -1972,22 +4208,22 @@ def get_top_companies(similar_es, user_industry, user_university="", top_n=5):
 
         reason = '、'.join(reasons) if reasons else 'データマッチング'
 
-        salary = extract_salary_numeric(row['avg_salary'])
-        if salary and salary >= 7000000:
+        salary = profile['salary_numeric']
+        if salary >= 7000000:
             avg_gpa = "3.2-3.8"
-        elif salary and salary >= 6000000:
+        elif salary >= 6000000:
             avg_gpa = "3.0-3.6"
         else:
             avg_gpa = "2.8-3.4"
 
         companies.append({
             'name': company_name,
-            'industry': row['industry'],
+            'industry': industry,
             'matchScore': match_score,
             'reason': reason,
             'avgGpa': avg_gpa,
-            'avgSalary': row.get('avg_salary', '不明'),
-            'employeeCount': row.get('employee_count', '不明'),
+            'avgSalary': profile['avg_salary'],
+            'employeeCount': profile['employee_count'],
         })
 
         # 十分な数の企業を処理したら終了
@@ -2000,13 +4236,13 @@ def get_top_companies(similar_es, user_industry, user_university="", top_n=5):
 
 def calculate_target_company_match(company_name, similar_es, user_industry, user_university="", rank=1):
     """特定の志望企業とのマッチ率を計算（志望順位に応じて調整）"""
-    # 企業データを検索
-    company_data = es_data[es_data['company_name'] == company_name]
+    # 企業テーブルを検索
+    profile = get_company_profile(company_name)
 
-    if len(company_data) == 0:
+    if profile is None:
         # データがない場合は、類似ESの平均スコアを使用
         if len(similar_es) > 0:
-            avg_score = similar_es['similarity_score'].mean()
+            avg_score = similar_es.mean_score()
             base_score = min(int(avg_score * 70), 100)  # 控えめなスコア
 
             # 志望順位による調整
@@ -2023,17 +4259,18 @@ def calculate_target_company_match(company_name, similar_es, user_industry, user
         return None
 
     # 企業の代表的なデータを取得
-    representative = company_data.iloc[0]
+    representative = es_data.iloc[profile['representative_position']]
+    es_count = profile['es_count']
 
     # 類似度を計算（その企業のESとの平均類似度）
-    company_similarities = similar_es[similar_es['company_name'] == company_name]
+    company_similarities = similar_es.filter(similar_es.column('company_name') == company_name)
 
     if len(company_similarities) > 0:
-        avg_similarity = company_similarities['similarity_score'].mean()
+        avg_similarity = company_similarities.mean_score()
     else:
-        avg_similarity = similar_es['similarity_score'].mean() * 0.7  # 控えめに推定
+        avg_similarity = similar_es.mean_score() * 0.7  # 控えめに推定
 
-    difficulty = estimate_company_difficulty(representative)
+    difficulty = profile['difficulty']
     industry_match = 1.0 if user_industry in str(representative['industry']) else 0.5
     university_match = 1.0 if user_university and user_university == representative.get('university') else 0.5
 
@@ -2055,10 +4292,10 @@ def calculate_target_company_match(company_name, similar_es, user_industry, user
         reasons.append('志望業界と一致')
     if university_match == 1.0:
         reasons.append('同じ大学からの採用実績')
-    if len(company_data) >= 10:
-        reasons.append(f'{len(company_data)}件の合格ES実績あり')
-    elif len(company_data) >= 5:
-        reasons.append(f'{len(company_data)}件のES実績あり')
+    if es_count >= 10:
+        reasons.append(f'{es_count}件の合格ES実績あり')
+    elif es_count >= 5:
+        reasons.append(f'{es_count}件のES実績あり')
 
     reason = '、'.join(reasons) if reasons else 'データマッチング'
 
@@ -2067,14 +4304,14 @@ def calculate_target_company_match(company_name, similar_es, user_industry, user
         'industry': str(representative['industry']) if not pd.isna(representative['industry']) else '不明',
         'matchScore': match_score,
         'reason': reason,
-        'dataCount': len(company_data)
+        'dataCount': int(es_count)
     }
 
 def analyze_industry(industry):
-    """業界分析"""
-    industry_data = es_data[es_data['industry'].str.contains(industry, na=False)]
+    """業界分析（読み込み時に計算済みの業界統計を使用）"""
+    stats = get_industry_stats(industry)
 
-    if len(industry_data) == 0:
+    if stats['esCount'] == 0:
         return {
             'passRate': 70,
             'avgApplicants': 150,
@@ -2083,16 +4320,8 @@ def analyze_industry(industry):
         }
 
     pass_rate = 75
-    avg_applicants = len(industry_data) * 3
-
-    if avg_applicants > 200:
-        competition = '非常に高'
-    elif avg_applicants > 150:
-        competition = '高'
-    elif avg_applicants > 100:
-        competition = '中'
-    else:
-        competition = '低'
+    avg_applicants = stats['avgApplicants']
+    competition = stats['competition']
 
     recommendations_map = {
         'IT': ['技術スキルの証明', 'ポートフォリオの作成', '最新技術のキャッチアップ'],
@@ -2117,20 +4346,24 @@ def analyze_gakuchika(gakuchika_text):
     """ガクチカ分析"""
     strengths = []
     improvements = []
+    found = find_keywords(gakuchika_text)
+
+    def has_any(check):
+        return any(word in found for word in GAKUCHIKA_CHECK_KEYWORDS[check])
 
-    if any(word in gakuchika_text for word in ['数値', '結果', '成果', '%', '人']):
+    if has_any('quantitative'):
         strengths.append('具体的な数値・成果の記載')
 
-    if any(word in gakuchika_text for word in ['課題', '問題', '解決', '改善']):
+    if has_any('problem_solving'):
         strengths.append('課題解決のプロセスが明確')
 
     if len(gakuchika_text) >= 300:
         strengths.append('十分な分量で説明されている')
 
-    if not any(word in gakuchika_text for word in ['チーム', '協力', '連携', 'メンバー']):
+    if not has_any('teamwork'):
         improvements.append('チームワークの要素を追加')
 
-    if not any(word in gakuchika_text for word in ['学んだ', '得た', '成長']):
+    if not has_any('learning'):
         improvements.append('学びや成長の要素を強調')
 
     if len(gakuchika_text) < 200:
@@ -2147,19 +4380,23 @@ def analyze_es_answers(answers):
 
     strengths = []
     improvements = []
+    found = find_keywords(all_text)
 
-    if any(word in all_text for word in ['数値', '結果', '成果', '%', '人', '件', '倍']):
+    def has_any(check):
+        return any(word in found for word in ES_ANSWER_CHECK_KEYWORDS[check])
+
+    if has_any('quantitative'):
         strengths.append('具体的な数値・成果の記載')
-    if any(word in all_text for word in ['課題', '問題', '解決', '改善', '克服']):
+    if has_any('problem_solving'):
         strengths.append('課題解決のプロセスが明確')
-    if any(word in all_text for word in ['チーム', '協力', '連携', 'メンバー', '組織']):
+    if has_any('teamwork'):
         strengths.append('チームワークの要素がある')
     if len(all_text) >= 500:
         strengths.append('十分な分量で説明されている')
 
-    if not any(word in all_text for word in ['学んだ', '得た', '成長', '経験']):
+    if not has_any('learning'):
         improvements.append('学びや成長の要素を強調')
-    if not any(word in all_text for word in ['具体的', '例えば', '実際に']):
+    if not has_any('concreteness'):
         improvements.append('より具体的なエピソードを追加')
     if len(all_text) < 300:
         improvements.append('もう少し詳しく記述する')
@@ -2169,13 +4406,30 @@ def analyze_es_answers(answers):
         'improvements': improvements if improvements else ['現状で良い内容です']
     }
 
-def get_industry_similar_es_samples(similar_es, target_industry, top_n=3):
+def get_industry_similar_es_samples(similar_es, target_industry, top_n=3,
+                                    input_text=None, profile=None, query=None, mask=None):
     """志望業界内の類似度の高いESのサンプルを取得
 
-    まず小分類（完全一致）で検索し、見つからない場合は大分類で検索する
+    まず小分類（完全一致）で検索し、見つからない場合は大分類で検索する。
+    queryを渡した場合は業界の絞り込み条件を検索の中で適用し（calculate_similarityのmask）、
+    similar_esに含まれない業界内のESからも上位top_n件を取得する
+
+    Args:
+        similar_es: 類似度計算の結果（SimilarityResult、queryを渡さない場合に絞り込む対象）
+        input_text / profile / query: 入力テキスト・DocumentProfile・QueryVectors
+        mask: 業界の条件に加える絞り込み条件（build_filter_mask）
     """
+    def search_industry(industry=None, major_category=None):
+        if query is None:
+            positions = get_industry_positions(industry) if industry is not None else get_major_category_positions(major_category)
+            return similar_es.filter(np.isin(similar_es.positions, positions))
+        industry_mask = build_filter_mask(industry=industry, major_category=major_category, base=mask)
+        if not industry_mask.any():
+            return SimilarityResult([], [])
+        return calculate_similarity(input_text, top_n=top_n, profile=profile, query=query, mask=industry_mask)
+
     # 1. まず小分類（完全一致）で検索
-    industry_es = similar_es[similar_es['industry'].str.contains(target_industry, na=False)]
+    industry_es = search_industry(industry=target_industry)
     exact_match = True
     matched_category = target_industry
 
@@ -2184,7 +4438,7 @@ def get_industry_similar_es_samples(similar_es, target_industry, top_n=3):
         major_category = extract_major_industry_category(target_industry)
         if major_category:
             # 大分類で始まる業界をすべて検索
-            industry_es = similar_es[similar_es['industry'].str.startswith(major_category, na=False)]
+            industry_es = search_industry(major_category=major_category)
             exact_match = False
             matched_category = major_category
 
@@ -2194,7 +4448,7 @@ def get_industry_similar_es_samples(similar_es, target_industry, top_n=3):
 
     samples = []
 
-    for idx, row in industry_es.head(top_n).iterrows():
+    for idx, row in industry_es.head(top_n).to_frame().iterrows():
         user_info = str(row.get('user_info', ''))
 
         # 卒業年度を抽出
@@ -2248,7 +4502,7 @@ def get_similar_es_samples(similar_es, top_n=3):
     """類似ESのサンプルを取得"""
     samples = []
 
-    for idx, row in similar_es.head(top_n).iterrows():
+    for idx, row in similar_es.head(top_n).to_frame().iterrows():
         user_info = str(row.get('user_info', ''))
 
         # 卒業年度を抽出
@@ -2301,7 +4555,7 @@ def get_es_samples_by_company(similar_es, company_name, top_n=3):
     指定した企業の類似ESサンプルを取得
 
     Args:
-        similar_es: 類似度計算済みのES DataFrame
+        similar_es: 類似度計算の結果（SimilarityResult）
         company_name: 企業名
         top_n: 返すサンプル数
 
@@ -2309,31 +4563,24 @@ def get_es_samples_by_company(similar_es, company_name, top_n=3):
         list: ESサンプルのリスト
     """
     # まず、類似度計算済みのESから取得を試みる
-    company_es = similar_es[similar_es['company_name'] == company_name]
+    company_es = similar_es.filter(similar_es.column('company_name') == company_name)
 
     # 類似度計算済みにない場合は、es_data全体から取得
     if len(company_es) == 0:
         print(f"  ℹ️ {company_name} のESをes_dataから取得します")
-        company_es = es_data[es_data['company_name'] == company_name].copy()
-
-        # similarity_scoreがない場合は、Noneを設定（類似度未計算を明示）
-        if 'similarity_score' not in company_es.columns:
-            company_es['similarity_score'] = None  # 類似度未計算
-
-        # 最新のものから取得（result_statusで内定を優先）
-        # similarity_scoreがNoneの場合は0として扱う
-        company_es['_sort_similarity'] = company_es['similarity_score'].fillna(0)
-        company_es = company_es.sort_values(
-            by=['result_status', '_sort_similarity'],
-            ascending=[False, False]
-        )
+        positions = get_company_positions(company_name)
+
+        # result_statusの降順で並べる（類似度は未計算のためNaN）
+        statuses = es_data['result_status'].iloc[positions].reset_index(drop=True)
+        positions = positions[statuses.sort_values(ascending=False, kind='stable').index.to_numpy()]
+        company_es = SimilarityResult(positions, np.full(len(positions), np.nan))
 
     if len(company_es) == 0:
         return []
 
     samples = []
 
-    for idx, row in company_es.head(top_n).iterrows():
+    for idx, row in company_es.head(top_n).to_frame().iterrows():
         user_info = str(row.get('user_info', ''))
 
         # 卒業年度を抽出
@@ -2387,7 +4634,7 @@ def get_similar_es_samples_from_top_companies(similar_es, top_companies):
     ※この関数は後方互換性のために残していますが、非推奨です
 
     Args:
-        similar_es: 類似度計算済みのES DataFrame
+        similar_es: 類似度計算の結果（SimilarityResult）
         top_companies: get_top_companies()から返された企業リスト
 
     Returns:
@@ -2407,14 +4654,15 @@ def get_similar_es_samples_from_top_companies(similar_es, top_companies):
     return samples
 
 
-def get_episode_type_similar_es_samples(similar_es, input_text, top_n=3):
+def get_episode_type_similar_es_samples(similar_es, input_text, top_n=3, profile=None):
     """
     同じエピソードタイプの類似ESのサンプルを取得
 
     Args:
-        similar_es: 類似度計算済みのES DataFrame
+        similar_es: 類似度計算の結果（SimilarityResult）
         input_text: ユーザー入力のES本文
         top_n: 返すサンプル数
+        profile: 入力ESのDocumentProfile（省略時はinput_textのエピソードタイプを判定する）
 
     Returns:
         dict: {
@@ -2426,30 +4674,25 @@ def get_episode_type_similar_es_samples(similar_es, input_text, top_n=3):
         }
     """
     # 入力ESのエピソードタイプを判定
-    input_episode_info = classify_episode_type(input_text)
+    input_episode_info = profile.episode_info if profile is not None else classify_episode_type(input_text)
     input_episode_type = input_episode_info['type']
     input_confidence = input_episode_info['confidence']
 
     print(f"  🎯 入力ESのエピソードタイプ: {input_episode_type} (信頼度: {input_confidence})")
 
     # 同じエピソードタイプのESをフィルタリング
-    same_episode_es = similar_es[
-        similar_es['episode_type'].apply(lambda x: x['type'] == input_episode_type)
-    ]
+    input_episode_code = EPISODE_TYPE_NAMES.index(input_episode_type)
+    same_episode_es = similar_es.filter(similar_es.column('episode_type_code') == input_episode_code)
 
     # 件数が少ない場合は、マルチラベルでも検索
     if len(same_episode_es) < top_n:
         print(f"  ⚠️ 同一エピソードタイプのESが{len(same_episode_es)}件のみ。マルチラベルで追加検索...")
 
         # マルチラベルで同じエピソードタイプを含むESを追加
-        multi_episode_es = similar_es[
-            similar_es['episode_types_multi'].apply(
-                lambda types: any(t['type'] == input_episode_type for t in types)
-            )
-        ]
+        multi_episode_es = similar_es.filter((similar_es.column('episode_types_mask') & (1 << input_episode_code)) != 0)
 
-        # 重複を除外して結合
-        same_episode_es = pd.concat([same_episode_es, multi_episode_es]).drop_duplicates()
+        # 重複を除外して結合（単一ラベルで一致したESを先に並べる）
+        same_episode_es = same_episode_es.concat(multi_episode_es).drop_duplicates()
 
     total_count = len(same_episode_es)
 
@@ -2466,7 +4709,7 @@ def get_episode_type_similar_es_samples(similar_es, input_text, top_n=3):
     # 上位top_nのサンプルを取得
     samples = []
 
-    for idx, row in same_episode_es.head(top_n).iterrows():
+    for idx, row in same_episode_es.head(top_n).to_frame().iterrows():
         user_info = str(row.get('user_info', ''))
 
         # 卒業年度を抽出
@@ -2491,16 +4734,13 @@ def get_episode_type_similar_es_samples(similar_es, input_text, top_n=3):
                 })
 
         if len(es_content) > 0:
-            # エピソード情報を取得
-            episode_info = row['episode_type']
-
             sample = {
                 'company': str(row['company_name']),
                 'industry': str(row['industry']) if not pd.isna(row['industry']) else '不明',
                 'result': str(row['result_status']),
                 'similarity': round(float(row['similarity_score']) * 100, 1),
-                'episodeType': episode_info['type'],
-                'episodeConfidence': episode_info['confidence'],
+                'episodeType': EPISODE_TYPE_NAMES[int(row['episode_type_code'])],
+                'episodeConfidence': int(row['episode_confidence']),
                 # 🆕 データソースを追加
                 'dataSource': str(row.get('data_source', '不明')),
                 'profile': {
@@ -2539,11 +4779,10 @@ async def home():
     # 企業と業界のマッピングを作成
     company_industries = {}
     for company in companies_list[:300]:
-        company_data = es_data[es_data['company_name'] == company]
-        if len(company_data) > 0:
-            # 最も多い業界を取得
-            industry = company_data['industry'].mode()[0] if len(company_data['industry'].mode()) > 0 else '不明'
-            company_industries[company] = industry
+        profile = get_company_profile(company)
+        if profile is not None:
+            # 最も多い業界（企業テーブルで計算済み）
+            company_industries[company] = profile['industry']
 
     # 選択肢データを準備
     embedded_data = {
@@ -2578,153 +4817,252 @@ async def home():
 
     return HTMLResponse(content=html_content)
 
-@app.post("/analyze")
-async def analyze_es(data: AnalyzeRequest):
-    """ES診断API - 複数ES質問対応"""
-    try:
-        # 複数のES回答に対応
-        if not data.esAnswers or len(data.esAnswers) == 0:
-            raise HTTPException(status_code=400, detail='ES回答を入力してください')
+def validate_analyze_request(data):
+    """/analyzeのリクエストを検証（不正な場合はHTTPException）"""
+    # 複数のES回答に対応
+    if not data.esAnswers or len(data.esAnswers) == 0:
+        raise HTTPException(status_code=400, detail='ES回答を入力してください')
 
-        has_long_answer = any(len(ans) >= 100 for ans in data.esAnswers)
-        if not has_long_answer:
-            raise HTTPException(status_code=400, detail='少なくとも1つの回答は100文字以上入力してください')
+    has_long_answer = any(len(ans) >= 100 for ans in data.esAnswers)
+    if not has_long_answer:
+        raise HTTPException(status_code=400, detail='少なくとも1つの回答は100文字以上入力してください')
 
-        if not data.targetIndustry:
-            raise HTTPException(status_code=400, detail='志望業界を選択してください')
+    if not data.targetIndustry:
+        raise HTTPException(status_code=400, detail='志望業界を選択してください')
 
-        # 全ての回答を結合して類似度計算
-        combined_answers = ' '.join(data.esAnswers)
-        similar_es = calculate_similarity(combined_answers, top_n=100)
-
-        # 志望企業が指定されている場合、100位以内に含まれていない志望企業のESも追加で計算
-        if data.targetCompanies and len(data.targetCompanies) > 0:
-            additional_es_list = []
-            for target_company in data.targetCompanies:
-                if target_company and target_company.strip():
-                    # 志望企業の全ESを取得
-                    company_es_all = es_data[es_data['company_name'] == target_company]
-
-                    if len(company_es_all) > 0:
-                        # similar_esに含まれていないESを抽出
-                        company_es_not_in_top = company_es_all[~company_es_all.index.isin(similar_es.index)]
-
-                        if len(company_es_not_in_top) > 0:
-                            print(f"  📌 志望企業「{target_company}」のESを追加計算: {len(company_es_not_in_top)}件")
-                            # 追加で類似度を計算
-                            additional_similar = calculate_individual_similarity(combined_answers, company_es_not_in_top)
-                            additional_es_list.append(additional_similar)
-
-            # 追加ESをマージ
-            if len(additional_es_list) > 0:
-                similar_es = pd.concat([similar_es] + additional_es_list)
-                # 類似度でソート
-                similar_es = similar_es.sort_values('similarity_score', ascending=False)
-                # 重複を除去（念のため）
-                similar_es = similar_es[~similar_es.index.duplicated(keep='first')]
-                print(f"  ✅ 志望企業ESを追加後の総数: {len(similar_es)}件")
-
-        # 内定のみに絞るフィルター
-        if data.onlyAccepted:
-            similar_es = similar_es[similar_es['result'].isin(['内定', '内々定', '最終面接通過'])]
-
-        top_companies = get_top_companies(
-            similar_es,
-            data.targetIndustry,
-            data.university,
-            top_n=5
-        )
+def analyze_filter_mask(data):
+    """リクエストの絞り込み条件（内定のみ）のマスク（絞り込まない場合はNone）"""
+    return build_filter_mask(result_statuses=ACCEPTED_RESULT_STATUSES) if data.onlyAccepted else None
 
-        # 各TOP企業にESサンプルを追加（アコーディオン用）
-        for company in top_companies:
-            company['esSamples'] = get_es_samples_by_company(
-                similar_es,
-                company['name'],
-                top_n=3  # 各企業から3件のESを取得
-            )
+def build_analysis_response(data, combined_answers, input_profile, input_query, filter_mask, similar_es):
+    """
+    類似ES（calculate_similarityの結果）から/analyzeのレスポンスを組み立てる（/analyze_batchと共通）
 
-        industry_analysis = analyze_industry(data.targetIndustry)
-        es_analysis = analyze_es_answers(data.esAnswers)
-        industry_similar_es_samples = get_industry_similar_es_samples(similar_es, data.targetIndustry, top_n=3)
+    Args:
+        data: AnalyzeRequest
+        combined_answers: 全ての回答を結合した入力テキスト
+        input_profile / input_query: 入力ESのDocumentProfile・QueryVectors
+        filter_mask: analyze_filter_maskの結果
+        similar_es: 類似度上位100件（SimilarityResult）
+    """
+    # 志望企業が指定されている場合、100位以内に含まれていない志望企業のESも追加で計算
+    if data.targetCompanies and len(data.targetCompanies) > 0:
+        additional_es_list = []
+        for target_company in data.targetCompanies:
+            if target_company and target_company.strip():
+                # 志望企業の全ESの行位置を取得
+                company_positions = get_company_positions(target_company)
+                if filter_mask is not None:
+                    company_positions = company_positions[filter_mask[company_positions]]
+
+                if len(company_positions) > 0:
+                    # similar_esに含まれていないESを抽出
+                    positions_not_in_top = company_positions[~np.isin(company_positions, similar_es.positions)]
+
+                    if len(positions_not_in_top) > 0:
+                        print(f"  📌 志望企業「{target_company}」のESを追加計算: {len(positions_not_in_top)}件")
+                        # 追加で類似度を計算
+                        additional_similar = calculate_individual_similarity(
+                            combined_answers, positions_not_in_top, profile=input_profile, query=input_query
+                        )
+                        additional_es_list.append(additional_similar)
+
+        # 追加ESをマージ（類似度でソートし、重複を除去）
+        if len(additional_es_list) > 0:
+            similar_es = similar_es.merge(*additional_es_list)
+            print(f"  ✅ 志望企業ESを追加後の総数: {len(similar_es)}件")
+
+    # 企業セントロイドで企業を直接順位付けし、各社の類似ESを候補にする
+    # （エンベディングがない場合は類似ES上位100件に含まれる企業から選ぶ）
+    company_es = similar_es
+    if company_index is not None and input_query.embedding is not None:
+        company_es = search_company_candidates(
+            similar_es, combined_answers, input_profile, input_query, mask=filter_mask
+        )
 
-        # 入力ESのエピソードタイプを判定
-        input_episode_info = classify_episode_type(combined_answers)
-        input_episode_types_multi = classify_multiple_episode_types(combined_answers, top_n=2)
+    top_companies = get_top_companies(
+        company_es,
+        data.targetIndustry,
+        data.university,
+        top_n=5
+    )
 
-        # エピソードタイプ別の類似ES
-        episode_type_similar_es_samples = get_episode_type_similar_es_samples(
-            similar_es,
-            combined_answers,
-            top_n=3
+    # 各TOP企業にESサンプルを追加（アコーディオン用）
+    for company in top_companies:
+        company['esSamples'] = get_es_samples_by_company(
+            company_es,
+            company['name'],
+            top_n=3  # 各企業から3件のESを取得
         )
 
-        # 志望企業のマッチ率を計算（第三志望まで）
-        target_companies_match = []
-        if data.targetCompanies and len(data.targetCompanies) > 0:
-            for i, target_company in enumerate(data.targetCompanies, 1):
-                if target_company and target_company.strip():
-                    match_result = calculate_target_company_match(
-                        target_company,
+    industry_analysis = analyze_industry(data.targetIndustry)
+    es_analysis = analyze_es_answers(data.esAnswers)
+    industry_similar_es_samples = get_industry_similar_es_samples(
+        similar_es, data.targetIndustry, top_n=3,
+        input_text=combined_answers, profile=input_profile, query=input_query, mask=filter_mask
+    )
+
+    # 入力ESのエピソードタイプ（分析済み）
+    input_episode_info = input_profile.episode_info
+    input_episode_types_multi = input_profile.episode_types_multi
+
+    # エピソードタイプ別の類似ES
+    episode_type_similar_es_samples = get_episode_type_similar_es_samples(
+        similar_es,
+        combined_answers,
+        top_n=3,
+        profile=input_profile
+    )
+
+    # 志望企業のマッチ率を計算（第三志望まで）
+    target_companies_match = []
+    if data.targetCompanies and len(data.targetCompanies) > 0:
+        for i, target_company in enumerate(data.targetCompanies, 1):
+            if target_company and target_company.strip():
+                match_result = calculate_target_company_match(
+                    target_company,
+                    similar_es,
+                    data.targetIndustry,
+                    data.university,
+                    rank=i  # 志望順位を渡す
+                )
+                if match_result:
+                    # 志望順位を追加
+                    match_result['rank'] = i
+                    # ESサンプルを追加（アコーディオン用）
+                    match_result['esSamples'] = get_es_samples_by_company(
                         similar_es,
-                        data.targetIndustry,
-                        data.university,
-                        rank=i  # 志望順位を渡す
+                        target_company,
+                        top_n=3  # 各企業から3件のESを取得
                     )
-                    if match_result:
-                        # 志望順位を追加
-                        match_result['rank'] = i
-                        # ESサンプルを追加（アコーディオン用）
-                        match_result['esSamples'] = get_es_samples_by_company(
-                            similar_es,
-                            target_company,
-                            top_n=3  # 各企業から3件のESを取得
-                        )
-                        target_companies_match.append(match_result)
-
-        # 統計情報を計算
-        total_es_count = len(es_data)
-        matched_es_count = len(similar_es)
-        industry_es_count = len(es_data[es_data['industry'].str.contains(data.targetIndustry, na=False)])
-
-        # 志望企業のデータ数をカウント
-        target_companies_data_count = {}
-        if data.targetCompanies and len(data.targetCompanies) > 0:
-            for target_company in data.targetCompanies:
-                if target_company and target_company.strip():
-                    count = len(es_data[es_data['company_name'] == target_company])
-                    target_companies_data_count[target_company] = count
-
-        # 第三志望までのマッチ率の平均を計算
-        avg_match_rate = 0
-        if len(target_companies_match) > 0:
-            avg_match_rate = sum(item['matchScore'] for item in target_companies_match) / len(target_companies_match)
-
-        response = {
-            'matchCompanies': top_companies,  # 各企業にesSamplesフィールド追加済み（アコーディオン用）
-            'industryAnalysis': industry_analysis,
-            'esAnalysis': es_analysis,
-            'industrySimilarESSamples': industry_similar_es_samples,  # 業界内の類似ES
-            'episodeTypeSimilarESSamples': episode_type_similar_es_samples,  # エピソードタイプ別の類似ES
-            'targetCompaniesMatch': target_companies_match,  # 各企業にesSamplesフィールド追加済み（アコーディオン用）
-            'dataStatistics': {
-                'totalEsCount': total_es_count,
-                'matchedEsCount': matched_es_count,
-                'industryEsCount': industry_es_count,
-                'targetCompaniesDataCount': target_companies_data_count,
-                'avgMatchRate': round(avg_match_rate, 1)
-            },
-            'userInfo': {
-                'university': data.university,
-                'major': data.major,
-                'graduationYear': data.graduationYear
-            },
-            'episodeTypeInfo': {  # エピソードタイプ情報
-                'primary': input_episode_info,
-                'all': input_episode_types_multi
-            }
+                    target_companies_match.append(match_result)
+
+    # 統計情報を計算
+    total_es_count = len(es_data)
+    matched_es_count = len(similar_es)
+    industry_es_count = get_industry_stats(data.targetIndustry)['esCount']
+
+    # 志望企業のデータ数をカウント
+    target_companies_data_count = {}
+    if data.targetCompanies and len(data.targetCompanies) > 0:
+        for target_company in data.targetCompanies:
+            if target_company and target_company.strip():
+                count = len(get_company_positions(target_company))
+                target_companies_data_count[target_company] = count
+
+    # 第三志望までのマッチ率の平均を計算
+    avg_match_rate = 0
+    if len(target_companies_match) > 0:
+        avg_match_rate = sum(item['matchScore'] for item in target_companies_match) / len(target_companies_match)
+
+    response = {
+        'matchCompanies': top_companies,  # 各企業にesSamplesフィールド追加済み（アコーディオン用）
+        'industryAnalysis': industry_analysis,
+        'esAnalysis': es_analysis,
+        'industrySimilarESSamples': industry_similar_es_samples,  # 業界内の類似ES
+        'episodeTypeSimilarESSamples': episode_type_similar_es_samples,  # エピソードタイプ別の類似ES
+        'targetCompaniesMatch': target_companies_match,  # 各企業にesSamplesフィールド追加済み（アコーディオン用）
+        'dataStatistics': {
+            'totalEsCount': total_es_count,
+            'matchedEsCount': matched_es_count,
+            'industryEsCount': industry_es_count,
+            'targetCompaniesDataCount': target_companies_data_count,
+            'avgMatchRate': round(avg_match_rate, 1)
+        },
+        'userInfo': {
+            'university': data.university,
+            'major': data.major,
+            'graduationYear': data.graduationYear
+        },
+        'episodeTypeInfo': {  # エピソードタイプ情報
+            'primary': input_episode_info,
+            'all': input_episode_types_multi
         }
+    }
+
+    return response
+
+@app.post("/analyze")
+async def analyze_es(data: AnalyzeRequest):
+    """ES診断API - 複数ES質問対応"""
+    try:
+        validate_analyze_request(data)
+
+        # 全ての回答を結合して類似度計算（入力ESの分析は1回だけ行い、以降の計算で共有）
+        combined_answers = ' '.join(data.esAnswers)
+        input_profile = DocumentProfile(combined_answers)
+        input_query = QueryVectors(combined_answers, input_profile)
+
+        # 内定のみに絞る場合は、絞り込み条件を検索の中で適用する（絞り込んだ中での上位100件）
+        filter_mask = analyze_filter_mask(data)
+        similar_es = calculate_similarity(
+            combined_answers, top_n=100, profile=input_profile, nprobe=data.nprobe, query=input_query, mask=filter_mask
+        )
+
+        return build_analysis_response(data, combined_answers, input_profile, input_query, filter_mask, similar_es)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ エラー発生: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/analyze_batch")
+async def analyze_es_batch(data: List[AnalyzeRequest]):
+    """ES診断API（一括） - 複数の/analyzeのリクエストをまとめて処理し、同じ並びでレスポンスを返す
+
+    入力ESのエンコードは1回、全ESとの類似度は入力ES全体で1回の行列積で計算する。
+    内定のみに絞るリクエストは絞り込み条件を検索の中で適用するため、入力ESごとに計算する
+    """
+    try:
+        if len(data) == 0:
+            raise HTTPException(status_code=400, detail='リクエストを1件以上指定してください')
+        if len(data) > ANALYZE_BATCH_MAX_SIZE:
+            raise HTTPException(
+                status_code=413,
+                detail=f'一度に診断できるのは{ANALYZE_BATCH_MAX_SIZE}件までです（{len(data)}件指定されました）'
+            )
 
-        return response
+        for i, request in enumerate(data, 1):
+            try:
+                validate_analyze_request(request)
+            except HTTPException as e:
+                raise HTTPException(status_code=e.status_code, detail=f'{i}件目: {e.detail}')
+
+        # 入力ESの分析・エンコードをまとめて行う
+        combined_answers = [' '.join(request.esAnswers) for request in data]
+        input_profiles = [DocumentProfile(text) for text in combined_answers]
+        input_queries = QueryVectors.batch(combined_answers, input_profiles)
+        filter_masks = [analyze_filter_mask(request) for request in data]
+
+        # 絞り込みのないリクエストは全ESとの類似度をまとめて計算
+        unfiltered = [i for i, mask in enumerate(filter_masks) if mask is None]
+        similar_es_list = [None] * len(data)
+        batch_results = calculate_similarity_batch(
+            [combined_answers[i] for i in unfiltered],
+            [input_profiles[i] for i in unfiltered],
+            [input_queries[i] for i in unfiltered],
+            top_n=100,
+            nprobes=[data[i].nprobe for i in unfiltered]
+        )
+        for i, result in zip(unfiltered, batch_results):
+            similar_es_list[i] = result
+
+        for i, mask in enumerate(filter_masks):
+            if mask is not None:
+                similar_es_list[i] = calculate_similarity(
+                    combined_answers[i], top_n=100, profile=input_profiles[i], nprobe=data[i].nprobe,
+                    query=input_queries[i], mask=mask
+                )
+
+        return [
+            build_analysis_response(request, text, profile, query, mask, similar_es)
+            for request, text, profile, query, mask, similar_es in zip(
+                data, combined_answers, input_profiles, input_queries, filter_masks, similar_es_list
+            )
+        ]
 
     except HTTPException:
         raise
@@ -2734,6 +5072,18 @@ async def analyze_es(data: AnalyzeRequest):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/industries/{name}/stats")
+async def get_industry_stats_api(name: str):
+    """業界統計API - 読み込み時に計算済みの業界統計を返す"""
+    if es_data is None:
+        raise HTTPException(status_code=503, detail='ESデータが読み込まれていません')
+
+    stats = get_industry_stats(name)
+    if stats['esCount'] == 0:
+        raise HTTPException(status_code=404, detail=f'業界「{name}」のESデータが見つかりません')
+
+    return stats
+
 @app.post("/analyze_similarity")
 async def analyze_similarity(data: SimilarityAnalysisRequest):
     """OpenAI APIを使って類似点と改善点を分析"""
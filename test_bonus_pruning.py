@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+ボーナスの上限による候補の打ち切り（score_top_candidates）が
+全ESに最終スコアを計算した場合と同じ上位top_n件を返すことを確認するスクリプト
+
+使い方:
+    python test_bonus_pruning.py
+    python test_bonus_pruning.py data/unified_es_data_20251109.csv
+"""
+import sys
+import os
+sys.path.insert(0, 'src')
+
+os.environ.setdefault('OPENAI_API_KEY', 'dummy-key-for-testing')
+
+import numpy as np
+
+import app
+from app import (
+    load_csv_data,
+    DocumentProfile,
+    SimilarityResult,
+    calculate_content_similarities,
+    extract_input_features,
+    score_candidates,
+    score_top_candidates,
+    select_top_k,
+)
+
+csv_path = sys.argv[1] if len(sys.argv) > 1 else 'data/unified_es_data_20251109.csv'
+
+TEST_INPUTS = [
+    "私の強みは、有言実行する行動力です。大学時代にアメリカに留学し、現地のカフェでアルバイトをしました。"
+    "売上を30%向上させ、チームで協力して目標を達成しました。",
+    "塾講師として50人の生徒を指導し、成績を20ポイント向上させました。課題を分析し、授業の工夫を提案しました。",
+    "サークルの代表として100名のメンバーをまとめ、イベントを企画しました。意見の対立を調整し、全員が納得する形を作りました。",
+    "研究室では実験データの分析に取り組みました。",
+    "私の弱みは心配性なところです。",
+]
+
+
+def exhaustive_top(content_similarities, top_n, input_features):
+    """全ESに最終スコアを計算し、上位top_n件を返す（基準）"""
+    positions = select_top_k(content_similarities, len(content_similarities))
+    structure_scores, final_scores = score_candidates(content_similarities[positions], positions, input_features)
+    return SimilarityResult(positions, final_scores, structure_scores).top(top_n)
+
+
+def same_result(a, b):
+    return (
+        np.array_equal(a.positions, b.positions) and
+        np.array_equal(a.scores, b.scores) and
+        np.array_equal(a.structure_scores, b.structure_scores)
+    )
+
+
+print("=" * 80)
+print("ボーナスの上限による候補の打ち切りテスト")
+print("=" * 80)
+
+load_csv_data(csv_path)
+n = len(app.es_data)
+failures = 0
+
+# 1. 実際の内容類似度（入力ESごと）
+print("\n【入力ESごとの比較】")
+texts = TEST_INPUTS + app.es_data['combined_answer'].head(5).tolist()
+for i, text in enumerate(texts, 1):
+    profile = DocumentProfile(text)
+    input_features = extract_input_features(profile)
+    content = calculate_content_similarities(text, profile, candidate_count=400)
+    for top_n in (10, 100):
+        pruned, scored_count = score_top_candidates(content, top_n, input_features)
+        ok = same_result(pruned, exhaustive_top(content, top_n, input_features))
+        failures += not ok
+        print(f"  入力{i:2d} top_n={top_n:3d}: {'✅' if ok else '❌'} 最終スコアを計算した件数 {scored_count}/{n}")
+
+# 2. 同点・上限付近を含む内容類似度（丸めた乱数）
+print("\n【同点を含む内容類似度での比較】")
+rng = np.random.default_rng(0)
+input_features = extract_input_features(DocumentProfile(TEST_INPUTS[0]))
+matches = 0
+for trial in range(20):
+    content = np.round(rng.random(n) ** rng.uniform(0.5, 4), 2)
+    pruned, _ = score_top_candidates(content, 50, input_features)
+    matches += same_result(pruned, exhaustive_top(content, 50, input_features))
+failures += 20 - matches
+print(f"  {'✅' if matches == 20 else '❌'} 20パターン中{matches}件一致")
+
+print("\n" + "=" * 80)
+print("✅ すべて一致しました" if failures == 0 else f"❌ {failures}件の不一致があります")
+print("=" * 80)
+sys.exit(1 if failures else 0)
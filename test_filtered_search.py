@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+絞り込み条件付きの検索（calculate_similarityのmask）が、条件を満たすESだけに
+最終スコアを計算した場合と同じ上位top_n件を返すことを確認するスクリプト
+（SEMANTIC_SEARCH_MODE=exact で実行する。近似探索のモードでは対象の多い条件は近似探索の結果を絞り込むため、再現率の分だけ一致しないことがある）
+
+使い方:
+    python test_filtered_search.py
+    python test_filtered_search.py data/unified_es_data_20251109.csv
+"""
+import sys
+import os
+sys.path.insert(0, 'src')
+
+os.environ.setdefault('OPENAI_API_KEY', 'dummy-key-for-testing')
+
+import numpy as np
+
+import app
+from app import (
+    load_csv_data,
+    ACCEPTED_RESULT_STATUSES,
+    DocumentProfile,
+    QueryVectors,
+    SimilarityResult,
+    build_filter_mask,
+    calculate_similarity,
+    extract_input_features,
+    extract_major_industry_category,
+    score_candidates,
+)
+
+csv_path = sys.argv[1] if len(sys.argv) > 1 else 'data/unified_es_data_20251109.csv'
+
+TEST_INPUTS = [
+    "私の強みは、有言実行する行動力です。大学時代にアメリカに留学し、現地のカフェでアルバイトをしました。"
+    "売上を30%向上させ、チームで協力して目標を達成しました。",
+    "塾講師として50人の生徒を指導し、成績を20ポイント向上させました。課題を分析し、授業の工夫を提案しました。",
+    "研究室では実験データの分析に取り組みました。",
+]
+
+
+def exhaustive_top(text, profile, mask, top_n):
+    """条件を満たす全ESに（calculate_content_similaritiesの全件スキャンで）最終スコアを計算し、上位top_n件を返す（基準）"""
+    positions = np.flatnonzero(mask)
+    content = app.calculate_content_similarities(text, profile, candidate_count=len(app.es_data))[positions]
+    structure_scores, final_scores = score_candidates(content, positions, extract_input_features(profile))
+    return SimilarityResult(positions, final_scores, structure_scores).top(top_n)
+
+
+def same_result(a, b):
+    return (
+        np.array_equal(a.positions, b.positions) and
+        np.allclose(a.scores, b.scores, atol=1e-6) and
+        np.allclose(a.structure_scores, b.structure_scores)
+    )
+
+
+print("=" * 80)
+print("絞り込み条件付きの検索テスト")
+print("=" * 80)
+
+load_csv_data(csv_path)
+es_data = app.es_data
+failures = 0
+
+# 絞り込み条件（件数の多い企業・業界・大学、業界大分類、選考結果）
+industry = es_data['industry'].value_counts().index[0]
+conditions = {
+    '内定のみ': dict(result_statuses=ACCEPTED_RESULT_STATUSES),
+    f'業界: {industry}': dict(industry=industry),
+    f'大分類: {extract_major_industry_category(industry)}': dict(major_category=extract_major_industry_category(industry)),
+    f"企業: {es_data['company_name'].value_counts().index[0]}": dict(company=es_data['company_name'].value_counts().index[0]),
+    f"大学: {es_data['university'].value_counts().index[0]}": dict(university=es_data['university'].value_counts().index[0]),
+    '業界 + 内定のみ': dict(industry=industry, result_statuses=ACCEPTED_RESULT_STATUSES),
+}
+
+for name, condition in conditions.items():
+    mask = build_filter_mask(**condition)
+    print(f"\n【{name}】 {mask.sum()}/{len(es_data)}件")
+    for i, text in enumerate(TEST_INPUTS, 1):
+        profile = DocumentProfile(text)
+        result = calculate_similarity(text, top_n=20, profile=profile, query=QueryVectors(text, profile), mask=mask)
+        expected = exhaustive_top(text, profile, mask, 20)
+        ok = same_result(result, expected) and bool(mask[result.positions].all())
+        failures += not ok
+        print(f"  入力{i}: {'✅' if ok else '❌'} {len(result)}件")
+
+print("\n" + "=" * 80)
+print("✅ すべて一致しました" if failures == 0 else f"❌ {failures}件の不一致があります")
+print("=" * 80)
+sys.exit(1 if failures else 0)
@@ -13,7 +13,10 @@ import pandas as pd
 from app import (
     load_csv_data,
     calculate_similarity,
-    extract_strengths_and_weaknesses
+    extract_strengths_and_weaknesses,
+    decode_mask,
+    STRENGTH_NAMES,
+    WEAKNESS_NAMES
 )
 
 print("=" * 80)
@@ -35,20 +38,19 @@ try:
     print(f"  - 総ES数: {len(es_data)}")
     print(f"  - カラム: {list(es_data.columns)}")
 
-    # 強み・弱み列が存在するか確認
-    if 'strengths_weaknesses' in es_data.columns:
-        print("\n✅ 'strengths_weaknesses' カラムが存在します")
+    # 強み・弱み列（ビットマスク）が存在するか確認
+    if 'strength_mask' in es_data.columns and 'weakness_mask' in es_data.columns:
+        print("\n✅ 'strength_mask' / 'weakness_mask' カラムが存在します")
 
         # サンプルを表示
         sample = es_data.iloc[0]
-        sw = sample['strengths_weaknesses']
         print(f"\n【サンプルES（1件目）】")
         print(f"  企業: {sample.get('company', 'N/A')}")
         print(f"  質問: {sample.get('question', 'N/A')[:50]}...")
-        print(f"  強み: {sw.get('strengths', [])}")
-        print(f"  弱み: {sw.get('weaknesses', [])}")
+        print(f"  強み: {decode_mask(sample['strength_mask'], STRENGTH_NAMES)}")
+        print(f"  弱み: {decode_mask(sample['weakness_mask'], WEAKNESS_NAMES)}")
     else:
-        print("\n❌ 'strengths_weaknesses' カラムが見つかりません")
+        print("\n❌ 'strength_mask' / 'weakness_mask' カラムが見つかりません")
 
 except Exception as e:
     print(f"\n❌ エラーが発生しました: {e}")
@@ -78,16 +80,14 @@ try:
     print("\n【結果】")
     print("-" * 80)
 
-    for idx, (_, row) in enumerate(similar_es.iterrows(), 1):
+    for idx, (_, row) in enumerate(similar_es.to_frame().iterrows(), 1):
         print(f"\n{idx}. 企業: {row.get('company', 'N/A')}")
         print(f"   類似度スコア: {row['similarity_score']:.4f}")
         print(f"   質問: {row.get('question', 'N/A')[:60]}...")
 
         # 強み・弱みを表示
-        sw = row.get('strengths_weaknesses', {})
-        if isinstance(sw, dict):
-            print(f"   強み: {sw.get('strengths', [])}")
-            print(f"   弱み: {sw.get('weaknesses', [])}")
+        print(f"   強み: {decode_mask(row['strength_mask'], STRENGTH_NAMES)}")
+        print(f"   弱み: {decode_mask(row['weakness_mask'], WEAKNESS_NAMES)}")
 
         # 回答の一部を表示
         answer = row.get('combined_answer', '')